@@ -0,0 +1,35 @@
+"""
+Compare the traversals of a random tree with the generators of
+traversal.tree and with the index arrays of its ArrayTree.
+"""
+from time import time
+import numpy as np
+from openalea.container import Tree
+from openalea.container.traversal.tree import pre_order, post_order, level_order
+
+nb = 1000000
+rnd = np.random.RandomState(0)
+tree = Tree()
+for vid,parent in enumerate((rnd.random_sample(nb - 1) * np.arange(1,nb) ).astype(int).tolist() ) :
+    tree.add_child(parent,vid + 1)
+
+t = time()
+atree = tree.freeze()
+print "freeze %d vertices: %.2fs" % (nb,time() - t)
+
+for name,traversal in ( ("pre order",pre_order),("post order",post_order),("level order",level_order) ) :
+    t = time()
+    nb_gen = len(list(traversal(tree,tree.root) ) )
+    t_gen = time() - t
+    t = time()
+    nb_arr = len(getattr(atree,name.replace(" ","_") )() )
+    t_arr = time() - t
+    print "%s: generator %.2fs, ArrayTree %.3fs" % (name,t_gen,t_arr)
+
+vid = tree.children(tree.root)[0]
+t = time()
+sub = atree.sub_tree(vid)
+print "sub_tree of %d vertices: %.3fs" % (len(sub),time() - t)
+t = time()
+removed = atree.remove_tree(vid)
+print "remove_tree of %d vertices: %.3fs" % (len(removed),time() - t)
@@ -0,0 +1,36 @@
+"""
+Compare the construction of a contact graph element by element
+(add_vertex/add_edge) with the bulk construction (add_vertices/add_edges).
+"""
+from time import time
+import numpy as np
+from openalea.container import Graph, PropertyGraph
+
+nb_vertices = 100000
+nb_edges = 1000000
+sources = np.random.randint(0, nb_vertices, nb_edges)
+targets = np.random.randint(0, nb_vertices, nb_edges)
+
+for graph_class in (Graph, PropertyGraph):
+    t = time()
+    g = graph_class()
+    for vid in xrange(nb_vertices):
+        g.add_vertex(vid)
+    for sid, tid in zip(sources.tolist(), targets.tolist()):
+        g.add_edge(sid, tid)
+    per_element = time() - t
+
+    t = time()
+    g = graph_class()
+    g.add_vertices(nb_vertices)
+    g.add_edges(sources, targets)
+    bulk = time() - t
+
+    t = time()
+    g = graph_class.from_edge_arrays(sources, targets, vids=range(nb_vertices))
+    from_arrays = time() - t
+
+    print "%s, %d vertices, %d edges" % (graph_class.__name__, nb_vertices, nb_edges)
+    print "  add_vertex/add_edge    : %.2fs" % per_element
+    print "  add_vertices/add_edges : %.2fs (x%.1f)" % (bulk, per_element/bulk)
+    print "  from_edge_arrays       : %.2fs (x%.1f)" % (from_arrays, per_element/from_arrays)
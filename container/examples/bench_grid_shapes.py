@@ -0,0 +1,20 @@
+"""
+Generate regular and hexagonal grid meshes of increasing size,
+the standard synthetic workload of mesh benchmarks.
+"""
+from time import time
+from openalea.container.mesh_shapes import regular_grid, hexagonal_grid
+
+for n in (50, 100, 200) :
+    t = time()
+    mesh,pos = regular_grid( (n,n,n),positions = True,compact = True)
+    print "regular grid %d^3: %d wisps, %.2fs" % (n,sum(mesh.nb_wisps(d) for d in xrange(4) ),time() - t)
+
+for n in (100, 1000) :
+    t = time()
+    mesh,pos = hexagonal_grid( (n,n),positions = True,compact = True)
+    print "hexagonal grid %d^2: %d wisps, %.2fs" % (n,sum(mesh.nb_wisps(d) for d in xrange(3) ),time() - t)
+
+t = time()
+mesh = regular_grid( (50,50,50) )
+print "regular grid 50^3 as a Topomesh: %.2fs" % (time() - t)
@@ -0,0 +1,48 @@
+"""
+Improve jittered triangulated grids of increasing size with a fixed
+number of edge flips and collapses: the cost of each operation must
+not depend on the size of the mesh, only the initial evaluation of
+the edges does.
+"""
+from time import time
+import numpy as np
+from openalea.container import CompactTopomesh
+from openalea.container.topomesh_improve import MeshImprover
+
+def triangulated_grid (n, jitter = 0.3, seed = 0) :
+    """Grid of n x n squares cut in two triangles
+    """
+    nb = n + 1
+    pids = np.arange(nb * nb).reshape(nb,nb)
+    edges = np.concatenate([np.c_[pids[:,:-1].ravel(),pids[:,1:].ravel()],
+                            np.c_[pids[:-1,:].ravel(),pids[1:,:].ravel()],
+                            np.c_[pids[:-1,:-1].ravel(),pids[1:,1:].ravel()] ])
+    nb_h = nb * n
+    sq = np.arange(n * n)
+    i,j = sq // n,sq % n
+    horizontal = i * n + j
+    vertical = nb_h + i * nb + j
+    diagonal = 2 * nb_h + sq
+    faces = np.concatenate([np.c_[horizontal,vertical + 1,diagonal],
+                            np.c_[horizontal + n,vertical,diagonal] ])
+    wids = [np.arange(nb * nb),np.arange(len(edges) ),np.arange(len(faces) )]
+    borders = [None,
+               (np.arange(0,2 * len(edges) + 1,2),edges.ravel() ),
+               (np.arange(0,3 * len(faces) + 1,3),faces.ravel() )]
+    mesh = CompactTopomesh.from_arrays(2,wids,borders).thaw()
+    rnd = np.random.RandomState(seed)
+    coords = np.c_[pids.ravel() % nb,pids.ravel() // nb].astype(float)
+    coords += rnd.uniform(-jitter,jitter,coords.shape)
+    return mesh,dict(zip(range(nb * nb),coords) )
+
+nb_operations = 5000
+for n in (50, 100, 200, 500) :
+    for name,options in ( ("flips",{}),("collapses",{"collapse_length" : 0.6,"flip" : False}) ) :
+        mesh,pos = triangulated_grid(n)
+        t = time()
+        improver = MeshImprover(mesh,pos,**options)
+        init = time() - t
+        improver.run(nb_operations)
+        stats = improver.statistics()
+        print "%d triangles, %s: initial evaluation %.1fs, %d operations, %d operations/s" \
+              % (2 * n * n,name,init,stats[name],stats["operations_per_second"])
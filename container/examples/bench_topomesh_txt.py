@@ -0,0 +1,27 @@
+"""
+Write and read back in txt format a 2D regular grid topomesh
+of about 1M wisps with a float property on points.
+"""
+import os
+from tempfile import mkstemp
+from time import time
+from openalea.container import DataProp, write_topomesh, read_topomesh
+from openalea.container.mesh_shapes import regular_grid
+
+n = 500
+t = time()
+mesh = regular_grid( (n,n) )
+print "grid %d x %d: %d wisps, built in %.2fs" % (n,n,sum(mesh.nb_wisps(d) for d in xrange(mesh.degree() + 1) ),time() - t)
+x = DataProp(dict( (pid,pid * 0.5) for pid in mesh.wisps(0) ),type = "float",unit = "m")
+
+fd,filename = mkstemp(suffix = ".msh")
+os.close(fd)
+try :
+    t = time()
+    write_topomesh(filename,mesh,"grid",[[("x",x)]])
+    print "write: %.2fs (%.1f MB)" % (time() - t,os.path.getsize(filename) / 1e6)
+    t = time()
+    mesh,descr,props = read_topomesh(filename)
+    print "read: %.2fs" % (time() - t)
+finally :
+    os.remove(filename)
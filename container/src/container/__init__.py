@@ -5,8 +5,11 @@ from utils import IdDict
 from data_prop import Quantity,DataProp
 from graph import Graph
 from property_graph import PropertyGraph
+from column_property import ColumnProperty
+from property_graph_bin import write_property_graph, read_property_graph
 from temporal_property_graph import TemporalPropertyGraph
 from tree import Tree, PropertyTree
+from array_tree import ArrayTree
 from grid import Grid
 from relation import Relation
 
@@ -16,9 +19,11 @@ from relation import Relation
 #
 ################################
 from topomesh import *
+from compact_topomesh import CompactTopomesh
 from topomesh_txt import write_topomesh,read_topomesh
 from topomesh_algo import *
 from topomesh_geom_algo import *
+from topomesh_improve import *
 
 from array_dict import array_dict
 from property_topomesh import PropertyTopomesh
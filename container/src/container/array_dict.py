@@ -1,5 +1,9 @@
+import operator
+import re
+from ast import literal_eval
+from itertools import imap, izip
 import numpy as np
-from scipy import ndimage as nd
+from utils.buffer import grow_buffer as _grow
 
 def isiterable(obj):
     try:
@@ -8,197 +12,499 @@ def isiterable(obj):
     except:
         return False
 
-class array_dict:
+# integer keys lower than this bound (or than a few times the number of keys)
+# are indexed by a dense array, other keys by a dict
+_DENSE_INDEX_MIN = 1<<20
+_DENSE_INDEX_RATIO = 8
+
+# python scalar types that can be stored without upcasting in a buffer of each dtype kind
+_INT_TYPES = (int, long)
+_SCALAR_TYPES = {'i' : (int, long, bool),
+                 'f' : (int, long, bool, float),
+                 'c' : (int, long, bool, float, complex),
+                 'O' : (int, long, bool, float, complex, str, tuple)}
+
+_COMPARISON = re.compile(r"^\s*(==|!=|<=|>=|<|>)(.+)$")
+_OPERATORS = {'==' : operator.eq, '!=' : operator.ne,
+              '<=' : operator.le, '>=' : operator.ge,
+              '<' : operator.lt, '>' : operator.gt}
+
+class array_dict(object):
+    """
+    A dictionary storing its keys and values in NumPy arrays.
+
+    Keys and values are kept in buffers growing with capacity doubling, so that
+    adding keys one at a time is amortized O(1). Deleted entries are marked as
+    dead (tombstones) and the buffers are compacted when the arrays are read
+    or when half of the entries are dead. Membership is O(1): integer keys are
+    indexed through a dense array while they stay in a reasonable range,
+    other (huge, negative or tuple) keys through a dict.
+
+    Setting a single key still costs a few NumPy scalar writes: about 2.5s
+    for a million float values and 3s for a million rows of 3 floats
+    (Python 2.7, NumPy 1.16), i.e. well over a second. Bulk loads should give
+    all the keys and values at once, to the constructor
+    (`array_dict(values, keys)`) or to `update(values, keys, ignore_missing_keys=False)`.
+    """
+    # let the arithmetic operators of array_dict handle numpy operands
+    __array_ufunc__ = None
+
     def __init__(self, values= np.array([]), keys = None):
         if isinstance(values,array_dict):
-            from copy import deepcopy
-            self._values = deepcopy(values._values)
-            self._keys = deepcopy(values._keys)
-            self._index = deepcopy(values._index)
+            keys, values = values.keys().copy(), values.values()
         elif isinstance(values,dict):
-            self._values = np.array(values.values())
-            self._keys = np.array(values.keys())
-            #self._index = np.array(nd.sum(np.arange(len(values)),self._keys,index=np.arange(max(self._keys)+1)),int)
-            self._index = np.zeros(self._keys.max()+1,int)
-            self._index[self._keys] = np.arange(len(self._keys))
-        elif isinstance(values,list) and isinstance(values[0],tuple):
-            self._values = np.array(values)[:,1]
-            self._keys = np.array(np.array(values)[:,0],int)
-            #self._index = np.array(nd.sum(np.arange(len(values)),self._keys,index=np.arange(max(self._keys)+1)),int)
-            self._index = np.zeros(self._keys.max()+1,int)
-            self._index[self._keys] = np.arange(len(self._keys))
+            keys = np.array(values.keys())
+            values = np.array(values.values())
+        elif isinstance(values,list) and len(values)>0 and isinstance(values[0],tuple):
+            keys = np.array(np.array(values)[:,0],int)
+            values = np.array(values)[:,1]
         else:
-            self._values = np.array(values)
+            values = np.array(values)
             if not keys is None:
                 assert len(keys) == len(values)
-                self._keys = np.array(keys)
-                #self._index = np.array(nd.sum(np.arange(len(values)),self._keys,index=np.arange(max(self._keys)+1)),int)
-                self._index = np.zeros(self._keys.max()+1,int)
-                self._index[self._keys] = np.arange(len(self._keys))
+                keys = np.array(keys)
+            elif len(values)>0:
+                keys = np.arange(len(values))
             else:
-                if len(values)>0:
-                    self._keys = np.arange(len(values))
-                    self._index = np.arange(len(values))
-                else:
-                    self._keys = np.array([],int)
-                    self._index = np.array([],int)
+                keys = np.array([],int)
+        self._set_arrays(keys, values)
 
-    def __getitem__(self,key):
-        if self._index[key] > 0:
-            return self._values[self._index[key]]
-        elif key in self._keys:
-            return self._values[0]
+    @classmethod
+    def from_arrays(cls, keys, values):
+        """ Create a dict directly on the arrays of `keys` and `values`, without copy.
+
+        :Parameters:
+        - `keys` (numpy.array) - the keys, without duplicates
+        - `values` (numpy.array) - the values, possibly a copy-on-write numpy.memmap
+        """
+        result = cls.__new__(cls)
+        result._set_arrays(keys, values)
+        return result
+
+    def __setstate__(self, state):
+        if '_size' not in state:
+            # array_dict pickled before the buffer storage
+            state = dict(state)
+            keys, values = state.pop('_keys'), state.pop('_values')
+            state.pop('_index', None)
+            self.__dict__.update(state)
+            self._set_arrays(keys, values)
         else:
-            raise KeyError(str(key))
+            self.__dict__.update(state)
 
-    def __setitem__(self,key, value):
-        import numpy as np
-        if key in self._keys:
-            self._values[self._index[key]] = value
+    # ##########################################################
+    #
+    # Storage
+    #
+    # ##########################################################
+    def _set_arrays(self, keys, values):
+        """ Use `keys` and `values` (of same length) as the content of the dict."""
+        keys, values = np.asarray(keys), np.asarray(values)
+        if len(keys) == 0:
+            keys = keys.astype(int)
+        self._key_buffer = keys
+        self._value_buffer = values
+        self._alive = np.ones(len(keys), dtype=bool)
+        self._size = self._count = len(keys)
+        self._build_index()
+
+    def _dense_bound(self):
+        return max(_DENSE_INDEX_MIN, _DENSE_INDEX_RATIO*(self._count+1))
+
+    def _build_index(self):
+        """ Index the alive keys, with a dense array if possible, else a dict."""
+        keys = self._key_buffer[:self._size]
+        slots = np.flatnonzero(self._alive[:self._size])
+        keys = keys[slots]
+        if keys.ndim == 1 and keys.dtype.kind in 'iu' and (len(keys) == 0 or (keys.min() >= 0 and keys.max() < self._dense_bound())):
+            self._index = np.zeros(max(keys.max()+1 if len(keys)>0 else 0, 16), int)
+            self._index[keys] = slots+1
+            self._slots = None
         else:
-            newindex = len(self._values)
-            self._keys = np.append(self._keys,np.array([key]),axis=0)
-            if key<len(self._index):
-                self._index[key] = newindex
+            self._index = None
+            self._slots = dict(zip([self._hashable(k) for k in keys], slots.tolist()))
+
+    def _hashable(self, key):
+        if isinstance(key, np.ndarray):
+            return tuple(key.tolist()) if key.ndim > 0 else key.item()
+        if isinstance(key, (list, tuple)):
+            return tuple(key)
+        return key
+
+    def _slot(self, key):
+        """ Return the slot of `key`, -1 if it is not in the dict."""
+        if self._index is not None:
+            try:
+                if 0 <= key < len(self._index) and key == int(key):
+                    return self._index[int(key)]-1
+            except (TypeError, ValueError):
+                pass
+            return -1
+        try:
+            return self._slots.get(self._hashable(key), -1)
+        except TypeError:
+            return -1
+
+    def _slots_of(self, keys):
+        """ Return the array of the slots of `keys`, raise KeyError for missing keys."""
+        keys = np.asarray(keys)
+        if self._index is not None and keys.dtype.kind in 'iu':
+            inside = (keys >= 0) & (keys < len(self._index))
+            slots = np.full(keys.shape, -1, dtype=int)
+            slots[inside] = self._index[keys[inside]]-1
+        else:
+            if self._index is not None:
+                slots = np.array([self._slot(k) for k in keys.tolist()], dtype=int)
+            elif keys.ndim > 1 and self._key_buffer.ndim > 1:
+                slots = np.array([self._slots.get(tuple(k), -1) for k in keys.tolist()], dtype=int)
             else:
-                new_index = np.zeros(key+1,int)
-                new_index[0:len(self._index)] = self._index
-                new_index[key] = newindex
-                self._index = new_index
+                slots = np.array([self._slot(k) for k in keys], dtype=int)
+        if len(slots) > 0 and slots.min() < 0:
+            raise KeyError(str(keys[np.flatnonzero(slots < 0)[0]]))
+        return slots
+
+    def _prepare_values(self, values, size):
+        """ Make the value buffer able to hold `size` values like `values`, upcasting it if needed."""
+        values = np.asarray(values)
+        if self._size == 0 and len(self._value_buffer) == 0:
+            self._value_buffer = np.zeros((0,)+values.shape[1:], dtype=values.dtype)
+        elif not np.can_cast(values.dtype, self._value_buffer.dtype):
+            self._value_buffer = self._value_buffer.astype(np.promote_types(self._value_buffer.dtype, values.dtype))
+        self._value_buffer = _grow(self._value_buffer, size, 0 if self._value_buffer.dtype != object else None)
 
-            if len(self) == 0:
-                self._values = np.array([value])
+    def _append(self, keys, values):
+        """ Add new (absent) keys with their values."""
+        keys, values = np.asarray(keys), np.asarray(values)
+        if len(keys) == 0:
+            return
+        size = self._size+len(keys)
+        if self._size == 0 and len(self._key_buffer) == 0:
+            self._key_buffer = np.zeros((0,)+keys.shape[1:], dtype=keys.dtype)
+        elif not np.can_cast(keys.dtype, self._key_buffer.dtype):
+            self._key_buffer = self._key_buffer.astype(np.promote_types(self._key_buffer.dtype, keys.dtype))
+        self._key_buffer = _grow(self._key_buffer, size, 0)
+        self._prepare_values(values, size)
+        self._alive = _grow(self._alive, size, False)
+        slots = np.arange(self._size, size)
+        self._key_buffer[slots] = keys
+        self._value_buffer[slots] = values
+        self._alive[slots] = True
+        self._size = size
+        self._count += len(keys)
+        if self._index is not None:
+            if keys.ndim == 1 and keys.dtype.kind in 'iu' and keys.min() >= 0 and keys.max() < self._dense_bound():
+                self._index = _grow(self._index, keys.max()+1, 0)
+                self._index[keys] = slots+1
             else:
-                self._values = np.append(self._values,np.array([value]),axis=0)
+                self._build_index()
+        else:
+            for key, slot in zip(keys, slots.tolist()):
+                self._slots[self._hashable(key)] = slot
+
+    def _remove(self, slots):
+        """ Mark the entries at `slots` as deleted, compact when half of the entries are dead."""
+        if len(slots) == 0:
+            return
+        keys = self._key_buffer[slots]
+        self._alive[slots] = False
+        self._count -= len(slots)
+        if self._index is not None:
+            self._index[keys] = 0
+        else:
+            for key in keys:
+                del self._slots[self._hashable(key)]
+        if self._size - self._count > self._count:
+            self._compact()
+
+    def _compact(self):
+        """ Remove the dead entries from the buffers, keeping the order of the keys."""
+        if self._size == self._count:
+            return
+        slots = np.flatnonzero(self._alive[:self._size])
+        self._key_buffer = self._key_buffer[slots]
+        self._value_buffer = self._value_buffer[slots]
+        self._alive = np.ones(len(slots), dtype=bool)
+        self._size = self._count = len(slots)
+        self._build_index()
+
+    def _alive_values(self):
+        """ Return the compact array of values, a view of the value buffer (not to be modified)."""
+        self._compact()
+        return self._value_buffer[:self._count]
+
+    # backward compatible attributes: the compact arrays of keys and values
+    _keys = property(lambda self: self.keys())
+    _values = property(lambda self: self.values())
+
+    # ##########################################################
+    #
+    # dict interface
+    #
+    # ##########################################################
+    def __getitem__(self,key):
+        slot = self._slot(key)
+        if slot < 0:
+            raise KeyError(str(key))
+        return self._value_buffer[slot]
+
+    def __setitem__(self,key, value):
+        index = self._index
+        buffer = self._value_buffer
+        if index is not None and type(key) in _INT_TYPES and 0 <= key < len(index):
+            if buffer.ndim == 1:
+                fits = type(value) in _SCALAR_TYPES.get(buffer.dtype.kind, ())
+            else:
+                if type(value) in (tuple, list):
+                    value = np.asarray(value)
+                fits = type(value) is np.ndarray and value.shape == buffer.shape[1:] and \
+                       (value.dtype == buffer.dtype or np.can_cast(value.dtype, buffer.dtype))
+            if fits:
+                # fast path : integer key and python scalar (or array row) fitting in the buffers
+                slot = index.item(key)-1
+                if slot >= 0:
+                    buffer[slot] = value
+                    return
+                slot = self._size
+                if slot < len(self._key_buffer):
+                    buffer[slot] = value
+                    self._key_buffer[slot] = key
+                    self._alive[slot] = True
+                    index[key] = slot+1
+                    self._size = slot+1
+                    self._count += 1
+                    return
+        if buffer.dtype != object and len(buffer) > 0 and np.shape(value) != buffer.shape[1:]:
+            raise ValueError("value of shape %s does not fit in values of shape %s"
+                             % (np.shape(value), buffer.shape[1:]))
+        slot = self._slot(key)
+        if slot >= 0:
+            self._prepare_values([value], self._size)
+            self._value_buffer[slot] = value
+        else:
+            self._append(np.array([key]), np.array([value]))
 
     def __delitem__(self, key):
-        index = self._index[key]
-        self._values = np.delete(self._values,index,axis=0)
-        self._index[self._keys[index:]] -= 1
-        self._keys = np.delete(self._keys,index,axis=0)
-        self._index[key] = 0
+        slot = self._slot(key)
+        if slot < 0:
+            raise KeyError(str(key))
+        if self._index is not None and self._size - self._count < self._count:
+            # fast path : no compaction needed
+            self._alive[slot] = False
+            self._index[self._key_buffer[slot]] = 0
+            self._count -= 1
+        else:
+            self._remove(np.array([slot]))
+
+    def __contains__(self, key):
+        return self._slot(key) >= 0
+
+    def __iter__(self):
+        return iter(self.keys().tolist())
 
     def __len__(self):
-        return len(self._values)
+        return self._count
 
     def __str__(self):
+        keys, values = self.keys(), self._alive_values()
         self.dict_string = "{"
-        for i,k in enumerate(self._keys):
-            self.dict_string = self.dict_string+str(k)+": "+str(self._values[self._index[k]])
-            if i < self._values.size-1 :
+        for i,k in enumerate(keys):
+            self.dict_string = self.dict_string+str(k)+": "+str(values[i])
+            if i < len(keys)-1 :
                 self.dict_string = self.dict_string+", "
         self.dict_string = self.dict_string+"}\n"
         return self.dict_string
 
     def __repr__(self):
+        keys, values = self.keys(), self._alive_values()
         self.dict_string = "{"
         if len(self)<10:
-            for i,k in enumerate(self._keys):
-                self.dict_string = self.dict_string+str(k)+": "+str(self._values[i])
-                if i < self._values.size-1 :
+            for i,k in enumerate(keys):
+                self.dict_string = self.dict_string+str(k)+": "+str(values[i])
+                if i < len(keys)-1 :
                     self.dict_string = self.dict_string+", "
         else:
             for i in xrange(3):
-                self.dict_string = self.dict_string+str(self._keys[i])+": "+str(self._values[i])+","
+                self.dict_string = self.dict_string+str(keys[i])+": "+str(values[i])+","
             self.dict_string = self.dict_string+"..."
             for i in xrange(3):
-                self.dict_string = self.dict_string+","+str(self._keys[len(self)-3+i])+": "+str(self._values[len(self)-3+i])
+                self.dict_string = self.dict_string+","+str(keys[len(self)-3+i])+": "+str(values[len(self)-3+i])
         self.dict_string = self.dict_string+"}\n"
         return self.dict_string
 
     def to_dict(self):
-        return dict([(tuple(k),self._values[i]) if isiterable(k) else (k,self._values[i]) for i,k in enumerate(self._keys)])
+        keys, values = self.keys(), self.values()
+        return dict([(tuple(k),values[i]) if isiterable(k) else (k,values[i]) for i,k in enumerate(keys)])
 
     def values(self,keys=None):
+        """
+        Return a copy of the array of values (of `keys` if not None,
+        else of all the keys in the order of `keys()`).
+        """
         if keys is None:
-            return self._values[self._index[self._keys]]
+            return self._alive_values().copy()
         else:
             if not isinstance(keys,np.ndarray):
                 keys = np.array(keys)
             if keys.dtype == np.dtype('O'):
                 return np.array([self.values(k) for k in keys])
+            elif keys.ndim == 0:
+                return self[keys.item()]
             else:
-                return self._values[self._index[keys]]
+                return self._value_buffer[self._slots_of(keys)]
 
     def keys(self) :
-        return self._keys
+        self._compact()
+        return self._key_buffer[:self._count]
 
     def items(self):
-        return [(k,self._values[i]) for i,k in enumerate(self._keys)]
+        keys, values = self.keys(), self.values()
+        return [(k,values[i]) for i,k in enumerate(keys)]
 
     def update(self,values,keys=None,ignore_missing_keys=True,erase_missing_keys=True):
-        if keys is None or (len(keys) == len(self._keys) and (keys==self.keys()).all()):
+        values = np.asarray(values)
+        if keys is None or (len(keys) == len(self) and (np.asarray(keys)==self.keys()).all()):
             assert len(self) == len(values)
-            self._values = values
+            self._set_arrays(self.keys().copy(), values)
         else:
+            keys = np.asarray(keys)
             assert len(keys) == len(values)
-            keys_to_assign = np.intersect1d(keys,self._keys)
-            if len(keys_to_assign)!=len(keys):
-                key_range = np.array(nd.sum(np.arange(keys.size),keys,index=keys_to_assign),int)
-                self._values[self._index[keys_to_assign]] = values[key_range]
+            present = np.array([self._slot(k) >= 0 for k in keys], dtype=bool) if self._index is None or keys.dtype.kind not in 'iu' \
+                      else self._present(keys)
+            if not present.all():
+                self._assign(keys[present], values[present])
                 if ignore_missing_keys:
                     print "Warning : some keys were missing from dictionary! (values ignored)"
                 else:
                     print "Warning : missing keys were added to the dictionary!"
-                    missed_keys = np.array(tuple(set(keys).difference(set(self._keys))))
-                    newindex = np.arange(len(self._values),len(self._values)+len(missed_keys))
-                    self._keys = np.append(self._keys,missed_keys,axis=0)
-                    if missed_keys.max()<len(self._index):
-                        self._index[missed_keys] = newindex
-                    else:
-                        new_index = np.zeros(missed_keys.max()+1,int)
-                        new_index[0:len(self._index)] = self._index
-                        new_index[missed_keys] = newindex
-                        self._index = new_index
-                    key_range = np.array(nd.sum(np.arange(keys.size),keys,index=missed_keys),int)
-                    if len(self) == 0:
-                        self._values = np.array(values[key_range])
-                    else:
-                        self._values = np.append(self._values,values[key_range],axis=0)
+                    self._append(keys[~present], values[~present])
             else:
-                if len(keys_to_assign)!=len(self._keys) or (keys!=self.keys()).any():
+                if len(keys)!=len(self) or (keys!=self.keys()).any():
                     if erase_missing_keys:
                         print "Warning : missing keys were erased from the dictionary!"
-                        self._values = values
-                        self._keys = np.array(keys)
-                        self._index = np.zeros(self._keys.max()+1,int)
-                        self._index[self._keys] = np.arange(len(self._keys))
+                        self._set_arrays(keys, values)
                     else:
-                        self._values[self._index[keys]] = values
+                        self._assign(keys, values)
                 else:
-                    self._values[self._index[keys]] = values
+                    self._assign(keys, values)
 
+    def _present(self, keys):
+        inside = (keys >= 0) & (keys < len(self._index))
+        present = np.zeros(len(keys), dtype=bool)
+        present[inside] = self._index[keys[inside]] > 0
+        return present
+
+    def _assign(self, keys, values):
+        if len(keys) == 0:
+            return
+        slots = self._slots_of(keys)
+        self._prepare_values(values, self._size)
+        self._value_buffer[slots] = values
 
     def delete(self,keys_to_delete):
-        keys_to_delete = np.intersect1d(keys_to_delete,self._keys)
+        keys_to_delete = [k for k in np.asarray(keys_to_delete).reshape(-1) if self._slot(k) >= 0]
         if len(keys_to_delete)>0:
-            indices_to_delete = self._index[keys_to_delete]
-            self._values = np.delete(self._values,indices_to_delete,0)
-            self._keys = np.delete(self._keys,indices_to_delete,0)
-            self._index[keys_to_delete] = 0
-            self._index[self._keys] = np.arange(len(self._keys))
+            self._remove(np.unique(self._slots_of(keys_to_delete)))
 
     def has_key(self, key):
-        return key in self._keys
+        return self._slot(key) >= 0
 
     def itervalues(self):
-        return self.to_dict().itervalues()
+        return iter(self._alive_values())
 
     def iterkeys(self):
-        return self.to_dict().iterkeys()
+        keys = self.keys()
+        return iter(keys) if keys.ndim == 1 else imap(tuple, keys)
 
     def iteritems(self):
-        return self.to_dict().iteritems()
+        return izip(self.iterkeys(), self.itervalues())
+
+    # ##########################################################
+    #
+    # Vectorized queries
+    #
+    # ##########################################################
+    def _mask(self, criterion):
+        """ Return the boolean mask (or slice) of the values matching `criterion`.
+
+        :Parameters:
+         - `criterion` - a comparison string ('>0', '==3'...), a tuple of such
+           strings (all of them must hold), a callable applied to the array
+           of values, a slice or a boolean mask of length len(self)
+        """
+        values = self._alive_values()
+        if isinstance(criterion, slice):
+            return criterion
+        if isinstance(criterion, str):
+            criterion = (criterion,)
+        if isinstance(criterion, tuple) and len(criterion) > 0 and isinstance(criterion[0], str):
+            mask = np.ones(len(values), dtype=bool)
+            for c in criterion:
+                match = _COMPARISON.match(c)
+                if match is None:
+                    raise ValueError("unsupported criterion : %s" % c)
+                mask &= _OPERATORS[match.group(1)](values, literal_eval(match.group(2).strip()))
+            return mask
+        if callable(criterion):
+            criterion = criterion(values)
+        mask = np.asarray(criterion, dtype=bool)
+        if mask.shape != (len(values),):
+            raise ValueError("criterion should give one boolean per key")
+        return mask
 
     def keys_where(self,criterion):
-        if isinstance(criterion,str):
-            return self._keys[np.where(eval('self._values'+criterion))]
-        elif isinstance(criterion,tuple) & isinstance(criterion[0],str):
-            expression = '(self._values'+criterion[0]+')'
-            for c in criterion[1:]:
-                expression += '& (self._values'+c+')'
-            return self._keys()[np.where(eval(expression))]
-        else:
-            assert len(criterion) == len(self._keys)
-            return self._keys[np.where(criterion)]
+        """ Return the array of the keys whose value matches `criterion` (see `select`)."""
+        return self.keys()[self._mask(criterion)]
+
+    def select(self, criterion):
+        """ Return the array_dict of the keys whose value matches `criterion`.
+
+        :Parameters:
+         - `criterion` - a boolean mask of length len(self), a callable
+           returning such a mask from the array of values (e.g. a ufunc or
+           lambda v : v > 0), a comparison string as in `keys_where` or a slice
+
+        :Returns Type: array_dict
+
+        .. note:: the selection shares the key and value arrays of this
+                  dict when `criterion` is a slice, otherwise NumPy gives a
+                  copy of the selected entries
+        """
+        mask = self._mask(criterion)
+        return array_dict.from_arrays(self.keys()[mask], self._alive_values()[mask])
+
+    # ##########################################################
+    #
+    # Arithmetic, aligned on keys
+    #
+    # ##########################################################
+    def _operand(self, other):
+        """ Return the values of `other` aligned on the keys of this dict."""
+        if isinstance(other, array_dict):
+            return other.values(self.keys())
+        return other
+
+    def _apply(self, values):
+        return array_dict.from_arrays(self.keys().copy(), values)
+
+def _binary_operator(op, reflected=False):
+    if reflected:
+        def method(self, other):
+            return self._apply(op(self._operand(other), self._alive_values()))
+    else:
+        def method(self, other):
+            return self._apply(op(self._alive_values(), self._operand(other)))
+    return method
+
+def _unary_operator(op):
+    def method(self):
+        return self._apply(op(self._alive_values()))
+    return method
 
+for _name, _op in [('add', operator.add), ('sub', operator.sub), ('mul', operator.mul),
+                   ('div', operator.div), ('truediv', operator.truediv),
+                   ('floordiv', operator.floordiv), ('mod', operator.mod), ('pow', operator.pow)]:
+    setattr(array_dict, '__%s__' % _name, _binary_operator(_op))
+    setattr(array_dict, '__r%s__' % _name, _binary_operator(_op, reflected=True))
+for _name, _op in [('neg', operator.neg), ('pos', operator.pos), ('abs', operator.abs)]:
+    setattr(array_dict, '__%s__' % _name, _unary_operator(_op))
+del _name, _op
@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+# -*- python -*-
+#
+#       OpenAlea.Container
+#
+#       Copyright 2008-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite : http://openalea.gforge.inria.fr
+#
+###############################################################################
+
+'''
+This module provides a compact implementation of a rooted tree
+that stores its structure in arrays.
+For interface definition, see :mod:`openalea.container.interface.tree`.
+'''
+
+__docformat__ = "restructuredtext"
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import numpy as np
+
+from interface.tree import ITree
+from interface.graph import IRootedGraph, InvalidVertex
+from tree import Tree
+
+
+def _depths(parent):
+    '''
+    Depth of each node, by pointer jumping on the parent array.
+    '''
+    depth = (parent >= 0).astype(int)
+    ancestor = parent.copy()
+    active = np.flatnonzero(ancestor >= 0)
+    while len(active) > 0:
+        up = ancestor[active]
+        depth[active] += depth[up]
+        ancestor[active] = ancestor[up]
+        active = active[ancestor[active] >= 0]
+    return depth
+
+
+def _subtree_ends(parent, next_sibling):
+    '''
+    End (excluded) of the subtree of each node in pre order:
+    its next sibling, or the end of the subtree of its parent.
+    '''
+    nb = len(parent)
+    end = next_sibling.copy()
+    end[parent < 0] = nb
+    ancestor = parent.copy()
+    pending = np.flatnonzero(end < 0)
+    while len(pending) > 0:
+        up = ancestor[pending]
+        resolved = end[up] >= 0
+        end[pending[resolved]] = end[up[resolved]]
+        ancestor[pending[~resolved]] = ancestor[up[~resolved]]
+        pending = pending[~resolved]
+    return end
+
+
+class ArrayTree(IRootedGraph, ITree):
+    '''
+    Compact implementation of a rooted :class:`Tree`.
+
+    Vertices are stored in pre order and are refered to internally
+    by their row in this order. The tree is stored as arrays of
+    rows: parent, first child, next and previous sibling, and the
+    depth of each vertex and the end of its subtree, which spans
+    the rows [row, end[row]).
+
+    Traversals are returned as arrays of vertex ids, computed
+    without recursion. Removing a subtree marks its rows as
+    removed and costs O(size of the subtree). Vertices can not
+    be added.
+
+    Use `Tree.freeze` (or `from_tree`) to create an array tree
+    and `thaw` to get back a Tree or a PropertyTree.
+    '''
+
+    def __init__(self, vids, parent, properties=None):
+        '''
+        ArrayTree constructor.
+
+        :Parameters:
+         - `vids` (array of int) - vertex ids, in pre order
+         - `parent` (array of int) - row of the parent of each vertex
+           in vids, -1 for the root (the first vertex)
+         - `properties` (dict of (name|dict of (vid|value))) - vertex
+           properties, not copied
+
+        Children of a vertex are ordered as they appear in vids.
+        '''
+        vids = np.asarray(vids, int)
+        parent = np.asarray(parent, int)
+        nb = len(vids)
+        if nb == 0 or parent[0] != -1 or (parent[1:] < 0).any() \
+           or (parent[1:] >= np.arange(1, nb)).any():
+            raise InvalidVertex('vertices must be given in pre order from the root')
+        self._vids = vids
+        self._parent = parent
+        self._alive = np.ones(nb, bool)
+        self._nb = nb
+        self._properties = {} if properties is None else properties
+        self._tree_class = Tree
+
+        #sibling links, children sorted by parent keep the pre order
+        self._first_child = np.empty(nb, int)
+        self._first_child.fill(-1)
+        self._next_sibling = self._first_child.copy()
+        self._previous_sibling = self._first_child.copy()
+        rows = np.argsort(parent[1:], kind='mergesort') + 1
+        same = parent[rows[1:]] == parent[rows[:-1]]
+        self._next_sibling[rows[:-1][same]] = rows[1:][same]
+        self._previous_sibling[rows[1:][same]] = rows[:-1][same]
+        first = rows[self._previous_sibling[rows] < 0]
+        self._first_child[parent[first]] = first
+
+        self._depth = _depths(parent)
+        self._end = _subtree_ends(parent, self._next_sibling)
+        if (np.arange(1, nb) >= self._end[parent[1:]]).any():
+            raise InvalidVertex('vertices must be given in pre order from the root')
+
+        order = np.argsort(vids, kind='mergesort')
+        self._sorted_vids = vids[order]
+        self._sorted_rows = order
+        if (self._sorted_vids[1:] == self._sorted_vids[:-1]).any():
+            raise InvalidVertex('duplicated vertex ids')
+
+    @staticmethod
+    def from_tree(tree):
+        '''
+        Create an array tree from a Tree or a PropertyTree.
+
+        Vertices are visited in pre order, without recursion.
+
+        :Parameters:
+         - `tree` (Tree)
+
+        :Returns Type: ArrayTree
+        '''
+        vids = []
+        parent = []
+        stack = [(tree.root, -1)]
+        while stack:
+            vid, parent_row = stack.pop()
+            row = len(vids)
+            vids.append(vid)
+            parent.append(parent_row)
+            children = tree.children(vid)
+            stack.extend((cid, row) for cid in reversed(children))
+        properties = None
+        if hasattr(tree, 'properties'):
+            properties = dict((name, dict(prop)) for name, prop in tree.properties().iteritems())
+        atree = ArrayTree(vids, parent, properties)
+        atree._tree_class = type(tree)
+        return atree
+
+    def thaw(self, tree_class=None):
+        '''
+        Create a mutable copy of this tree.
+
+        :Parameters:
+         - `tree_class` (class) - Tree or PropertyTree, by default the
+           class of the tree this array tree was created from
+
+        :Returns Type: Tree
+        '''
+        if tree_class is None:
+            tree_class = self._tree_class
+        rows = np.flatnonzero(self._alive)
+        vids = self._vids[rows].tolist()
+        tree = tree_class(root=vids[0])
+        parents = [None] + self._vids[self._parent[rows[1:]]].tolist()
+        tree._parent = dict(zip(vids, parents))
+        children = tree._children
+        for vid, pid in zip(vids[1:], parents[1:]):
+            children.setdefault(pid, []).append(vid)
+        tree._id = max(vids)
+        if hasattr(tree, '_properties'):
+            tree._properties = dict((name, dict(prop)) for name, prop in self._properties.iteritems())
+        return tree
+
+    #########################################################################
+    # Internal access to rows.
+    #########################################################################
+
+    def _row(self, vid):
+        '''
+        Row of a vertex, raise InvalidVertex if it does not belong to the tree.
+        '''
+        pos = np.searchsorted(self._sorted_vids, vid)
+        if pos < len(self._sorted_vids) and self._sorted_vids[pos] == vid:
+            row = self._sorted_rows[pos]
+            if self._alive[row]:
+                return row
+        raise InvalidVertex('vertex %s does not belong to the tree' % vid)
+
+    def _subtree_rows(self, vtx_id):
+        '''
+        Rows of the subtree rooted on vtx_id (the root if None), in pre order.
+        '''
+        row = 0 if vtx_id is None else self._row(vtx_id)
+        return row + np.flatnonzero(self._alive[row:self._end[row]])
+
+    #########################################################################
+    # Some Vertex List Graph Concept methods.
+    #########################################################################
+
+    def __len__(self):
+        return self.nb_vertices()
+
+    def nb_vertices(self):
+        '''
+        returns the number of vertices.
+
+        :returns: int
+        '''
+        return self._nb
+
+    def vertices_iter(self):
+        '''
+        :returns: iter of vertex_id, in pre order
+        '''
+        return iter(self.vertices())
+
+    def vertices(self):
+        '''
+        :returns: list of vertex_id, in pre order
+        '''
+        return self._vids[self._alive].tolist()
+
+    def __iter__(self):
+        return self.vertices_iter()
+
+    def has_vertex(self, vid):
+        '''
+        Test wether a vertex belong to the tree
+
+        :rtype: bool
+        '''
+        try:
+            self._row(vid)
+            return True
+        except InvalidVertex:
+            return False
+
+    def __contains__(self, vid):
+        return self.has_vertex(vid)
+
+    def iteredges(self):
+        '''
+        Iter on the edges (parent, child) of the tree.
+        '''
+        rows = np.flatnonzero(self._alive)[1:]
+        return iter(zip(self._vids[self._parent[rows]].tolist(), self._vids[rows].tolist()))
+
+    #########################################################################
+    # RootedTreeConcept methods.
+    #########################################################################
+
+    def get_root(self):
+        '''
+        Return the tree root.
+
+        :return: vertex identifier
+        '''
+        return self._vids[0]
+
+    root = property(get_root)
+
+    def parent(self, vtx_id):
+        '''
+        Return the parent of `vtx_id`, None for the root.
+
+        :returns: vertex identifier
+        '''
+        row = self._parent[self._row(vtx_id)]
+        return None if row < 0 else self._vids[row]
+
+    def _children_rows(self, row):
+        rows = []
+        child = self._first_child[row]
+        while child >= 0:
+            rows.append(child)
+            child = self._next_sibling[child]
+        return rows
+
+    def children(self, vtx_id):
+        '''
+        returns the list of children of `vtx_id`
+
+        :returns: list of vertex identifier
+        '''
+        return self._vids[self._children_rows(self._row(vtx_id))].tolist()
+
+    def children_iter(self, vtx_id):
+        '''
+        returns a vertex iterator
+
+        :returns: iter of vertex identifier
+        '''
+        return iter(self.children(vtx_id))
+
+    def nb_children(self, vtx_id):
+        '''
+        returns the number of children
+
+        :returns: int
+        '''
+        return len(self._children_rows(self._row(vtx_id)))
+
+    def siblings(self, vtx_id):
+        '''
+        returns the list of vtx_id siblings.
+        vtx_id is not include in siblings.
+
+        :returns: list of vertex identifier
+        '''
+        row = self._row(vtx_id)
+        if self._parent[row] < 0:
+            return []
+        rows = self._children_rows(self._parent[row])
+        return [self._vids[r] for r in rows if r != row]
+
+    def siblings_iter(self, vtx_id):
+        return iter(self.siblings(vtx_id))
+
+    def nb_siblings(self, vtx_id):
+        '''
+        returns the number of siblings
+
+        :returns: int
+        '''
+        return len(self.siblings(vtx_id))
+
+    def is_leaf(self, vtx_id):
+        '''
+        Test if `vtx_id` is a leaf.
+
+        :returns: bool
+        '''
+        return self._first_child[self._row(vtx_id)] < 0
+
+    def depth(self, vtx_id):
+        '''
+        Number of edges between `vtx_id` and the root.
+
+        :returns: int
+        '''
+        return self._depth[self._row(vtx_id)]
+
+    def subtree_size(self, vtx_id):
+        '''
+        Number of vertices in the subtree rooted on `vtx_id`.
+
+        :returns: int
+        '''
+        row = self._row(vtx_id)
+        return int(self._alive[row:self._end[row]].sum())
+
+    #########################################################################
+    # Traversals.
+    #########################################################################
+
+    def pre_order(self, vtx_id=None):
+        '''
+        Vertices of the subtree rooted on `vtx_id` (the root if None),
+        root then children.
+
+        :returns: array of vertex identifier
+        '''
+        return self._vids[self._subtree_rows(vtx_id)]
+
+    def post_order(self, vtx_id=None):
+        '''
+        Vertices of the subtree rooted on `vtx_id` (the root if None),
+        children then root.
+
+        The position of a vertex in post order is its position in pre
+        order, minus its depth, plus the size of its subtree minus one.
+
+        :returns: array of vertex identifier
+        '''
+        rows = self._subtree_rows(vtx_id)
+        first = rows[0]
+        counts = np.zeros(self._end[first] - first + 1, int)
+        np.cumsum(self._alive[first:self._end[first]], out=counts[1:])
+        pre = counts[rows - first]
+        size = counts[self._end[rows] - first] - pre
+        post = pre + size - 1 - (self._depth[rows] - self._depth[first])
+        order = np.empty(len(rows), int)
+        order[post] = rows
+        return self._vids[order]
+
+    def level_order(self, vtx_id=None):
+        '''
+        Vertices of the subtree rooted on `vtx_id` (the root if None),
+        the root, then its children and so on.
+
+        :returns: array of vertex identifier
+        '''
+        rows = self._subtree_rows(vtx_id)
+        return self._vids[rows[np.argsort(self._depth[rows], kind='mergesort')]]
+
+    #########################################################################
+    # Editable Tree Interface.
+    #########################################################################
+
+    def sub_tree(self, vtx_id, copy=True):
+        '''
+        Return the subtree rooted on `vtx_id`.
+
+        Vertices of the subtree keep their ids.
+
+        :Parameters:
+          - `vtx_id`: A vertex of the original tree.
+          - `copy`: If True, return a new tree holding the subtree. If False,
+            this tree is replaced by the subtree.
+
+        :returns: ArrayTree
+        '''
+        rows = self._subtree_rows(vtx_id)
+        new_rows = np.empty(self._end[rows[0]] - rows[0], int)
+        new_rows[rows - rows[0]] = np.arange(len(rows))
+        parent = new_rows[self._parent[rows[1:]] - rows[0]]
+        vids = self._vids[rows]
+        properties = {}
+        for name, prop in self._properties.iteritems():
+            properties[name] = dict((vid, prop[vid]) for vid in vids.tolist() if vid in prop)
+        tree = ArrayTree(vids, np.concatenate(([-1], parent)), properties)
+        tree._tree_class = self._tree_class
+        if copy:
+            return tree
+        self.__dict__.update(tree.__dict__)
+        return self
+
+    def remove_tree(self, vtx_id):
+        '''
+        Remove the sub tree rooted on `vtx_id`.
+
+        :returns: list of removed vertex identifier, in post order
+        '''
+        row = self._row(vtx_id)
+        if row == 0:
+            raise InvalidVertex('Removing the root node %d is forbidden.' % vtx_id)
+        vids = self.post_order(vtx_id)
+
+        #unlink from siblings
+        previous = self._previous_sibling[row]
+        following = self._next_sibling[row]
+        if previous >= 0:
+            self._next_sibling[previous] = following
+        else:
+            self._first_child[self._parent[row]] = following
+        if following >= 0:
+            self._previous_sibling[following] = previous
+
+        self._alive[row:self._end[row]] = False
+        self._nb -= len(vids)
+        vids = vids.tolist()
+        for prop in self._properties.itervalues():
+            for vid in vids:
+                prop.pop(vid, None)
+        return vids
+
+    def remove_vertex(self, vid):
+        '''
+        Remove a leaf.
+        '''
+        if not self.is_leaf(vid):
+            raise InvalidVertex('Can not remove vertex %d  with children. Use remove_tree instead.' % vid)
+        self.remove_tree(vid)
+
+    #########################################################################
+    # Properties.
+    #########################################################################
+
+    def property_names(self):
+        '''
+        names of all property maps.
+        '''
+        return self._properties.keys()
+
+    def property(self, name):
+        '''
+        Returns the property map between the vid and the data.
+        :returns:  dict of {vid:data}
+        '''
+        return self._properties.get(name, {})
+
+    def properties(self):
+        '''
+        Returns all the property maps of the tree.
+        '''
+        return self._properties
+
+    def __str__(self):
+        return "ArrayTree : nb_vertices=%d" % self.nb_vertices()
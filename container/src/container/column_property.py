@@ -0,0 +1,356 @@
+# -*- python -*-
+#
+#       OpenAlea.Container
+#
+#       Copyright 2006-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite: http://openalea.gforge.inria.fr
+#
+################################################################################
+"""This module provide a columnar, NumPy backed, storage for graph properties"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import numpy as np
+from utils.buffer import grow_buffer as _grow
+
+
+class RowIndex(object):
+    """
+    Dense mapping between element ids and rows, shared by all the
+    columns of the same kind of elements (e.g. the vertices of a graph).
+
+    Rows are allocated on first use and kept until `clear`, so that an id
+    keeps the same row in every column.
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._row_of_id = np.zeros(0, dtype=int)
+        self._id_of_row = np.zeros(0, dtype=int)
+        self._nb_rows = 0
+
+    def __len__(self):
+        return self._nb_rows
+
+    def ids(self, rows):
+        """ Return the ids associated to `rows`."""
+        return self._id_of_row[rows]
+
+    def rows(self, ids, create=False):
+        """ Return the rows of an array of ids.
+
+        If `create` is False, ids without a row get -1, else new rows are allocated.
+        """
+        ids = np.asarray(ids, dtype=int)
+        if len(ids) > 0 and ids.min() < 0:
+            raise KeyError(ids.min())
+        if create and len(ids) > 0:
+            self._row_of_id = _grow(self._row_of_id, ids.max()+1, -1)
+        rows = np.full(ids.shape, -1, dtype=int)
+        known = ids < len(self._row_of_id)
+        rows[known] = self._row_of_id[ids[known]]
+        if create:
+            missing = np.unique(ids[rows < 0])
+            if len(missing) > 0:
+                new_rows = np.arange(self._nb_rows, self._nb_rows+len(missing))
+                self._id_of_row = _grow(self._id_of_row, self._nb_rows+len(missing), -1)
+                self._id_of_row[new_rows] = missing
+                self._row_of_id[missing] = new_rows
+                self._nb_rows += len(missing)
+                rows = self._row_of_id[ids]
+        return rows
+
+    def row(self, eid, create=False):
+        """ Return the row of an id, -1 if it has none and `create` is False."""
+        if 0 <= eid < len(self._row_of_id):
+            row = self._row_of_id[eid]
+            if row >= 0 or not create:
+                return row
+        elif not create or eid < 0:
+            return -1
+        return self.rows([eid], create=True)[0]
+
+
+class ColumnProperty(object):
+    """
+    A property stored as a typed NumPy array, aligned on the rows of a `RowIndex`.
+
+    It behaves as the dict it replaces (keys are element ids) and adds
+    vectorized accessors working on arrays of ids: `gather`, `assign` and `select`.
+    A given dtype is kept: values are cast to it, and values that do not fit
+    raise ValueError. Otherwise the dtype is deduced from the first value and
+    upcast when needed (to object for non numerical values).
+    """
+    def __init__(self, index=None, values=None, dtype=None):
+        self._index = RowIndex() if index is None else index
+        self._dtype = None if dtype is None else np.dtype(dtype)
+        self._values = None
+        self._defined = np.zeros(0, dtype=bool)
+        if values is not None:
+            self.update(values)
+
+    @classmethod
+    def from_arrays(cls, index, values, defined=None):
+        """ Create a column directly on arrays aligned on the rows of `index`, without copy.
+
+        :Parameters:
+        - `index` (RowIndex) - the rows of the values
+        - `values` (numpy.array) - the values, possibly a read-only or copy-on-write numpy.memmap
+        - `defined` (numpy.array of bool) - the rows having a value, all of them if None
+        """
+        column = cls(index)
+        column._values = values
+        if defined is None:
+            defined = np.ones(len(values), dtype=bool)
+        column._defined = defined
+        return column
+
+    # ##########################################################
+    #
+    # Storage
+    #
+    # ##########################################################
+    def _prepare(self, sample, size):
+        """
+        Make the columns able to hold `size` rows of values like `sample`.
+        Return `sample` as an array, cast to the dtype given to the column if any.
+        """
+        sample = np.asarray(sample)
+        if self._dtype is not None and self._dtype != object:
+            sample = self._cast(sample)
+            dtype, shape = sample.dtype, sample.shape[1:]
+        elif sample.dtype.kind in 'SUO':
+            dtype, shape = np.dtype(object), ()
+        else:
+            dtype, shape = sample.dtype, sample.shape[1:]
+        if self._values is None:
+            if self._dtype is not None:
+                dtype = self._dtype
+            self._values = np.zeros((0,)+shape, dtype=dtype)
+        elif self._dtype is not None and self._dtype != object:
+            if self._values.shape[1:] != shape:
+                raise ValueError("values of shape %s do not fit in a column of shape %s"
+                                 % (shape, self._values.shape[1:]))
+        elif self._values.dtype != object and (self._values.shape[1:] != shape or dtype == object):
+            self._to_object()
+        elif self._values.dtype != object and not np.can_cast(dtype, self._values.dtype):
+            self._values = self._values.astype(np.promote_types(self._values.dtype, dtype))
+        self._values = _grow(self._values, size, 0 if self._values.dtype != object else None)
+        self._defined = _grow(self._defined, size, False)
+        return sample
+
+    def _cast(self, values):
+        """ Cast `values` to the dtype given to the column, raise ValueError for values that do not fit."""
+        dtype = self._dtype
+        try:
+            if values.dtype.kind in 'SU':
+                raise TypeError
+            if dtype.kind in 'fc':
+                exact = values.astype(np.complex128)
+                if dtype.kind == 'f':
+                    cast = exact.real.astype(dtype)
+                    lost = exact.imag != 0
+                else:
+                    cast = exact.astype(dtype)
+                    lost = np.zeros(values.shape, dtype=bool)
+                lost |= np.isinf(cast) & ~np.isinf(exact)
+            else:
+                cast = values.astype(dtype)
+                lost = np.asarray(cast != values, dtype=bool)
+        except (TypeError, ValueError, OverflowError):
+            lost = np.ones(values.shape, dtype=bool)
+        if lost.any():
+            raise ValueError("value %r does not fit in a column of type %s" % (values[lost][0], dtype))
+        return cast
+
+    def _to_object(self):
+        values = np.empty(len(self._values), dtype=object)
+        for row in np.flatnonzero(self._defined):
+            values[row] = self._values[row]
+        self._values = values
+
+    def _rows(self, ids):
+        rows = self._index.rows(ids)
+        defined = rows >= 0
+        defined[defined] = rows[defined] < len(self._defined)
+        defined[defined] = self._defined[rows[defined]]
+        if not defined.all():
+            raise KeyError(np.asarray(ids)[~defined][0])
+        return rows
+
+    def _defined_rows(self):
+        return np.flatnonzero(self._defined[:len(self._index)])
+
+    # ##########################################################
+    #
+    # Vectorized interface
+    #
+    # ##########################################################
+    def keys_array(self):
+        """ Return the array of the ids having a value."""
+        return self._index.ids(self._defined_rows())
+
+    def values_array(self):
+        """ Return the array of values, aligned with `keys_array`."""
+        if self._values is None:
+            return np.zeros(0, dtype=self._dtype)
+        return self._values[self._defined_rows()]
+
+    def gather(self, ids):
+        """ Return the array of the values of `ids`, raise KeyError for ids without value."""
+        ids = np.asarray(list(ids) if not isinstance(ids, np.ndarray) else ids, dtype=int)
+        if len(ids) == 0:
+            return self.values_array()[:0]
+        return self._values[self._rows(ids)]
+
+    def assign(self, ids, values):
+        """ Set the values of an array of ids at once."""
+        ids = np.asarray(list(ids) if not isinstance(ids, np.ndarray) else ids, dtype=int)
+        if len(ids) == 0:
+            return
+        rows = self._index.rows(ids, create=True)
+        values = self._prepare(values, len(self._index))
+        if self._values.dtype == object and values.ndim > 1:
+            for row, value in zip(rows, values):
+                self._values[row] = value
+        else:
+            self._values[rows] = values
+        self._defined[rows] = True
+
+    def select(self, mask_or_callable):
+        """ Return the ids whose value satisfies a criterion.
+
+        :Parameters:
+        - `mask_or_callable` - a boolean array aligned with `keys_array`, or a
+          vectorized predicate applied to `values_array` (e.g. lambda v: v > 10)
+        """
+        if callable(mask_or_callable):
+            mask = np.asarray(mask_or_callable(self.values_array()), dtype=bool)
+        else:
+            mask = np.asarray(mask_or_callable, dtype=bool)
+        return self.keys_array()[mask]
+
+    # ##########################################################
+    #
+    # dict interface
+    #
+    # ##########################################################
+    def __len__(self):
+        return int(self._defined[:len(self._index)].sum())
+
+    def __contains__(self, eid):
+        row = self._index.row(eid)
+        return 0 <= row < len(self._defined) and bool(self._defined[row])
+
+    has_key = __contains__
+
+    def __getitem__(self, eid):
+        if eid not in self:
+            raise KeyError(eid)
+        value = self._values[self._index.row(eid)]
+        return value.item() if self._values.ndim == 1 and self._values.dtype != object else value
+
+    def __setitem__(self, eid, value):
+        row = self._index.row(eid, create=True)
+        if row < 0:
+            raise KeyError(eid)
+        sample = self._prepare([value], len(self._index))
+        if self._values.dtype != object:
+            value = sample[0]
+        self._values[row] = value
+        self._defined[row] = True
+
+    def __delitem__(self, eid):
+        if eid not in self:
+            raise KeyError(eid)
+        row = self._index.row(eid)
+        self._defined[row] = False
+        if self._values.dtype == object:
+            self._values[row] = None
+
+    def __iter__(self):
+        return iter(self.keys_array().tolist())
+
+    def __eq__(self, other):
+        try:
+            return dict(self.iteritems()) == dict(other)
+        except (TypeError, ValueError):
+            return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "ColumnProperty(%r)" % dict(self.iteritems())
+
+    def get(self, eid, default=None):
+        try:
+            return self[eid]
+        except KeyError:
+            return default
+
+    def pop(self, eid, *args):
+        try:
+            value = self[eid]
+        except KeyError:
+            if len(args) > 0:
+                return args[0]
+            raise
+        del self[eid]
+        return value
+
+    def setdefault(self, eid, default=None):
+        if eid not in self:
+            self[eid] = default
+        return self[eid]
+
+    def update(self, *args, **kwds):
+        if len(args) == 1 and not kwds and isinstance(args[0], ColumnProperty):
+            self.assign(args[0].keys_array(), args[0].values_array())
+            return
+        values = dict(*args, **kwds)
+        ids = values.keys()
+        try:
+            array = np.asarray(values.values())
+            if array.dtype == object or len(array) != len(ids):
+                raise ValueError
+        except ValueError:
+            for eid in ids:
+                self[eid] = values[eid]
+            return
+        self.assign(ids, array)
+
+    def clear(self):
+        self._defined[:] = False
+        if self._values is not None and self._values.dtype == object:
+            self._values[:] = None
+
+    def copy(self):
+        return dict(self.iteritems())
+
+    def keys(self):
+        return self.keys_array().tolist()
+
+    def iterkeys(self):
+        return iter(self)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def itervalues(self):
+        for eid in self:
+            yield self[eid]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def iteritems(self):
+        for eid in self:
+            yield eid, self[eid]
@@ -0,0 +1,362 @@
+# -*- python -*-
+# -*- coding: utf-8 -*-
+#
+#       CompactTopomesh : container package
+#
+#       Copyright or  or Copr. 2006 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       VPlants WebSite : https://gforge.inria.fr/projects/vplants/
+#
+
+__doc__="""
+This module provide a read only implementation of the topomesh
+interface that store incidence relations in arrays
+"""
+
+__license__= "Cecill-C"
+__revision__=" $Id$ "
+
+from array import array
+from itertools import chain
+import numpy as np
+from interface.topomesh import (InvalidDegree,
+                                ITopomesh,IWispListMesh,INeighborhoodMesh)
+from topomesh import Topomesh,StrInvalidWisp,StrInvalidDegree
+from utils.csr import csr_gather,csr_counts,csr_row_ids,csr_from_pairs
+
+class CompactTopomesh (ITopomesh,IWispListMesh,INeighborhoodMesh) :
+    """
+    compact (frozen) implementation of a topological mesh
+
+    wisps of each degree are stored in a sorted array of ids
+    and wisps are refered to internally by their row in this
+    array. Borders of the wisps of degree d (and regions of
+    the wisps of degree d - 1) are stored in CSR form: an
+    array of offsets and an array of rows of degree d - 1
+    (resp. d).
+
+    Use `Topomesh.freeze` to create a compact mesh from a
+    mutable one and `thaw` to get back a mutable mesh.
+    """
+    def __init__ (self, degree, wids, borders) :
+        """
+        constructor of a compact mesh
+
+        :Parameters:
+         - `degree` (int) - degree of the mesh
+         - `wids` (list of array of int) - ids of the wisps of each degree
+         - `borders` (list of (array, array)) - for each degree d > 0,
+             borders of the wisps of wids[d] in CSR form: ptr, border ids
+             (borders[0] is ignored)
+        """
+        self._degree = degree
+        self._wids = []
+        self._borders = [None]
+        for d in xrange(degree + 1) :
+            wids_d = np.asarray(wids[d],int)
+            order = np.argsort(wids_d,kind = "mergesort")
+            self._wids.append(wids_d[order])
+            if d > 0 :
+                ptr,bids = borders[d]
+                ptr,bids = np.asarray(ptr,int),np.asarray(bids,int)
+                # rows sorted by id, border ids replaced by their row
+                bids = self._rows(d - 1,csr_gather(order,ptr,bids) )
+                ptr = np.concatenate( ([0],np.cumsum(csr_counts(order,ptr) ) ) )
+                self._borders.append( (ptr,bids) )
+        self._regions = [None] * degree
+
+    @classmethod
+    def from_arrays (cls, degree, wids, borders, regions = None) :
+        """
+        create a compact mesh directly on its internal arrays, without copy
+
+        :Parameters:
+         - `degree` (int) - degree of the mesh
+         - `wids` (list of array of int) - sorted ids of the wisps of each degree
+         - `borders` (list of (array, array)) - for each degree d > 0,
+             borders of the wisps of wids[d] in CSR form: ptr, rows in wids[d - 1]
+         - `regions` (list of (array, array)) - for each degree d < degree,
+             regions of the wisps of wids[d] in CSR form: ptr, rows in wids[d + 1],
+             computed from the borders when needed if None
+
+        :Returns Type: CompactTopomesh
+        """
+        mesh = cls.__new__(cls)
+        mesh._degree = degree
+        mesh._wids = list(wids)
+        mesh._borders = [None] + [tuple(borders[d]) for d in xrange(1,degree + 1)]
+        if regions is None :
+            regions = [None] * degree
+        mesh._regions = [None if regions[d] is None else tuple(regions[d]) for d in xrange(degree)]
+        return mesh
+
+    @classmethod
+    def from_topomesh (cls, mesh) :
+        """
+        create a compact copy of a mutable topomesh
+
+        :Parameters:
+         - `mesh` (Topomesh)
+
+        :Returns Type: CompactTopomesh
+        """
+        degree = mesh.degree()
+        wids = []
+        borders = [None]
+        for d in xrange(degree + 1) :
+            wids_d = list(mesh.wisps(d) )
+            wids.append(np.array(wids_d,int) )
+            if d > 0 :
+                rows = [mesh._borders[d][wid] for wid in wids_d]
+                ptr = np.zeros(len(rows) + 1,int)
+                np.cumsum([len(row) for row in rows],out = ptr[1:])
+                bids = np.fromiter(chain.from_iterable(rows),int,ptr[-1])
+                borders.append( (ptr,bids) )
+        return cls(degree,wids,borders)
+
+    def thaw (self, idgenerator = "set") :
+        """
+        create a mutable copy of this mesh
+
+        :Parameters:
+         - `idgenerator` (str) - type of id generator of the new mesh
+
+        :Returns Type: Topomesh
+        """
+        mesh = Topomesh(self._degree,idgenerator)
+        for d in xrange(self._degree + 1) :
+            wids = self._wids[d].tolist()
+            if d > 0 :
+                ptr,brows = self._borders[d]
+                bids = self._wids[d - 1][brows].tolist()
+                mesh._borders[d].add_many([array("L",bids[ptr[i]:ptr[i + 1]])
+                                           for i in xrange(len(wids) )],wids)
+            if d < self._degree :
+                ptr,rrows = self._region_csr(d)
+                rids = self._wids[d + 1][rrows].tolist()
+                regions = [array("L",rids[ptr[i]:ptr[i + 1]]) for i in xrange(len(wids) )]
+                if d == 0 :
+                    mesh._regions[d].add_many(regions,wids)
+                else :
+                    mesh._regions[d].update(zip(wids,regions) )
+        return mesh
+
+    def _region_csr (self, degree) :
+        """Internal function that returns the regions of the wisps of
+        a degree in CSR form, computed from the borders when first needed
+        """
+        if self._regions[degree] is None :
+            ptr,brows = self._borders[degree + 1]
+            self._regions[degree] = csr_from_pairs(brows,csr_row_ids(ptr),
+                                                   len(self._wids[degree]) )
+        return self._regions[degree]
+
+    def _check_degree (self, degree) :
+        if degree < 0 or degree > self._degree :
+            raise StrInvalidDegree(degree)
+
+    def _rows (self, degree, wids) :
+        """Internal function that returns the rows of an array of wids
+        """
+        self._check_degree(degree)
+        wids = np.asarray(wids,int)
+        sorted_wids = self._wids[degree]
+        rows = np.searchsorted(sorted_wids,wids)
+        rows[rows == len(sorted_wids)] = 0
+        invalid = (sorted_wids[rows] != wids) if len(sorted_wids) > 0 else np.ones(wids.shape,bool)
+        if invalid.any() :
+            raise StrInvalidWisp(degree,wids[invalid][0])
+        return rows
+
+    def _row (self, degree, wid) :
+        return int(self._rows(degree,[wid])[0])
+
+    def _traverse (self, degree, rows, offset, step) :
+        """Internal function that gathers the wisps at degree + offset * step
+        of an array of rows, returns a CSR structure (ptr, sorted rows)
+        aligned on `rows`
+        """
+        nb = len(rows)
+        owners = np.arange(nb)
+        ptr = np.arange(nb + 1)
+        for i in xrange(offset) :
+            ptr,targets = self._borders[degree] if step < 0 else self._region_csr(degree)
+            owners = np.repeat(owners,csr_counts(rows,ptr) )
+            rows = csr_gather(rows,ptr,targets)
+            degree += step
+            # remove duplicated paths before the next level
+            ptr,rows = csr_from_pairs(owners,rows,nb,unique = True)
+            owners = csr_row_ids(ptr)
+        return ptr,rows
+
+    ########################################################################
+    #
+    #               Mesh concept
+    #
+    ########################################################################
+    def degree (self) :
+        return self._degree
+    degree.__doc__=ITopomesh.degree.__doc__
+
+    def is_valid (self) :
+        return True
+    is_valid.__doc__=ITopomesh.is_valid.__doc__
+
+    def has_wisp (self, degree, wid) :
+        self._check_degree(degree)
+        sorted_wids = self._wids[degree]
+        row = np.searchsorted(sorted_wids,wid)
+        return bool(row < len(sorted_wids) and sorted_wids[row] == wid)
+    has_wisp.__doc__=ITopomesh.has_wisp.__doc__
+
+    def borders (self, degree, wid, offset = 1) :
+        if degree - offset < 0 :
+            raise InvalidDegree ("smallest wisps have no borders")
+        if offset == 1 :
+            row = self._row(degree,wid)
+            ptr,brows = self._borders[degree]
+            return iter(self._wids[degree - 1][brows[ptr[row]:ptr[row + 1]]].tolist() )
+        return iter(self.batch_borders(degree,[wid],offset)[1].tolist() )
+    borders.__doc__=ITopomesh.borders.__doc__
+
+    def nb_borders (self, degree, wid) :
+        if degree < 1 :
+            raise InvalidDegree ("smallest wisps have no borders")
+        row = self._row(degree,wid)
+        ptr = self._borders[degree][0]
+        return int(ptr[row + 1] - ptr[row])
+    nb_borders.__doc__=ITopomesh.nb_borders.__doc__
+
+    def regions (self, degree, wid, offset = 1) :
+        if (degree + offset) > self.degree() :
+            raise InvalidDegree ("biggest wisps do not separate regions")
+        if offset == 1 :
+            row = self._row(degree,wid)
+            ptr,rrows = self._region_csr(degree)
+            return iter(self._wids[degree + 1][rrows[ptr[row]:ptr[row + 1]]].tolist() )
+        return iter(self.batch_regions(degree,[wid],offset)[1].tolist() )
+    regions.__doc__=ITopomesh.regions.__doc__
+
+    def nb_regions (self, degree, wid) :
+        if degree >= self.degree() :
+            raise InvalidDegree ("biggest wisps do not separate regions")
+        row = self._row(degree,wid)
+        ptr = self._region_csr(degree)[0]
+        return int(ptr[row + 1] - ptr[row])
+    nb_regions.__doc__=ITopomesh.nb_regions.__doc__
+    ########################################################################
+    #
+    #               Wisp list concept
+    #
+    ########################################################################
+    def wisps (self, degree) :
+        self._check_degree(degree)
+        return iter(self._wids[degree].tolist() )
+    wisps.__doc__=IWispListMesh.wisps.__doc__
+
+    def nb_wisps (self, degree) :
+        self._check_degree(degree)
+        return len(self._wids[degree])
+    nb_wisps.__doc__=IWispListMesh.nb_wisps.__doc__
+
+    def wisp_array (self, degree) :
+        """
+        sorted array of the ids of all wisps of a given degree
+        """
+        self._check_degree(degree)
+        return self._wids[degree]
+    ########################################################################
+    #
+    #               Neighborhood concept
+    #
+    ########################################################################
+    def border_neighbors (self, degree, wid) :
+        for bid in self.borders(degree,wid) :
+            for rid in self.regions(degree-1,bid) :
+                if rid != wid :
+                    yield rid
+    border_neighbors.__doc__=INeighborhoodMesh.border_neighbors.__doc__
+
+    def nb_border_neighbors (self, degree, wid) :
+        return len(list(self.border_neighbors(degree,wid)))
+    nb_border_neighbors.__doc__=INeighborhoodMesh.nb_border_neighbors.__doc__
+
+    def region_neighbors (self, degree, wid) :
+        for rid in self.regions(degree,wid) :
+            for bid in self.borders(degree+1,rid) :
+                if bid != wid :
+                    yield bid
+    region_neighbors.__doc__=INeighborhoodMesh.region_neighbors.__doc__
+
+    def nb_region_neighbors (self, degree, wid) :
+        return len(list(self.region_neighbors(degree,wid)))
+    nb_region_neighbors.__doc__=INeighborhoodMesh.nb_region_neighbors.__doc__
+    ########################################################################
+    #
+    #               Vectorized queries
+    #
+    ########################################################################
+    def batch_borders (self, degree, wids, offset = 1) :
+        """
+        borders at degree - offset of an array of wisps
+
+        :Parameters:
+         - `degree` (int) - degree of the wisps
+         - `wids` (array of int) - ids of the wisps
+         - `offset` (int) - degree offset of the borders
+
+        :Returns: ptr, bids - CSR structure, sorted ids of the borders
+                  of wids[i] are bids[ptr[i]:ptr[i + 1]]
+        """
+        if degree - offset < 0 :
+            raise InvalidDegree ("smallest wisps have no borders")
+        rows = self._rows(degree,wids)
+        ptr,brows = self._traverse(degree,rows,offset,-1)
+        return ptr,self._wids[degree - offset][brows]
+
+    def batch_regions (self, degree, wids, offset = 1) :
+        """
+        regions at degree + offset of an array of wisps
+
+        :Parameters:
+         - `degree` (int) - degree of the wisps
+         - `wids` (array of int) - ids of the wisps
+         - `offset` (int) - degree offset of the regions
+
+        :Returns: ptr, rids - CSR structure, sorted ids of the regions
+                  of wids[i] are rids[ptr[i]:ptr[i + 1]]
+        """
+        if (degree + offset) > self.degree() :
+            raise InvalidDegree ("biggest wisps do not separate regions")
+        rows = self._rows(degree,wids)
+        ptr,rrows = self._traverse(degree,rows,offset,1)
+        return ptr,self._wids[degree + offset][rrows]
+
+    def batch_border_neighbors (self, degree, wids) :
+        """
+        wisps sharing a border with each wisp of an array of wisps
+
+        :Parameters:
+         - `degree` (int) - degree of the wisps
+         - `wids` (array of int) - ids of the wisps
+
+        :Returns: ptr, nids - CSR structure, sorted ids of the
+                  neighbors of wids[i] (without duplicates) are
+                  nids[ptr[i]:ptr[i + 1]]
+        """
+        if degree < 1 :
+            raise InvalidDegree ("smallest wisps have no borders")
+        rows = self._rows(degree,wids)
+        ptr,brows = self._borders[degree]
+        owners = np.repeat(np.arange(len(rows) ),csr_counts(rows,ptr) )
+        brows = csr_gather(rows,ptr,brows)
+        ptr,rrows = self._region_csr(degree - 1)
+        owners = np.repeat(owners,csr_counts(brows,ptr) )
+        nrows = csr_gather(brows,ptr,rrows)
+        keep = nrows != rows[owners]
+        ptr,nrows = csr_from_pairs(owners[keep],nrows[keep],len(rows),unique = True)
+        return ptr,self._wids[degree][nrows]
@@ -26,6 +26,8 @@ from interface.graph import InvalidEdge,InvalidVertex,IGraph,\
                                         IMutableVertexGraph,IMutableEdgeGraph,\
                                         IExtendGraph
 from utils import IdDict
+from itertools import izip
+import numpy as np
 
 class Graph (IGraph,\
                         IVertexListGraph,IEdgeListGraph,\
@@ -224,6 +226,20 @@ class Graph (IGraph,\
         return self._vertices.add((set(),set()),vid )
     add_vertex.__doc__=IMutableVertexGraph.add_vertex.__doc__
 
+    def add_vertices(self, vids):
+        """
+        add several vertices in one shot
+
+        :Parameters:
+        - `vids` - the number of vertices to create, or a sequence of vertex ids
+
+        :Returns: the list of vertex ids
+        """
+        if isinstance(vids, (int, long)) :
+            return self._vertices.add_many([(set(),set()) for i in xrange(vids)])
+        vids = list(vids)
+        return self._vertices.add_many([(set(),set()) for vid in vids], vids)
+
     def remove_vertex(self, vid):
         if vid not in self :
             raise InvalidVertex(vid)
@@ -254,6 +270,60 @@ class Graph (IGraph,\
         return eid
     add_edge.__doc__=IMutableEdgeGraph.add_edge.__doc__
 
+    def add_edges(self, sources, targets, eids=None):
+        """
+        add several edges in one shot
+
+        :Parameters:
+        - `sources`, `targets` - sequences (or arrays) of vertex ids
+        - `eids` - a sequence of edge ids, created if None
+
+        :Returns: the list of edge ids
+        """
+        sources = np.asarray(sources,dtype=int).ravel()
+        targets = np.asarray(targets,dtype=int).ravel()
+        if len(sources) != len(targets) :
+            raise ValueError("%d sources for %d targets" % (len(sources),len(targets)) )
+        vertices = self._vertices
+        for vid in np.unique(np.concatenate([sources,targets])).tolist() :
+            if vid not in vertices :
+                raise InvalidVertex(vid)
+        if eids is not None :
+            eids = np.asarray(eids,dtype=int).ravel().tolist()
+        eids = self._edges.add_many(izip(sources.tolist(),targets.tolist()),eids)
+        # fill the adjacency one vertex at a time rather than one edge at a time
+        eid_array = np.asarray(eids,dtype=int)
+        for vids,link in [(sources,1),(targets,0)] :
+            order = np.argsort(vids)
+            sorted_vids = vids[order]
+            sorted_eids = eid_array[order].tolist()
+            bounds = np.flatnonzero(np.diff(sorted_vids)) + 1
+            starts = [0] + bounds.tolist()
+            stops = bounds.tolist() + [len(sorted_eids)]
+            for vid,start,stop in izip(sorted_vids[starts].tolist() if len(sorted_eids) > 0 else [],starts,stops) :
+                vertices[vid][link].update(sorted_eids[start:stop])
+        return eids
+
+    @classmethod
+    def from_edge_arrays(cls, sources, targets, eids=None, vids=None, **kwds):
+        """
+        create a graph from arrays of edges
+
+        :Parameters:
+        - `sources`, `targets` - sequences (or arrays) of vertex ids
+        - `eids` - a sequence of edge ids, created if None
+        - `vids` - the vertex ids, the ones used by the edges if None
+        - `kwds` - arguments of the constructor (e.g. idgenerator)
+        """
+        graph = cls(**kwds)
+        sources = np.asarray(sources,dtype=int).ravel()
+        targets = np.asarray(targets,dtype=int).ravel()
+        if vids is None :
+            vids = np.unique(np.concatenate([sources,targets])).tolist()
+        graph.add_vertices(vids)
+        graph.add_edges(sources,targets,eids)
+        return graph
+
     def remove_edge(self,eid):
         if not self.has_edge(eid) :
             raise InvalidEdge(eid)
@@ -277,16 +347,14 @@ class Graph (IGraph,\
     # ##########################################################
     def extend(self, graph):
         #vertex adding
-        trans_vid={}
-        for vid in list(graph.vertices()) :
-            trans_vid[vid]=self.add_vertex()
+        vids=list(graph.vertices())
+        trans_vid=dict(izip(vids,self.add_vertices(len(vids))))
 
         #edge adding
-        trans_eid={}
-        for eid in list(graph.edges()) :
-            sid=trans_vid[graph.source(eid)]
-            tid=trans_vid[graph.target(eid)]
-            trans_eid[eid]=self.add_edge(sid,tid)
+        eids=list(graph.edges())
+        sources=[trans_vid[graph.source(eid)] for eid in eids]
+        targets=[trans_vid[graph.target(eid)] for eid in eids]
+        trans_eid=dict(izip(eids,self.add_edges(sources,targets)))
 
         return trans_vid,trans_eid
     extend.__doc__=IExtendGraph.extend.__doc__
@@ -301,13 +369,16 @@ class Graph (IGraph,\
         result._vertices.clear()
         result._edges.clear()
         
-        for key, edges in self._vertices.items():
+        edges = self._edges
+        keys, links, eids = [], [], []
+        for key, (inedges, outedges) in self._vertices.iteritems():
             if key in vids:
-                inedges, outedges = edges
-                sortedinedges = set([eid for eid in inedges if self.source(eid) in vids])
-                sortedoutedges = set([eid for eid in outedges if self.target(eid) in vids])
-                result._vertices.add((sortedinedges,sortedoutedges), key)
-                for eid in sortedoutedges:
-                    result._edges.add(self._edges[eid], eid)
+                sortedinedges = set([eid for eid in inedges if edges[eid][0] in vids])
+                sortedoutedges = set([eid for eid in outedges if edges[eid][1] in vids])
+                keys.append(key)
+                links.append((sortedinedges,sortedoutedges))
+                eids.extend(sortedoutedges)
+        result._vertices.add_many(links, keys)
+        result._edges.add_many([edges[eid] for eid in eids], eids)
         
         return result
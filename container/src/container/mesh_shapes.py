@@ -23,16 +23,19 @@ __revision__ = " $Id$ "
 
 __all__ = ["line"
          , "polygon"
-         , "regular_grid"]
+         , "regular_grid"
+         , "hexagonal_grid"]
 
+from itertools import combinations
 from math import sqrt,sin,cos,pi
-from grid import Grid
-from mesh import Mesh
+import numpy as np
+from compact_topomesh import CompactTopomesh
 
 def line (nb_segments) :
     """Create a 1D mesh along a single line
     made of nb segments
     """
+    from mesh import Mesh
     #create mesh
     m = Mesh()
     
@@ -56,6 +59,7 @@ def line (nb_segments) :
 def polygon (nb_sides) :
     """Create a regular polygonal 2D mesh
     """
+    from mesh import Mesh
     #create mesh
     m = Mesh()
     
@@ -84,382 +88,169 @@ def polygon (nb_sides) :
     return m
 
 
-def _regular_grid2D (shape) :
-    cell_grid = Grid(shape)
-    point_grid = Grid( (i + 1 for i in shape) )
-    imax,jmax = shape
-    
-    #create mesh
-    m = Mesh()
-    
-    #create cells
-    cell = [m.add_dart(2) for ind in cell_grid]
-    
-    #create points
-    point = [m.add_dart(0) for ind in point_grid]
-    for i,pid in enumerate(point) :
-        m.set_position(pid, point_grid.coordinates(i) )
-    
-    #create vertical walls
-    for i in xrange(imax + 1) :
-        for j in xrange(jmax) :
-            wid = m.add_dart(1)
-            m.link(wid, point[point_grid.index( (i,j) )])
-            m.link(wid, point[point_grid.index( (i,j + 1) )])
-            if i > 0 :
-                m.link(cell[cell_grid.index( (i - 1,j) )], wid)
-            if i < imax :
-                m.link(cell[cell_grid.index( (i,j) )], wid)
-    
-    #create horizontal walls
-    for i in xrange(imax) :
-        for j in xrange(jmax + 1) :
-            wid = m.add_dart(1)
-            m.link(wid, point[point_grid.index( (i,j) )])
-            m.link(wid, point[point_grid.index( (i + 1,j) )])
-            if j > 0 :
-                m.link(cell[cell_grid.index( (i,j - 1) )], wid)
-            if j < jmax :
-                m.link(cell[cell_grid.index( (i,j) )], wid)
-    
-    #return
-    return m
+def _grid_ids (offset, shape, coords) :
+    """Ids of the elements at coords in a grid of elements
+    numbered from offset, first coordinate first
+    """
+    return offset + np.ravel_multi_index(coords,shape,order = "F")
 
-def _regular_grid3D (shape) :
-    cell_grid = Grid(shape)
-    point_grid = Grid( (i + 1 for i in shape) )
-    imax,jmax,kmax = shape
-    
-    #create mesh
-    m = Mesh()
-    
-    #create cells
-    cell = [m.add_dart(3) for ind in cell_grid]
-    
-    #create points
-    point = [m.add_dart(0) for ind in point_grid]
-    for i,pid in enumerate(point) :
-        m.set_position(pid, point_grid.coordinates(i) )
-    
-    #create edges
-    point_to_edge = {}
-    #between i and i + 1
-    for i in xrange(imax) :
-        for j in xrange(jmax + 1) :
-            for k in xrange(kmax + 1) :
-                eid = m.add_dart(1)
-                pid1 = point[point_grid.index( (i,j,k) )]
-                pid2 = point[point_grid.index( (i + 1,j,k) )]
-                m.link(eid, pid1)
-                m.link(eid, pid2)
-                key = (min(pid1, pid2), max(pid1, pid2) )
-                point_to_edge[key] = eid
-    #between j and j + 1
-    for i in xrange(imax + 1) :
-        for j in xrange(jmax) :
-            for k in xrange(kmax + 1) :
-                eid = m.add_dart(1)
-                pid1 = point[point_grid.index( (i,j,k) )]
-                pid2 = point[point_grid.index( (i,j + 1,k) )]
-                m.link(eid, pid1)
-                m.link(eid, pid2)
-                key = (min(pid1, pid2), max(pid1,pid2) )
-                point_to_edge[key] = eid
-    #between k and k + 1
-    for i in xrange(imax + 1) :
-        for j in xrange(jmax + 1) :
-            for k in xrange(kmax) :
-                eid = m.add_dart(1)
-                pid1 = point[point_grid.index( (i,j,k) )]
-                pid2 = point[point_grid.index( (i,j,k + 1) )]
-                m.link(eid, pid1)
-                m.link(eid, pid2)
-                key = (min(pid1, pid2), max(pid1,pid2) )
-                point_to_edge[key] = eid
-    
-    #create walls
-    #in the (i,j) plane, k constant
-    for k in xrange(kmax + 1) :
-        for i in xrange(imax) :
-            for j in xrange(jmax) :
-                wid = m.add_dart(2)
-                pids = (point[point_grid.index( (i,j,k) )],
-                        point[point_grid.index( (i + 1,j,k) )],
-                        point[point_grid.index( (i + 1,j + 1,k) )],
-                        point[point_grid.index( (i,j + 1,k) )] )
-                for ind in xrange(4) :
-                    pid1 = pids[ind]
-                    pid2 = pids[(ind + 1) % 4]
-                    eid = point_to_edge[(min(pid1, pid2), max(pid1, pid2) )]
-                    m.link(wid, eid)
-                if k > 0 :
-                    m.link(cell[cell_grid.index( (i,j,k - 1) )], wid)
-                if k < kmax :
-                    m.link(cell[cell_grid.index( (i,j,k) )], wid)
-    
-    #in the (j,k) plane, i constant
-    for i in xrange(imax + 1) :
-        for j in xrange(jmax) :
-            for k in xrange(kmax) :
-                wid = m.add_dart(2)
-                pids = (point[point_grid.index( (i,j,k) )],
-                        point[point_grid.index( (i,j + 1,k) )],
-                        point[point_grid.index( (i,j + 1,k + 1) )],
-                        point[point_grid.index( (i,j,k + 1) )] )
-                for ind in xrange(4) :
-                    pid1 = pids[ind]
-                    pid2 = pids[(ind + 1) % 4]
-                    eid = point_to_edge[(min(pid1, pid2), max(pid1, pid2) )]
-                    m.link(wid, eid)
-                if i > 0 :
-                    m.link(cell[cell_grid.index( (i - 1,j,k) )], wid)
-                if i < imax :
-                    m.link(cell[cell_grid.index( (i,j,k) )], wid)
+def _id_dtype (nb) :
+    """Smallest int type able to store ids and offsets up to nb
+    """
+    return np.int32 if nb < 2 ** 31 else np.int64
+
+def _cubical_complex (shape) :
+    """Wids and borders of the cubical complex of a regular grid
     
-    #in the (k,i) plane, j constant
-    for j in xrange(jmax + 1) :
-        for k in xrange(kmax) :
-            for i in xrange(imax) :
-                wid = m.add_dart(2)
-                pids = (point[point_grid.index( (i,j,k) )],
-                        point[point_grid.index( (i,j,k + 1) )],
-                        point[point_grid.index( (i + 1,j,k + 1) )],
-                        point[point_grid.index( (i + 1,j,k) )] )
-                for ind in xrange(4) :
-                    pid1 = pids[ind]
-                    pid2 = pids[(ind + 1) % 4]
-                    eid = point_to_edge[(min(pid1, pid2), max(pid1, pid2) )]
-                    m.link(wid, eid)
-                if j > 0 :
-                    m.link(cell[cell_grid.index( (i,j - 1,k) )], wid)
-                if j < jmax :
-                    m.link(cell[cell_grid.index( (i,j,k) )], wid)
+    A wisp of degree k is defined by the k axes it spans and the
+    coordinates of its lowest point. Wisps of degree k are numbered
+    by group of axes, then by coordinates, first coordinate first.
     
-    #return
-    return m
+    :Returns: wids, borders - ids of the wisps of each degree and
+              borders of each degree in CSR form (ptr, bids)
+    """
+    dim = len(shape)
+    pshape = tuple(nb + 1 for nb in shape)
+    groups = {}
+    wids = []
+    borders = [None]
+    for deg in xrange(dim + 1) :
+        nb = 0
+        for axes in combinations(range(dim),deg) :
+            gshape = tuple(nb_pts - 1 if ax in axes else nb_pts for ax,nb_pts in enumerate(pshape) )
+            groups[axes] = (nb,gshape)
+            nb += int(np.prod(gshape) )
+        dtype = _id_dtype(nb * 2 * deg)
+        wids.append(np.arange(nb,dtype = dtype) )
+        if deg == 0 :
+            continue
+        nb_borders = 2 * deg
+        bids = np.empty( (nb,nb_borders),dtype)
+        for axes in combinations(range(dim),deg) :
+            first,gshape = groups[axes]
+            size = int(np.prod(gshape) )
+            coords = np.unravel_index(np.arange(size),gshape,order = "F")
+            cols = []
+            for ax in axes :
+                sub_axes = tuple(a for a in axes if a != ax)
+                sub_offset,sub_shape = groups[sub_axes]
+                shifted = list(coords)
+                shifted[ax] = coords[ax] + 1
+                cols.append( (sub_offset,sub_shape,coords) )
+                cols.append( (sub_offset,sub_shape,shifted) )
+            if deg == 2 :
+                #borders of faces in cyclic order
+                cols = [cols[2],cols[1],cols[3],cols[0]]
+            for col,(sub_offset,sub_shape,sub_coords) in enumerate(cols) :
+                bids[first:first + size,col] = _grid_ids(sub_offset,sub_shape,sub_coords)
+        ptr = np.arange(0,nb * nb_borders + 1,nb_borders,dtype = dtype)
+        borders.append( (ptr,bids.ravel() ) )
+    return wids,borders
 
-def regular_grid (shape) :
+def _bulk_topomesh (degree, wids, borders, compact) :
+    """Create a topomesh from the arrays of borders of
+    wisps numbered from 0 in each degree
+    """
+    mesh = CompactTopomesh.from_arrays(degree,wids,borders)
+    if compact :
+        return mesh
+    return mesh.thaw()
+
+def regular_grid (shape, positions = False, compact = False) :
     """Create a mesh with a regular grid shape
     
+    Points, edges, faces and cells ids and their borders
+    are computed in closed form and the mesh is built in bulk.
+    
     :Parameters:
      - `shape` (int or tuple of int) - nb of cells in each dimension
+                                       (at most 3 dimensions)
+     - `positions` (bool) - if True, also returns the positions of
+                     points as a (nb points, 3) array, pid being the row
+     - `compact` (bool) - if True, returns a CompactTopomesh
     
-    :Returns: (Mesh)
+    :Returns: (Topomesh), or (Topomesh, array) if positions
     """
     if type(shape) == int :
-        return line(shape)
-    elif len(shape) == 1 :
-        return line(shape[0])
-    elif len(shape) == 2 :
-        return _regular_grid2D(shape)
-    elif len(shape) == 3 :
-        return _regular_grid3D(shape)
-    else :
+        shape = (shape,)
+    shape = tuple(shape)
+    if len(shape) > 3 :
         raise NotImplementedError("nD grid still in the box, %s" % str(shape) )
+    wids,borders = _cubical_complex(shape)
+    mesh = _bulk_topomesh(len(shape),wids,borders,compact)
+    if not positions :
+        return mesh
+    pshape = tuple(nb + 1 for nb in shape)
+    pos = np.zeros( (len(wids[0]),3) )
+    pos[:,:len(shape)] = np.column_stack(np.unravel_index(wids[0],pshape,order = "F") )
+    return mesh,pos
 
-
-def _hexagonal_grid2D (shape, shape_geom = "hexa") :#TODO
-    raise NotImplementedError
-    '''
-    cell_grid = Grid(shape)
+def _hexagonal_grid2D (shape) :
+    """Wids, borders and corner coordinates of a grid of hexagons
+    
+    Rows of hexagons (pointy top) are shifted every other row.
+    Corners of the hexagons lie on an integer lattice: the center
+    of hexagon (i,j) is (2i + j % 2, 3j) and its corners are
+    obtained by the offsets (0,2), (1,1), (1,-1), (0,-2), (-1,-1)
+    and (-1,1). Shared corners and edges are merged by sorting
+    their integer keys.
+    
+    :Returns: wids, borders, corners - corners is a (nb points, 2)
+              array of lattice coordinates, pid being the row
+    """
     imax,jmax = shape
-    assert imax > 1
-    assert jmax > 1
-    point_grid = Grid( (2 * imax + 1, 3 + (jmax - 1) ) )
-    
-    #create tissue
-    t = Tissue()
-    CELL = t.add_type("cell")
-    WALL = t.add_type("wall")
-    POINT = t.add_type("point")
-    mesh_id = t.add_relation("mesh",(POINT,WALL,CELL) )
-    mesh = t.relation(mesh_id)
-    
-    #create cells
-    cell = [mesh.add_wisp(2) for ind in cell_grid]
-    
-    #create points
-    point = [mesh.add_wisp(0) for ind in point_grid]
-    
-    #create horizontal walls
-    for i in xrange(imax) :
-        for j in xrange(jmax + 1) :
-            wid = mesh.add_wisp(1)
-            if j % 2 == 0 :
-                mesh.link(1,wid,point[point_grid.index( (2 * i,j) )])
-                mesh.link(1,wid,point[point_grid.index( (2 * i + 1,j) )])
-            else :
-                mesh.link(1,wid,point[point_grid.index( (2 * i + 1,j) )])
-                mesh.link(1,wid,point[point_grid.index( (2 * i + 2,j) )])
-            
-            if j > 1 :
-                mesh.link(2,cell[cell_grid.index( (i,j - 2) )],wid)
-            if j < jmax :
-                mesh.link(2,cell[cell_grid.index( (i,j) )],wid)
-    
-    j = jmax
-    if j % 2 != 0 :
-        for i in xrange(imax) :
-            wid = mesh.add_wisp(1)
-            mesh.link(1,wid,point[point_grid.index( (2 * i,j + 1) )])
-            mesh.link(1,wid,point[point_grid.index( (2 * i + 1,j + 1) )])
-            
-            mesh.link(2,cell[cell_grid.index( (i,j - 1) )],wid)
-    else :
-        for i in xrange(imax) :
-            wid = mesh.add_wisp(1)
-            mesh.link(1,wid,point[point_grid.index( (2 * i + 1,j + 1) )])
-            mesh.link(1,wid,point[point_grid.index( (2 * i + 2,j + 1) )])        
-            
-            mesh.link(2,cell[cell_grid.index( (i,j - 1) )],wid)
-    
-    #create vertical walls
-    for i in xrange(imax) :
-        for j in xrange(jmax) :
-            #bottom left wall
-            wid = mesh.add_wisp(1)
-            if j % 2 == 0 :
-                mesh.link(1,wid,point[point_grid.index( (2 * i,j) )])
-                mesh.link(1,wid,point[point_grid.index( (2 * i,j + 1) )])
-            else :
-                mesh.link(1,wid,point[point_grid.index( (2 * i + 1,j) )])
-                mesh.link(1,wid,point[point_grid.index( (2 * i + 1,j + 1) )])
-            
-            mesh.link(2,cell[cell_grid.index( (i,j) )],wid)
-            if j > 0 :
-                if j % 2 == 0 :
-                    if i > 0 :
-                        mesh.link(2,cell[cell_grid.index( (i - 1,j - 1) )],wid)
-                else :
-                    mesh.link(2,cell[cell_grid.index( (i,j - 1) )],wid)
-            #bottom right wall
-            wid = mesh.add_wisp(1)
-            if j % 2 == 0 :
-                mesh.link(1,wid,point[point_grid.index( (2 * i + 1,j) )])
-                mesh.link(1,wid,point[point_grid.index( (2 * i + 1,j + 1) )])
-            else :
-                mesh.link(1,wid,point[point_grid.index( (2 * i + 2,j) )])
-                mesh.link(1,wid,point[point_grid.index( (2 * i + 2,j + 1) )])
-            
-            mesh.link(2,cell[cell_grid.index( (i,j) )],wid)
-            if j > 0 :
-                if j % 2 == 0 :
-                    mesh.link(2,cell[cell_grid.index( (i,j - 1) )],wid)
-                else :
-                    if i < (imax - 1) :
-                        mesh.link(2,cell[cell_grid.index( (i + 1,j - 1) )],wid)
-    
-    #top left, first column
-    i = 0
-    for j in (2 * k for k in xrange( (jmax + 1) / 2) ) :
-        wid = mesh.add_wisp(1)
-        mesh.link(1,wid,point[point_grid.index( (i,j + 1) )])
-        mesh.link(1,wid,point[point_grid.index( (i,j + 2) )])
-        mesh.link(2,cell[cell_grid.index( (i,j) )],wid)
-        
-    #top right, last column
-    i = imax - 1
-    for j in (2 * k + 1 for k in xrange(jmax / 2) ) :
-        wid = mesh.add_wisp(1)
-        mesh.link(1,wid,point[point_grid.index( (2 * i + 2,j + 1) )])
-        mesh.link(1,wid,point[point_grid.index( (2 * i + 2,j + 2) )])
-        mesh.link(2,cell[cell_grid.index( (i,j) )],wid)
-    
-    #top left and right for top line
-    j = jmax - 1
-    if j % 2 == 0 :
-        #top left
-        for i in xrange(1,imax) :
-            wid = mesh.add_wisp(1)
-            mesh.link(1,wid,point[point_grid.index( (2 * i,j + 1) )])
-            mesh.link(1,wid,point[point_grid.index( (2 * i,j + 2) )])
-            mesh.link(2,cell[cell_grid.index( (i,j) )],wid)
-        #top right
-        for i in xrange(imax) :
-            wid = mesh.add_wisp(1)
-            mesh.link(1,wid,point[point_grid.index( (2 * i + 1,j + 1) )])
-            mesh.link(1,wid,point[point_grid.index( (2 * i + 1,j + 2) )])
-            mesh.link(2,cell[cell_grid.index( (i,j) )],wid)
-    else :
-        #top left
-        for i in xrange(imax) :
-            wid = mesh.add_wisp(1)
-            mesh.link(1,wid,point[point_grid.index( (2 * i + 1,j + 1) )])
-            mesh.link(1,wid,point[point_grid.index( (2 * i + 1,j + 2) )])
-            mesh.link(2,cell[cell_grid.index( (i,j) )],wid)
-        #top right
-        for i in xrange(imax - 1) :
-            wid = mesh.add_wisp(1)
-            mesh.link(1,wid,point[point_grid.index( (2 * i + 2,j + 1) )])
-            mesh.link(1,wid,point[point_grid.index( (2 * i + 2,j + 2) )])
-            mesh.link(2,cell[cell_grid.index( (i,j) )],wid)
-        
-    #create property position of points
-    if shape_geom == 'box' :
-        pos = dict( (pid,point_grid.coordinates(i) ) for i,pid in enumerate(point) )
-    elif shape_geom == 'hexa' :
-        pos = {}
-        for ind,pid in enumerate(point) :
-            i,j = point_grid.coordinates(ind)
-            if j % 2 == 0 :
-                x = 0.5 + (i / 2) * 3 + (i % 2)
-                y = j * sqrt(3) / 2.
-            else :
-                x = - 1 + ( (i + 1) / 2) * 3 + ( (i + 1) % 2)
-                y = j * sqrt(3) / 2.
-            pos[pid] = (x,y)
-    else :
-        raise NotImplementedError("shape_geom: %s not recognized. only 'box' or 'hexa'" % str(shape_geom) )
-    
-    #create config
-    cfg = Config("topology")
-    cfg.add_item(ConfigItem("CELL",CELL) )
-    cfg.add_item(ConfigItem("WALL",WALL) )
-    cfg.add_item(ConfigItem("POINT",POINT) )
-    cfg.add_item(ConfigItem("mesh_id",mesh_id) )
-    
-    #return
-    return t,cfg,pos
-    '''
+    i,j = np.unravel_index(np.arange(imax * jmax),shape,order = "F")
+    centers = np.column_stack( (2 * i + j % 2,3 * j) )
+    offsets = np.array([(0,2),(1,1),(1,-1),(0,-2),(-1,-1),(-1,1)])
+    corners = (centers[:,np.newaxis,:] + offsets[np.newaxis,:,:]).reshape(-1,2)
+    corners,cell_pids = _unique_rows(corners)
+    cell_pids = cell_pids.reshape(-1,6)
+    edges = np.sort(np.dstack( (cell_pids,np.roll(cell_pids,-1,axis = 1) ) ).reshape(-1,2),axis = 1)
+    edges,cell_eids = _unique_rows(edges)
+    nb_cells = len(cell_pids)
+    wids = [np.arange(len(corners) ),np.arange(len(edges) ),np.arange(nb_cells)]
+    borders = [None,
+               (np.arange(0,2 * len(edges) + 1,2),edges.ravel() ),
+               (np.arange(0,6 * nb_cells + 1,6),cell_eids)]
+    return wids,borders,corners
+
+def _unique_rows (rows) :
+    """Unique rows of an int array and the index of each row in them
+    """
+    rows = np.asarray(rows)
+    keys = np.ravel_multi_index( (rows - rows.min(axis = 0) ).T,rows.ptp(axis = 0) + 1)
+    keys,inverse = np.unique(keys,return_inverse = True)
+    first = np.zeros(len(keys),int)
+    first[inverse] = np.arange(len(rows) )
+    return rows[first],inverse
 
-def hexagonal_grid (shape, shape_geom = 'hexa') :#TODO
-    """Create a tissue with a regular hexagonal grid topology
+def hexagonal_grid (shape, shape_geom = 'hexa', positions = False, compact = False) :
+    """Create a mesh with a regular hexagonal grid topology
     
     The shape of each cell may either be a box or an hexagon
     
     :Parameters:
-     - `shape` (int or tuple of int) - nb of cells in each dimension
+     - `shape` (tuple of int) - nb of cells in each dimension
      - `shape_geom` (str) : either 'hexa' or 'box'
+     - `positions` (bool) - if True, also returns the positions of
+                     points as a (nb points, 3) array, pid being the row
+     - `compact` (bool) - if True, returns a CompactTopomesh
     
-    :Return: a tissuedb containing :
-                - a mesh
-                - a config
-                - a pos property
-    
-    :Returns Type: TissueDB
+    :Returns: (Topomesh), or (Topomesh, array) if positions
     """
-    raise NotImplementedError
-    '''
-    if type(shape) == int or len(shape) == 1 :
-        t,cfg,pos = _regular_grid1D(shape)
-    elif len(shape) == 2 :
-        imax,jmax = shape
-        if imax == 1 and jmax == 1 :
-            t,cfg,pos = _single_cell2D(6)
-        else :
-            t,cfg,pos = _hexagonal_grid2D(shape,shape_geom)
-    
-    #create tissueDB
-    db = TissueDB()
-    db.set_tissue(t)
-    db.set_property("position",Quantity(pos,"None") )
-    db.set_description("position","geometrical position of points")
-    db.set_config("config",cfg)
-    
-    return db
-    '''
-
-
-
-
-
+    if type(shape) == int or len(shape) != 2 :
+        raise NotImplementedError("only 2D hexagonal grids, %s" % str(shape) )
+    wids,borders,corners = _hexagonal_grid2D(shape)
+    mesh = _bulk_topomesh(2,wids,borders,compact)
+    if not positions :
+        return mesh
+    pos = np.zeros( (len(corners),3) )
+    if shape_geom == 'hexa' :
+        pos[:,0] = corners[:,0] * sqrt(3) / 2.
+        pos[:,1] = corners[:,1] / 2.
+    elif shape_geom == 'box' :
+        pos[:,0] = corners[:,0]
+        pos[:,1] = np.unique(corners[:,1],return_inverse = True)[1]
+    else :
+        raise NotImplementedError("shape_geom: %s not recognized. only 'box' or 'hexa'" % str(shape_geom) )
+    return mesh,pos
@@ -23,11 +23,169 @@ from interface.property_graph import IPropertyGraph, PropertyError
 from graph import Graph, InvalidVertex, InvalidEdge
 import numpy as np
 from heapq import heappop, heappush
+from itertools import chain
+from column_property import ColumnProperty, RowIndex
 import warnings
 
 VertexProperty, EdgeProperty, GraphProperty = range(3)
 VertexIdType, EdgeIdType, ValueType = range(3)
 
+# above this ratio of edges over n*n, all-pairs distances use the dense engine
+_DENSE_GRAPH_DENSITY = 0.1
+# maximum number of matrix cells computed at once by the sparse engine
+_DISTANCE_BLOCK_SIZE = 2**22
+
+def _sparse_all_pairs(n, rows, cols, weights, dtype = np.float64, max_depth = None):
+    """ All-pairs shortest path distances by repeated Dijkstra (BFS for unit costs) searches.
+
+    Sources are processed by blocks so that at most `_DISTANCE_BLOCK_SIZE`
+    distances are held in memory besides the result. If `max_depth` is None
+    the result is a dense NxN array, else a scipy.sparse.csr_matrix holding
+    only the distances below `max_depth` (the diagonal is stored explicitly).
+    """
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+
+    adjacency = csr_matrix((weights, (rows, cols)), shape=(n, n))
+    unweighted = bool(np.all(weights == 1))
+    limit = np.inf if max_depth is None else max_depth
+    block = max(1, _DISTANCE_BLOCK_SIZE // max(n, 1))
+
+    if max_depth is None:
+        distances = np.empty((n, n), dtype=dtype)
+    else:
+        data, indices, counts = [], [], []
+    for start in xrange(0, n, block):
+        sources = np.arange(start, min(start+block, n))
+        block_dist = dijkstra(adjacency, directed=True, indices=sources, unweighted=unweighted, limit=limit)
+        if max_depth is None:
+            distances[sources] = block_dist
+        else:
+            reached = block_dist <= max_depth
+            block_rows, block_cols = np.nonzero(reached)
+            data.append(block_dist[block_rows, block_cols].astype(dtype))
+            indices.append(block_cols)
+            counts.append(reached.sum(axis=1))
+
+    if max_depth is None:
+        return distances
+    indptr = np.zeros(n+1, dtype=int)
+    if n > 0:
+        np.cumsum(np.concatenate(counts), out=indptr[1:])
+        data, indices = np.concatenate(data), np.concatenate(indices)
+    else:
+        data, indices = np.array([], dtype=dtype), np.array([], dtype=int)
+    return csr_matrix((data, indices, indptr), shape=(n, n))
+
+_untyped = object()
+
+def _iter_unique(iterable):
+    """ Iterate on the elements of `iterable`, skipping the ones already seen."""
+    seen = set()
+    for elt in iterable:
+        if elt not in seen:
+            seen.add(elt)
+            yield elt
+
+class EdgeTypeProperty(dict):
+    """
+    dict used for the 'edge_type' edge property.
+
+    Every change of an edge type is forwarded to the graph owning the
+    property so that its per edge type adjacency index stays up to date.
+    It is pickled as a plain dict.
+    """
+    def __init__(self, *args, **kwds):
+        dict.__init__(self, *args, **kwds)
+        self._graph = None
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+    def _notify(self, eid, old_type, new_type):
+        if self._graph is not None:
+            self._graph._edge_type_changed(eid, old_type, new_type)
+
+    def __setitem__(self, eid, edge_type):
+        old_type = self.get(eid, _untyped)
+        dict.__setitem__(self, eid, edge_type)
+        self._notify(eid, old_type, edge_type)
+
+    def __delitem__(self, eid):
+        old_type = self[eid]
+        dict.__delitem__(self, eid)
+        self._notify(eid, old_type, _untyped)
+
+    def pop(self, eid, *args):
+        if eid not in self:
+            return dict.pop(self, eid, *args)
+        old_type = dict.pop(self, eid)
+        self._notify(eid, old_type, _untyped)
+        return old_type
+
+    def popitem(self):
+        eid, old_type = dict.popitem(self)
+        self._notify(eid, old_type, _untyped)
+        return eid, old_type
+
+    def setdefault(self, eid, edge_type=None):
+        if eid not in self:
+            self[eid] = edge_type
+        return self[eid]
+
+    def update(self, *args, **kwds):
+        for eid, edge_type in dict(*args, **kwds).iteritems():
+            self[eid] = edge_type
+
+    def clear(self):
+        dict.clear(self)
+        if self._graph is not None:
+            self._graph._edge_type_index = {}
+            self._graph._invalidate_topology()
+
+class VersionedProperty(dict):
+    """
+    dict counting its changes.
+
+    `version` is incremented by every change of the values, so that
+    indices built on the property can check that they are still valid.
+    It is pickled as a plain dict.
+    """
+    def __init__(self, *args, **kwds):
+        dict.__init__(self, *args, **kwds)
+        self.version = 0
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.version += 1
+
+    def pop(self, key, *args):
+        self.version += 1
+        return dict.pop(self, key, *args)
+
+    def popitem(self):
+        self.version += 1
+        return dict.popitem(self)
+
+    def setdefault(self, key, value=None):
+        self.version += 1
+        return dict.setdefault(self, key, value)
+
+    def update(self, *args, **kwds):
+        dict.update(self, *args, **kwds)
+        self.version += 1
+
+    def clear(self):
+        dict.clear(self)
+        self.version += 1
+
 class PropertyGraph(IPropertyGraph, Graph):
     """
     Simple implementation of IPropertyGraph using
@@ -41,8 +199,22 @@ class PropertyGraph(IPropertyGraph, Graph):
         self._vertex_property = {}
         self._edge_property = {}
         self._graph_property = {}
+        self._topology_cache = {}
         Graph.__init__(self, graph, **kwds)
 
+    def __getstate__(self):
+        # topology snapshots and indices are rebuilt on demand, do not copy or pickle them
+        state = self.__dict__.copy()
+        state.pop('_topology_cache', None)
+        state.pop('_edge_type_index', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        edge_types = self._edge_property.get('edge_type')
+        if edge_types is not None and not isinstance(edge_types, EdgeTypeProperty):
+            self._edge_property['edge_type'] = EdgeTypeProperty(edge_types)
+
     def vertex_property_names(self):
         """todo"""
         return self._vertex_property.iterkeys()
@@ -54,16 +226,21 @@ class PropertyGraph(IPropertyGraph, Graph):
     # vertex_properties.__doc__ = IPropertyGraph.vertex_properties.__doc__
 
     def vertex_property(self, property_name, vids = None):
-        """todo"""
+        """ Return the property `property_name` of the vertices.
+
+        If `vids` is not None, return the values of these vertices only: a NumPy
+        array aligned on `vids` for columnar properties, else a dict.
+        """
         try:
-            if vids is not None:
-                return dict([(k,v) for k,v in self._vertex_property[property_name].iteritems() if k in vids])
-            else:
-                return self._vertex_property[property_name]
+            prop = self._vertex_property[property_name]
         except KeyError:
             raise PropertyError("property %s is undefined on vertices"
                                 % property_name)
-    vertex_property.__doc__=IPropertyGraph.vertex_property.__doc__
+        if vids is None:
+            return prop
+        if isinstance(prop, ColumnProperty):
+            return prop.gather(vids)
+        return dict([(k,prop[k]) for k in vids if k in prop])
 
     def edge_property_names(self):
         """todo"""
@@ -75,14 +252,22 @@ class PropertyGraph(IPropertyGraph, Graph):
         return self._edge_property
     #  edge_properties.__doc__ = IPropertyGraph. edge_properties.__doc__
 
-    def edge_property(self, property_name):
-        """todo"""
+    def edge_property(self, property_name, eids = None):
+        """ Return the property `property_name` of the edges.
+
+        If `eids` is not None, return the values of these edges only: a NumPy
+        array aligned on `eids` for columnar properties, else a dict.
+        """
         try:
-            return self._edge_property[property_name]
+            prop = self._edge_property[property_name]
         except KeyError:
             raise PropertyError("property %s is undefined on edges"
                                 % property_name)
-    edge_property.__doc__ = IPropertyGraph.edge_property.__doc__
+        if eids is None:
+            return prop
+        if isinstance(prop, ColumnProperty):
+            return prop.gather(eids)
+        return dict([(k,prop[k]) for k in eids if k in prop])
 
     def graph_property(self, property_name):
         """todo"""
@@ -100,14 +285,31 @@ class PropertyGraph(IPropertyGraph, Graph):
         """todo"""
         return self._graph_property.iterkeys()
 
-    def add_vertex_property(self, property_name, values = None):
-        """todo"""
+    def _property_rows(self, property_type = VertexProperty):
+        """ Return the RowIndex shared by the columnar properties of vertices (or edges)."""
+        name = '_vertex_rows' if property_type == VertexProperty else '_edge_rows'
+        rows = self.__dict__.get(name)
+        if rows is None:
+            rows = RowIndex()
+            setattr(self, name, rows)
+        return rows
+
+    def add_vertex_property(self, property_name, values = None, columnar = False, dtype = None):
+        """ Add a new property to the vertices.
+
+        :Parameters:
+        - `property_name` : the name of the property
+        - `values` (dict) - the initial values, *keys* vids
+        - `columnar` (bool) - if True, store the property as a NumPy typed column (see `ColumnProperty`)
+        - `dtype` : the type of the values of a columnar property, deduced from the values if None
+        """
         if property_name in self._vertex_property:
             raise PropertyError("property %s is already defined on vertices"
                                 % property_name)
+        if columnar:
+            values = ColumnProperty(self._property_rows(VertexProperty), values, dtype)
         if values is None: values = {}
         self._vertex_property[property_name] = values
-    add_vertex_property.__doc__ = IPropertyGraph.add_vertex_property.__doc__
 
     def extend_vertex_property(self, property_name, values ):
         """todo AND TO CHECK AND TEST !!"""
@@ -141,14 +343,24 @@ class PropertyGraph(IPropertyGraph, Graph):
                                 % property_name)
     remove_vertex_property.__doc__ = IPropertyGraph.remove_vertex_property.__doc__
 
-    def add_edge_property(self, property_name, values =  None):
-        """todo"""
+    def add_edge_property(self, property_name, values =  None, columnar = False, dtype = None):
+        """ Add a new property to the edges.
+
+        :Parameters:
+        - `property_name` : the name of the property
+        - `values` (dict) - the initial values, *keys* eids
+        - `columnar` (bool) - if True, store the property as a NumPy typed column (see `ColumnProperty`)
+        - `dtype` : the type of the values of a columnar property, deduced from the values if None
+        """
         if property_name in self._edge_property:
             raise PropertyError("property %s is already defined on edges"
                                 % property_name)
+        if columnar and property_name != 'edge_type':
+            values = ColumnProperty(self._property_rows(EdgeProperty), values, dtype)
         if values is None: values = {}
+        if property_name == 'edge_type' and not isinstance(values, EdgeTypeProperty):
+            values = EdgeTypeProperty(values)
         self._edge_property[property_name] = values
-    add_edge_property.__doc__ = IPropertyGraph.add_edge_property.__doc__
 
     def remove_edge_property(self, property_name):
         """todo"""
@@ -199,11 +411,28 @@ class PropertyGraph(IPropertyGraph, Graph):
         except KeyError:
             pass
 
+    def _invalidate_topology(self):
+        """ Drop the cached topology snapshots (see `to_csr`)."""
+        self._topology_cache = {}
+
+    def add_vertex(self, vid=None):
+        """todo"""
+        self._invalidate_topology()
+        return Graph.add_vertex(self, vid)
+    add_vertex.__doc__ = Graph.add_vertex.__doc__
+
+    def add_vertices(self, vids):
+        """todo"""
+        self._invalidate_topology()
+        return Graph.add_vertices(self, vids)
+    add_vertices.__doc__ = Graph.add_vertices.__doc__
+
     def remove_vertex(self, vid):
         """todo"""
         for prop in self._vertex_property.itervalues():
             prop.pop(vid, None)
         Graph.remove_vertex(self, vid)
+        self._invalidate_topology()
     remove_vertex.__doc__ = Graph.remove_vertex.__doc__
 
     def clear(self):
@@ -214,21 +443,62 @@ class PropertyGraph(IPropertyGraph, Graph):
             prop.clear()
         for prop in self._graph_property.itervalues():
             prop.clear()
+        self._property_rows(VertexProperty).clear()
+        self._property_rows(EdgeProperty).clear()
         Graph.clear(self)
+        self._invalidate_topology()
     clear.__doc__ = Graph.clear.__doc__
 
+    def add_edge(self, sid, tid, eid=None, edge_type=None):
+        """ Add an edge to the graph, see `Graph.add_edge`.
+
+        :Parameters:
+        - `edge_type` : if not None, the type of the edge, stored in the 'edge_type' edge property
+        """
+        self._invalidate_topology()
+        eid = Graph.add_edge(self, sid, tid, eid)
+        if edge_type is not None:
+            if 'edge_type' not in self._edge_property:
+                self.add_edge_property('edge_type')
+            self._edge_property['edge_type'][eid] = edge_type
+        elif eid in self._edge_property.get('edge_type', ()):
+            self._edge_type_changed(eid, _untyped, self._edge_property['edge_type'][eid])
+        return eid
+
+    def add_edges(self, sources, targets, eids=None, edge_type=None):
+        """ Add several edges to the graph in one shot, see `Graph.add_edges`.
+
+        :Parameters:
+        - `edge_type` : if not None, the type of the edges, stored in the 'edge_type' edge property
+        """
+        self._invalidate_topology()
+        eids = Graph.add_edges(self, sources, targets, eids)
+        if edge_type is not None:
+            if 'edge_type' not in self._edge_property:
+                self.add_edge_property('edge_type')
+            self._edge_property['edge_type'].update(dict.fromkeys(eids, edge_type))
+        elif len(self._edge_property.get('edge_type', ())) > 0:
+            edge_types = self._edge_property['edge_type']
+            for eid in eids:
+                if eid in edge_types:
+                    self._edge_type_changed(eid, _untyped, edge_types[eid])
+        return eids
+
     def remove_edge(self, eid):
         """todo"""
         for prop in self._edge_property.itervalues():
             prop.pop(eid, None)
         Graph.remove_edge(self, eid)
+        self._invalidate_topology()
     remove_edge.__doc__ = Graph.remove_edge.__doc__
 
     def clear_edges(self):
         """todo"""
         for prop in self._edge_property.itervalues():
             prop.clear()
+        self._property_rows(EdgeProperty).clear()
         Graph.clear_edges(self)
+        self._invalidate_topology()
     clear_edges.__doc__ = Graph.clear_edges.__doc__
 
     @staticmethod
@@ -266,7 +536,7 @@ class PropertyGraph(IPropertyGraph, Graph):
         # update properties on vertices
         for prop_name in graph.vertex_property_names():
             if prop_name not in self._vertex_property:
-                self.add_vertex_property(prop_name)
+                self.add_vertex_property(prop_name, columnar=isinstance(graph.vertex_property(prop_name), ColumnProperty))
             value_translator = graph.get_property_value_type(prop_name,VertexProperty)
 
             # import property into self. translate vid and value
@@ -275,7 +545,7 @@ class PropertyGraph(IPropertyGraph, Graph):
         # update properties on edges
         for prop_name in graph.edge_property_names():
             if prop_name not in self._edge_property:
-                self.add_edge_property(prop_name)
+                self.add_edge_property(prop_name, columnar=isinstance(graph.edge_property(prop_name), ColumnProperty))
             
             # Check what type of translation is required for value of the property
             value_translator = graph.get_property_value_type(prop_name,EdgeProperty)
@@ -365,6 +635,76 @@ class PropertyGraph(IPropertyGraph, Graph):
                 s=set([s])
         return s
 
+    def _edge_type_adjacency(self):
+        """ Return the adjacency index partitioned by edge type.
+
+        The index is built on first use from the 'edge_type' edge property, then
+        kept up to date by the property itself (see `EdgeTypeProperty`).
+
+        :Returns:
+        - `index` (dict) - *keys* edge types, *values* a tuple (in_edges, out_edges, eids) where
+          in_edges and out_edges map a vid to the set of its in (resp. out) edges of this type,
+          or None if the 'edge_type' property is not an `EdgeTypeProperty`
+        """
+        edge_types = self._edge_property.get('edge_type')
+        if not isinstance(edge_types, EdgeTypeProperty):
+            return None
+        index = self.__dict__.get('_edge_type_index')
+        if index is None or edge_types._graph is not self:
+            edge_types._graph = self
+            self._edge_type_index = index = {}
+            self._invalidate_topology()
+            for eid, edge_type in edge_types.iteritems():
+                if eid in self._edges:
+                    self._edge_type_changed(eid, _untyped, edge_type)
+        return index
+
+    def _edge_type_changed(self, eid, old_type, new_type):
+        """ Update the edge type index after the type of `eid` changed from `old_type` to `new_type`."""
+        index = self.__dict__.get('_edge_type_index')
+        if index is None or eid not in self._edges:
+            return
+        self._invalidate_topology()
+        sid, tid = self._edges[eid]
+        if old_type is not _untyped and old_type in index:
+            in_edges, out_edges, eids = index[old_type]
+            for edges, vid in ((in_edges, tid), (out_edges, sid)):
+                vid_edges = edges.get(vid)
+                if vid_edges is not None:
+                    vid_edges.discard(eid)
+                    if not vid_edges:
+                        del edges[vid]
+            eids.discard(eid)
+        if new_type is not _untyped:
+            in_edges, out_edges, eids = index.setdefault(new_type, ({}, {}, set()))
+            in_edges.setdefault(tid, set()).add(eid)
+            out_edges.setdefault(sid, set()).add(eid)
+            eids.add(eid)
+
+    def _iter_typed_edges(self, vid, edge_type, direction):
+        """ Iterate on the in (direction=0) or out (direction=1) edges of `vid` whose type is in the set `edge_type`."""
+        index = self._edge_type_adjacency()
+        if index is None:
+            edge_type_property = self._edge_property['edge_type']
+            for eid in self._vertices[vid][direction]:
+                if edge_type_property[eid] in edge_type:
+                    yield eid
+        else:
+            for etype in edge_type:
+                if etype in index:
+                    for eid in index[etype][direction].get(vid, ()):
+                        yield eid
+
+    def _iter_in_edges(self, vid, edge_type):
+        if edge_type is None:
+            return iter(self._vertices[vid][0])
+        return self._iter_typed_edges(vid, self.__to_set(edge_type), 0)
+
+    def _iter_out_edges(self, vid, edge_type):
+        if edge_type is None:
+            return iter(self._vertices[vid][1])
+        return self._iter_typed_edges(vid, self.__to_set(edge_type), 1)
+
     def in_neighbors(self, vid, edge_type=None):
         """ Return the in vertices of the vertex vid
         
@@ -375,17 +715,9 @@ class PropertyGraph(IPropertyGraph, Graph):
         :Returns:
         - `neighbors_list` : the set of parent vertices of the vertex vid
         """
-        
         if vid not in self :
             raise InvalidVertex(vid)
-        
-        if edge_type==None:
-            neighbors_list=set([self.source(eid) for eid in self._vertices[vid][0] ])
-        else:
-            edge_type=self.__to_set(edge_type) 
-            edge_type_property = self._edge_property['edge_type']
-            neighbors_list=set([self.source(eid) for eid in self._vertices[vid][0] if edge_type_property[eid] in edge_type])
-        return neighbors_list
+        return set([self._edges[eid][0] for eid in self._iter_in_edges(vid, edge_type)])
 
     def iter_in_neighbors(self, vid, edge_type=None):
         """ Return the in vertices of the vertex vid
@@ -397,7 +729,9 @@ class PropertyGraph(IPropertyGraph, Graph):
         :Returns:
         - `iterator` : an iterator on the set of parent vertices of the vertex vid
         """
-        return iter(self.in_neighbors(vid, edge_type))
+        if vid not in self :
+            raise InvalidVertex(vid)
+        return _iter_unique(self._edges[eid][0] for eid in self._iter_in_edges(vid, edge_type))
 
     def out_neighbors(self, vid, edge_type=None):
         """ Return the out vertices of the vertex vid
@@ -411,15 +745,7 @@ class PropertyGraph(IPropertyGraph, Graph):
         """
         if vid not in self :
             raise InvalidVertex(vid)
-
-        if edge_type==None:
-            neighbors_list=set([self.target(eid) for eid in self._vertices[vid][1] ])
-        else:
-            edge_type=self.__to_set(edge_type) 
-            edge_type_property = self._edge_property['edge_type']
-            neighbors_list=set([self.target(eid) for eid in self._vertices[vid][1] if edge_type_property[eid] in edge_type])
-        return neighbors_list
-
+        return set([self._edges[eid][1] for eid in self._iter_out_edges(vid, edge_type)])
 
     def iter_out_neighbors(self, vid, edge_type=None):
         """ Return the out vertices of the vertex vid
@@ -431,7 +757,9 @@ class PropertyGraph(IPropertyGraph, Graph):
         :Returns:
         - `iterator` : an iterator on the set of child vertices of the vertex vid
         """
-        return iter(self.out_neighbors(vid, edge_type))
+        if vid not in self :
+            raise InvalidVertex(vid)
+        return _iter_unique(self._edges[eid][1] for eid in self._iter_out_edges(vid, edge_type))
 
     def neighbors(self, vid, edge_type=None):
         """ Return the neighbors vertices of the vertex vid
@@ -455,8 +783,10 @@ class PropertyGraph(IPropertyGraph, Graph):
         :Returns:
         - `iterartor` : iterator on the set of neighobrs vertices of the vertex vid
         """
-        return iter(self.neighbors(vid, edge_type))
-  
+        if vid not in self :
+            raise InvalidVertex(vid)
+        return _iter_unique(chain((self._edges[eid][0] for eid in self._iter_in_edges(vid, edge_type)),
+                                  (self._edges[eid][1] for eid in self._iter_out_edges(vid, edge_type))))
 
     def in_edges(self, vid, edge_type=None):
         """ Return in edges of the vertex vid
@@ -470,14 +800,7 @@ class PropertyGraph(IPropertyGraph, Graph):
         """
         if vid not in self :
             raise InvalidVertex(vid)
-
-        if not edge_type:
-            edge_list=set([eid for eid in self._vertices[vid][0]])
-        else:
-            edge_type=self.__to_set(edge_type)
-            edge_type_property = self._edge_property['edge_type']
-            edge_list=set([eid for eid in self._vertices[vid][0] if edge_type_property[eid] in edge_type])
-        return  edge_list
+        return set(self._iter_in_edges(vid, edge_type or None))
         
     def iter_in_edges(self, vid, edge_type=None):
         """ Return in edges of the vertex vid
@@ -489,8 +812,9 @@ class PropertyGraph(IPropertyGraph, Graph):
         :Returns:
         - `iterator` : an iterator on the set of the in edges of the vertex vid
         """  
-        return iter(self.in_edges(vid, edge_type))
-
+        if vid not in self :
+            raise InvalidVertex(vid)
+        return self._iter_in_edges(vid, edge_type or None)
 
     def out_edges(self, vid, edge_type=None):
         """ Return out edges of the vertex vid
@@ -504,14 +828,7 @@ class PropertyGraph(IPropertyGraph, Graph):
         """
         if vid not in self :
             raise InvalidVertex(vid)
-        
-        if edge_type==None:
-            edge_list=set([eid for eid in self._vertices[vid][1]])
-        else:
-            edge_type=self.__to_set(edge_type)
-            edge_type_property = self._edge_property['edge_type']
-            edge_list=set([eid for eid in self._vertices[vid][1] if edge_type_property[eid] in edge_type])
-        return  edge_list
+        return set(self._iter_out_edges(vid, edge_type))
 
     def iter_out_edges(self, vid, edge_type=None):
         """ Return in edges of the vertex vid
@@ -523,8 +840,9 @@ class PropertyGraph(IPropertyGraph, Graph):
         :Returns:
         - `iterator` : an iterator on the set of the in edges of the vertex vid
         """  
-        return iter(self.out_edges(vid, edge_type))
-
+        if vid not in self :
+            raise InvalidVertex(vid)
+        return self._iter_out_edges(vid, edge_type)
 
     def edges(self, vid=None, edge_type=None):
         """ Return edges of the vertex vid
@@ -532,16 +850,20 @@ class PropertyGraph(IPropertyGraph, Graph):
         
         :Parameters:
         - `vid` : a vertex id
-        - `edges_type` : type of edges we want to consider
+        - `edges_type` : type of edges we want to consider (can be a set)
 
         :Returns:
         - `edge_list` : the set of the edges of the vertex vid
         """
         if vid==None:
-            if edge_type is not None:
-                return set([eid for eid in self._edges.keys() if self.edge_property('edge_type')[eid] == edge_type])
-            else:
-                return set([eid for eid in self._edges.keys()])
+            if edge_type is None:
+                return set(self._edges.iterkeys())
+            edge_type = self.__to_set(edge_type)
+            index = self._edge_type_adjacency()
+            if index is None:
+                edge_type_property = self._edge_property['edge_type']
+                return set([eid for eid in self._edges.iterkeys() if edge_type_property[eid] in edge_type])
+            return set().union(*[index[etype][2] for etype in edge_type if etype in index])
         return self.out_edges(vid, edge_type) | self.in_edges(vid, edge_type)
 
     def iter_edges(self, vid, edge_type=None):
@@ -555,7 +877,11 @@ class PropertyGraph(IPropertyGraph, Graph):
         :Returns:
         - `iterator` : an iterator on the set of the edges of the vertex vid
         """  
-        return iter(self.edges(vid, edge_type))
+        if vid is None:
+            return iter(self.edges(vid, edge_type))
+        if vid not in self :
+            raise InvalidVertex(vid)
+        return _iter_unique(chain(self._iter_out_edges(vid, edge_type), self._iter_in_edges(vid, edge_type)))
 
     def neighborhood(self, vid, max_distance=1, edge_type=None):
         """ Return the neighborhood of the vertex vid at distance max_distance (the disc, not the circle)
@@ -566,8 +892,7 @@ class PropertyGraph(IPropertyGraph, Graph):
         :Returns:
         - `neighbors_list` : the set of the vertices at distance below max_distance of the vertex vid (including vid)
         """
-        dist=self.topological_distance(vid, edge_type=edge_type, max_depth=max_distance, full_dict=False)
-        return set(dist.keys())
+        return set(self._bounded_bfs(vid, edge_type, max_distance))
 
     def iter_neighborhood(self, vid, n, edge_type=None):
         """ Return the neighborhood of the vertex vid at distance n (the disc, not the circle)
@@ -580,14 +905,74 @@ class PropertyGraph(IPropertyGraph, Graph):
         """
         return iter(self.neighborhood(vid, n, edge_type))    
 
+    def neighborhoods(self, vids=None, max_distance=1, edge_type=None):
+        """ Return the neighborhoods of several vertices at distance max_distance (the discs, not the circles)
+
+        All the queries are answered at once by products of sparse matrices
+        on the adjacency returned by `to_csr`.
 
-    def topological_distance(self, vid, edge_type = None, edge_dist = lambda x,y : 1, max_depth=float('inf'), full_dict=True, return_inf = True):
+        :Parameters:
+        - `vids` : a list of vertex ids, all the vertices if None
+        - `max_distance` : the radius of the neighborhoods, can be float('inf')
+        - `edge_type` : type of edges we want to consider (can be a set)
+
+        :Returns:
+        - `neighborhoods` (dict) - *keys* vertex ids, *values* the set of the vertices at
+          distance below max_distance of the vertex (including itself)
+        """
+        from scipy.sparse import csr_matrix
+
+        adjacency, all_vids = self.to_csr(edge_type, oriented=False)
+        if vids is None:
+            vids = all_vids
+        vids = np.unique(np.asarray(list(vids), dtype=int))
+        rows = np.searchsorted(all_vids, vids)
+        if len(vids) > 0 and ((rows >= len(all_vids)).any() or (all_vids[np.minimum(rows, len(all_vids)-1)] != vids).any()):
+            raise InvalidVertex(vids[np.in1d(vids, all_vids, invert=True)][0])
+
+        k = len(vids)
+        reached = csr_matrix((np.ones(k, dtype=np.int8), (np.arange(k), rows)), shape=(k, len(all_vids)))
+        depth = 0
+        while depth < max_distance:
+            nb_reached = reached.nnz
+            reached = reached + reached*adjacency
+            reached.data[:] = 1
+            depth += 1
+            if reached.nnz == nb_reached:
+                break
+
+        return dict((vid, set(all_vids[reached.indices[reached.indptr[i]:reached.indptr[i+1]]].tolist()))
+                    for i, vid in enumerate(vids.tolist()))
+
+    def _bounded_bfs(self, vid, edge_type=None, max_depth=float('inf')):
+        """ Return the distances from `vid` with unit edge costs, only walking through the vertices within `max_depth`.
+
+        :Returns:
+        - `dist_dict` : a dictionary of the distances of the reached vertices, key : vid, value : distance
+        """
+        if vid not in self :
+            raise InvalidVertex(vid)
+        dist = {vid : 0}
+        frontier = [vid]
+        depth = 0
+        while frontier and depth + 1 < max_depth + 1:
+            depth += 1
+            next_frontier = []
+            for actual_vid in frontier:
+                for neighb in self.iter_neighbors(actual_vid, edge_type):
+                    if neighb not in dist:
+                        dist[neighb] = depth
+                        next_frontier.append(neighb)
+            frontier = next_frontier
+        return dist
+
+    def topological_distance(self, vid, edge_type = None, edge_dist = None, max_depth=float('inf'), full_dict=True, return_inf = True):
         """ Return the distances of each vertices from the vertex `vid` according a cost function
         
         :Parameters:
         - `vid` (int) - a vertex id
         - `edges_type` (str) - type of edges we want to consider e.g. 's' or 't'
-        - `edge_dist` (function) - the cost function
+        - `edge_dist` (function) - the cost function f(vid1, vid2), if None (default) each edge costs 1
         - `max_depth` (float) - the maximum depth that we want to reach
         - `full_dict` (bool) - if True this function will return the entire dictionary (with inf values)
         - `return_inf` (bool) - if True (default) return 'inf' values, else 'nan'.
@@ -595,46 +980,30 @@ class PropertyGraph(IPropertyGraph, Graph):
         :Returns:
         - `dist_dict` : a dictionary of the distances, key : vid, value : distance
         """
-        dist={}
-        reduced_dist={}
-        reduced_dist[vid]=0
-        Q=[]
-
-        infinite_distance = float('inf')
-        for k in self._vertices.iterkeys():
-            dist[k] = infinite_distance
-            heappush(Q, (dist[k], k))
-
-        dist[vid]=0
-        heappush(Q, (dist[vid], vid))
-        treated=set()
-        modif=True
-        n = self.nb_vertices()
-        while (len(treated)!=n and modif):
-            modif = False
-            actualVid = heappop(Q)
-            while actualVid[1] in treated and actualVid[0] == infinite_distance:
-                actualVid = heappop(Q)
-
-            if actualVid[0] != infinite_distance:
-                actualVid = actualVid[1]
-                treated.add(actualVid)
-            
-                for neighb in self.iter_neighbors(actualVid, edge_type):
-                    dist_neighb = dist[neighb]
-                    if (((dist_neighb == infinite_distance) or (dist_neighb > dist[actualVid] + edge_dist(neighb, actualVid)))
-                          and (dist[actualVid] + edge_dist(neighb, actualVid) < max_depth+1 ) ):
-                        
-                        dist_neighb = dist[actualVid] + edge_dist(neighb, actualVid)
-                        dist[neighb] = dist_neighb
+        if edge_dist is None:
+            reduced_dist = self._bounded_bfs(vid, edge_type, max_depth)
+        else:
+            # Dijkstra, only the reached vertices enter the queue
+            reduced_dist = {vid : 0}
+            Q = [(0, vid)]
+            treated = set()
+            while Q:
+                actual_dist, actual_vid = heappop(Q)
+                if actual_vid in treated:
+                    continue
+                treated.add(actual_vid)
+                for neighb in self.iter_neighbors(actual_vid, edge_type):
+                    dist_neighb = actual_dist + edge_dist(neighb, actual_vid)
+                    if dist_neighb < max_depth+1 and dist_neighb < reduced_dist.get(neighb, dist_neighb+1):
                         reduced_dist[neighb] = dist_neighb
                         heappush(Q, (dist_neighb, neighb))
-                    modif = True
-        #~ return (reduced_dist, dist)[full_dict], Q
-        if not return_inf:
-            dist = dict( [(k,(v if v != infinite_distance else np.nan)) for k,v in dist.iteritems()] )
 
-        return (reduced_dist, dist)[full_dict]
+        if not full_dict:
+            return reduced_dist
+        infinite_distance = float('inf') if return_inf else np.nan
+        dist = dict.fromkeys(self._vertices.iterkeys(), infinite_distance)
+        dist.update(reduced_dist)
+        return dist
 
 
     def adjacency_matrix(self, edge_type = None, edge_dist = 1, no_edge_val = 0, oriented = True, reflexive = True, reflexive_value = 0):
@@ -667,15 +1036,146 @@ class PropertyGraph(IPropertyGraph, Graph):
             for i in range(n) : adjacency_matrix[i, i] = reflexive_value(self, i, i)
         return adjacency_matrix
 
-    def floyd_warshall(self, edge_type = None, edge_dist = 1, oriented = False):
-        adjacency_matrix = self.adjacency_matrix(edge_type, edge_dist, float('inf'), oriented)
-        n = self.nb_vertices()
-        for k in range(n):
-            for i in range(n):
-                for j in range(n):
-                    adjacency_matrix[i, j]=min(adjacency_matrix[i, j], 
-                                               adjacency_matrix[i, k] + adjacency_matrix[k, j])
-        return adjacency_matrix
+    def _topology_snapshot(self, edge_type = None):
+        """ Return a compact, cached, view of the edges of type `edge_type`.
+
+        Vertices are numbered by increasing vid.
+
+        :Returns:
+        - `vids` (numpy.array) - the sorted vids, i.e. the vid associated to each row
+        - `rows`, `cols` (numpy.array) - the row indices of the source and target of each edge
+        - `eids` (numpy.array) - the edge ids
+        """
+        key = None if edge_type is None else frozenset(self.__to_set(edge_type))
+        # claim the edge type index first: it drops the snapshots built without it
+        index = None if key is None else self._edge_type_adjacency()
+        cache = self.__dict__.setdefault('_topology_cache', {})
+        try:
+            return cache[('snapshot', key)]
+        except KeyError:
+            pass
+
+        vids = np.array(sorted(self._vertices.iterkeys()), dtype=int)
+        vid_to_row = dict(zip(vids, xrange(len(vids))))
+        if key is None:
+            eids = list(self._edges.iterkeys())
+        elif index is not None:
+            eids = list(self.edges(edge_type=set(key)))
+        else:
+            edge_type_property = self._edge_property['edge_type']
+            eids = [eid for eid in self._edges.iterkeys() if edge_type_property.get(eid) in key]
+        rows = np.array([vid_to_row[self._edges[eid][0]] for eid in eids], dtype=int)
+        cols = np.array([vid_to_row[self._edges[eid][1]] for eid in eids], dtype=int)
+        snapshot = vids, rows, cols, np.array(eids, dtype=int)
+        cache[('snapshot', key)] = snapshot
+        return snapshot
+
+    def to_csr(self, edge_type = None, weight = None, oriented = True):
+        """ Return the adjacency of the graph as a scipy.sparse.csr_matrix.
+
+        Rows and columns follow the vids sorted in increasing order, so that the
+        row of a vid (or of an array of vids) is `numpy.searchsorted(vids, vid)`.
+        When several edges link the same pair of vertices only the smallest
+        weight is kept. Unweighted matrices are cached until the topology changes.
+
+        :Parameters:
+        - `edge_type` : type of edges we want to consider (can be a set)
+        - `weight` : None (1 for each edge), a number, the name of an edge property
+          or a cost function f(graph, vid1, vid2)
+        - `oriented` : if False, an edge j -> i is added for each edge i -> j
+
+        :Returns:
+        - `matrix` (scipy.sparse.csr_matrix) - the NxN adjacency matrix
+        - `vids` (numpy.array) - the vid associated to each row and column
+        """
+        from scipy.sparse import csr_matrix
+
+        if weight == 1:
+            weight = None
+        vids, rows, cols, eids = self._topology_snapshot(edge_type)
+        cache_key = None
+        if weight is None:
+            cache_key = ('csr', None if edge_type is None else frozenset(self.__to_set(edge_type)), oriented)
+            try:
+                return self._topology_cache[cache_key], vids
+            except KeyError:
+                pass
+
+        if weight is None:
+            weights = np.ones(len(eids), dtype=float)
+            reverse_weights = weights
+        elif isinstance(weight, basestring):
+            edge_weights = self.edge_property(weight)
+            weights = np.array([edge_weights[eid] for eid in eids], dtype=float)
+            reverse_weights = weights
+        elif callable(weight):
+            weights = np.array([weight(self, vids[i], vids[j]) for i, j in zip(rows, cols)], dtype=float)
+            if not oriented:
+                reverse_weights = np.array([weight(self, vids[j], vids[i]) for i, j in zip(rows, cols)], dtype=float)
+        else:
+            weights = np.ones(len(eids), dtype=float)*weight
+            reverse_weights = weights
+        if not oriented:
+            rows, cols = np.concatenate([rows, cols]), np.concatenate([cols, rows])
+            weights = np.concatenate([weights, reverse_weights])
+
+        # keep the smallest weight of parallel edges
+        if len(weights) > 0:
+            order = np.lexsort((weights, cols, rows))
+            rows, cols, weights = rows[order], cols[order], weights[order]
+            first = np.ones(len(rows), dtype=bool)
+            first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+            rows, cols, weights = rows[first], cols[first], weights[first]
+        n = len(vids)
+        matrix = csr_matrix((weights, (rows, cols)), shape=(n, n))
+
+        if cache_key is not None:
+            self._topology_cache[cache_key] = matrix
+        return matrix, vids
+
+    def floyd_warshall(self, edge_type = None, edge_dist = 1, oriented = False, dtype = np.float64, max_depth = None, method = 'auto'):
+        """ Return the matrix of the shortest path distances between all pairs of vertices.
+
+        Rows and columns follow the vids sorted in increasing order (i.e. the
+        matrix is indexed by vid when vids are 0..n-1). Two engines are available:
+        a vectorized row relaxation on a dense matrix, suited to dense graphs, and
+        repeated Dijkstra (or BFS for unit costs) searches on the sparse adjacency.
+
+        :Parameters:
+        - `edge_type` : type of edges we want to consider
+        - `edge_dist` : cost or cost function f(graph, vid1, vid2) of an edge, default : 1
+        - `oriented` : if False, edges can be travelled in both directions
+        - `dtype` : the type of the returned distances, e.g. numpy.float32 to halve memory
+        - `max_depth` (float) - if not None, only the distances below `max_depth` are computed
+          and a scipy.sparse.csr_matrix is returned; missing entries are farther than `max_depth`
+        - `method` (str) - 'dense', 'sparse' or 'auto' (chosen from the density of the graph)
+
+        :Returns:
+        - `numpy.array` : a NxN matrix of distances (inf when no path exists)
+        """
+        adjacency, vids = self.to_csr(edge_type, edge_dist, oriented)
+        adjacency = adjacency.tocoo()
+        rows, cols, weights = adjacency.row, adjacency.col, adjacency.data
+        n = len(vids)
+
+        if method == 'auto':
+            density = float(len(weights))/max(n*n, 1)
+            method = 'dense' if density > _DENSE_GRAPH_DENSITY else 'sparse'
+        if max_depth is not None:
+            method = 'sparse'
+
+        if method == 'dense':
+            distances = np.empty((n, n), dtype=dtype)
+            distances.fill(np.inf)
+            distances[rows, cols] = weights
+            distances[np.arange(n), np.arange(n)] = 0
+            for k in xrange(n):
+                np.minimum(distances, distances[:, k, np.newaxis] + distances[np.newaxis, k, :], out=distances)
+            return distances
+        elif method == 'sparse':
+            return _sparse_all_pairs(n, rows, cols, weights, dtype, max_depth)
+        else:
+            raise ValueError("unknown method %s, should be 'dense', 'sparse' or 'auto'" % method)
 
     def _add_vertex_to_domain(self, vids, domain_name):
         """ Add a set of vertices to a domain.
@@ -790,9 +1290,11 @@ class PropertyGraph(IPropertyGraph, Graph):
         if not domain_name in self._graph_property:
             raise PropertyError("property %s is not defined on graph"
                                 % domain_name)
-        domain_sub_graph=Graph.sub_graph(self, self._graph_property[domain_name])
-        distances=domain_sub_graph.topological_distance(domain_sub_graph._vertices.keys()[0], edge_type=edge_type)
-        return not float('inf') in distances.values()
+        from scipy.sparse.csgraph import connected_components
+        adjacency, vids = self.to_csr(edge_type, oriented=False)
+        rows = np.searchsorted(vids, np.unique(self._graph_property[domain_name]))
+        nb_components, labels = connected_components(adjacency[rows][:, rows], directed=False)
+        return nb_components == 1
 
 
     def to_networkx(self):
@@ -862,6 +1364,9 @@ class PropertyGraph(IPropertyGraph, Graph):
                 if k != 'eid':
                     ep.setdefault(k,{})[eid] = v
 
+        if 'edge_type' in ep and not isinstance(ep['edge_type'], EdgeTypeProperty):
+            ep['edge_type'] = EdgeTypeProperty(ep['edge_type'])
+
         gp = self._graph_property
         gp.update(graph.graph)
 
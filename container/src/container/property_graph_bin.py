@@ -0,0 +1,316 @@
+# -*- python -*-
+#
+#       OpenAlea.Container
+#
+#       Copyright 2006-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite: http://openalea.gforge.inria.fr
+#
+################################################################################
+"""
+This module provide a binary, versioned, file format for PropertyGraph and
+TemporalPropertyGraph.
+
+The file starts with a fixed size preamble (magic string, format version and
+header size) followed by a JSON header describing the sections of the file.
+Each section is a raw array aligned on 64 bytes:
+ - the topology is stored as int arrays (vids, eids, sources, targets);
+ - numerical properties are stored as typed columns aligned on the sorted
+   vids (or eids), with a mask of the defined values if needed;
+ - other properties, the graph properties and the extra attributes of the
+   graph (e.g. `nb_time_points` of a TemporalPropertyGraph) are pickled.
+
+Columns can be read with `numpy.memmap`, so that a single property can be
+read (`read_property_column`) without loading the rest of the file.
+"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import json, struct
+import cPickle as pickle
+import numpy as np
+
+from column_property import ColumnProperty
+from property_graph import VertexProperty, EdgeProperty
+
+MAGIC = "OAGRAPH\0"
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct("<8sII")
+_ALIGN = 64
+_NUMERIC = (bool, int, long, float, np.number, np.bool_)
+# attributes rebuilt from the sections of the file or on demand
+_STRUCTURE = set(['_vertices', '_edges', '_vertex_property', '_edge_property', '_graph_property',
+                  '_topology_cache', '_edge_type_index', '_vertex_rows', '_edge_rows'])
+
+
+def _json_name(name):
+    return isinstance(name, (basestring, int, long)) and not isinstance(name, bool)
+
+
+def _column(prop, ids):
+    """ Return (values, defined) arrays aligned on `ids` if `prop` is numerical, else None."""
+    if isinstance(prop, ColumnProperty):
+        values = prop.values_array()
+        if len(values) > 0 and values.dtype == object:
+            return None
+        keys = prop.keys_array()
+    else:
+        keys = prop.keys()
+        values = prop.values()
+        if not all(isinstance(v, _NUMERIC) for v in values):
+            if not all(isinstance(v, np.ndarray) for v in values):
+                return None
+        try:
+            values = np.asarray(values)
+        except ValueError:
+            return None
+        if values.dtype.kind not in "biufc" or len(values) != len(keys):
+            return None
+    keys = np.asarray(keys) if len(keys) > 0 else np.zeros(0, int)
+    if keys.ndim != 1 or keys.dtype.kind not in "iu":
+        return None
+    # keys that are not ids of the elements are only kept by the pickle fallback
+    rows = np.searchsorted(ids, keys)
+    if (rows >= len(ids)).any() or (ids[np.minimum(rows, len(ids)-1)] != keys).any():
+        return None
+    column = np.zeros((len(ids),)+values.shape[1:], dtype=values.dtype)
+    column[rows] = values
+    defined = None
+    if len(keys) < len(ids):
+        defined = np.zeros(len(ids), dtype=bool)
+        defined[rows] = True
+    return column, defined
+
+
+class _Writer(object):
+    def __init__(self):
+        self.sections = []
+        self.chunks = []
+        self.size = 0
+
+    def add(self, data):
+        """ Add a section (an array or a picklable object), return its index."""
+        if isinstance(data, np.ndarray):
+            data = np.ascontiguousarray(data)
+            section = {"dtype": data.dtype.str, "shape": list(data.shape)}
+            raw = data.tostring()
+        else:
+            section = {"pickle": True}
+            raw = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        section["offset"], section["size"] = self.size, len(raw)
+        padding = -len(raw) % _ALIGN
+        self.chunks.append(raw + "\0"*padding)
+        self.size += len(raw) + padding
+        self.sections.append(section)
+        return len(self.sections)-1
+
+    def add_properties(self, properties, ids):
+        entries = []
+        for name, prop in properties.iteritems():
+            column = _column(prop, ids) if _json_name(name) else None
+            if column is None:
+                entries.append({"kind": "pickle", "section": self.add((name, dict(prop)))})
+            else:
+                values, defined = column
+                entries.append({"kind": "column", "name": name,
+                                "values": self.add(values),
+                                "defined": None if defined is None else self.add(defined)})
+        return entries
+
+    def write(self, filename, magic, version, header):
+        """ Write the preamble, the JSON `header` (completed with the sections) and the sections."""
+        header["sections"] = self.sections
+        header = json.dumps(header)
+        header += " "*(-(_PREAMBLE.size+len(header)) % _ALIGN)
+        f = open(filename, 'wb')
+        f.write(_PREAMBLE.pack(magic, version, len(header)))
+        f.write(header)
+        for chunk in self.chunks:
+            f.write(chunk)
+        f.close()
+
+
+def write_property_graph(filename, graph):
+    """
+    Write a PropertyGraph (or a TemporalPropertyGraph) in a binary file.
+
+    :Parameters:
+    - `filename` (str) - the name of the file
+    - `graph` (PropertyGraph) - the graph to save
+    """
+    writer = _Writer()
+    vids = np.array(sorted(graph.vertices()), dtype=int)
+    eids = np.array(sorted(graph.edges()), dtype=int)
+    header = {"class": [type(graph).__module__, type(graph).__name__],
+              "vertices": writer.add(vids),
+              "edges": writer.add(eids),
+              "sources": writer.add(np.array([graph.source(eid) for eid in eids.tolist()], dtype=int)),
+              "targets": writer.add(np.array([graph.target(eid) for eid in eids.tolist()], dtype=int)),
+              "vertex_properties": writer.add_properties(graph._vertex_property, vids),
+              "edge_properties": writer.add_properties(graph._edge_property, eids)}
+    extra = dict((k, v) for k, v in graph.__dict__.iteritems() if k not in _STRUCTURE)
+    header["graph"] = writer.add((graph._graph_property, extra))
+    writer.write(filename, MAGIC, FORMAT_VERSION, header)
+
+
+class _Reader(object):
+    def __init__(self, filename, mmap=True, magic=MAGIC, format_version=FORMAT_VERSION, kind="graph"):
+        self.filename = filename
+        self.mmap = mmap
+        f = open(filename, 'rb')
+        file_magic, version, header_size = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+        if file_magic != magic:
+            f.close()
+            raise IOError("%s is not a binary %s file" % (filename, kind))
+        if version > format_version:
+            f.close()
+            raise IOError("%s has format version %d, only versions up to %d are supported"
+                          % (filename, version, format_version))
+        self.header = json.loads(f.read(header_size))
+        self.data_offset = _PREAMBLE.size + header_size
+        self.file = f
+
+    def close(self):
+        self.file.close()
+
+    def get(self, index):
+        """ Return the content of a section: a numpy array (memmap if possible) or the unpickled object."""
+        section = self.header["sections"][index]
+        offset = self.data_offset + section["offset"]
+        if section.get("pickle"):
+            self.file.seek(offset)
+            return pickle.loads(self.file.read(section["size"]))
+        dtype, shape = np.dtype(str(section["dtype"])), tuple(section["shape"])
+        if self.mmap and section["size"] > 0:
+            return np.memmap(self.filename, dtype=dtype, mode='c', offset=offset, shape=shape)
+        self.file.seek(offset)
+        return np.frombuffer(self.file.read(section["size"]), dtype=dtype).reshape(shape).copy()
+
+    def entries(self, element):
+        return self.header[element+"_properties"]
+
+    def find(self, element, property_name):
+        for entry in self.entries(element):
+            if entry["kind"] == "column" and _name(entry["name"]) == property_name:
+                return entry
+        for entry in self.entries(element):
+            if entry["kind"] == "pickle":
+                name, values = self.get(entry["section"])
+                if name == property_name:
+                    return entry
+        raise KeyError(property_name)
+
+
+def _name(name):
+    """ json gives unicode strings, go back to str when possible."""
+    if isinstance(name, unicode):
+        try:
+            return str(name)
+        except UnicodeEncodeError:
+            pass
+    return name
+
+
+def _to_dict(ids, values, defined):
+    if defined is not None:
+        ids, values = ids[defined], values[defined]
+    if values.ndim == 1:
+        return dict(zip(ids.tolist(), values.tolist()))
+    return dict(zip(ids.tolist(), np.array(values)))
+
+
+def read_property_column(filename, property_name, element="vertex"):
+    """
+    Read a numerical property without loading the graph.
+
+    :Parameters:
+    - `filename` (str) - the name of the file
+    - `property_name` - the name of the property
+    - `element` (str) - 'vertex' or 'edge'
+
+    :Returns:
+    - `ids` (numpy.array) - the vids (or eids) having a value
+    - `values` (numpy.array) - their values, memory mapped when all the elements have a value
+    """
+    reader = _Reader(filename)
+    try:
+        entry = reader.find(element, property_name)
+        if entry["kind"] != "column":
+            raise ValueError("property %s is not stored as a column" % property_name)
+        ids = reader.get(reader.header["vertices" if element == "vertex" else "edges"])
+        values = reader.get(entry["values"])
+        if entry["defined"] is not None:
+            defined = np.asarray(reader.get(entry["defined"]))
+            ids, values = ids[defined], values[defined]
+    finally:
+        reader.close()
+    return ids, values
+
+
+def read_property_graph(filename, vertex_properties=None, edge_properties=None, lazy=False):
+    """
+    Read a PropertyGraph (or a TemporalPropertyGraph) written by `write_property_graph`.
+
+    :Parameters:
+    - `filename` (str) - the name of the file
+    - `vertex_properties`, `edge_properties` (list) - names of the properties to load, all of them if None
+    - `lazy` (bool) - if True, numerical properties are returned as ColumnProperty
+      on memory mapped columns, read from the disk when accessed. Else they are dict.
+
+    :Returns:
+    - the graph, of the class it was saved from
+    """
+    reader = _Reader(filename, mmap=lazy)
+    try:
+        header = reader.header
+        module, class_name = header["class"]
+        graph_class = getattr(__import__(str(module), fromlist=[str(class_name)]), str(class_name))
+        graph = graph_class()
+
+        vids = reader.get(header["vertices"])
+        eids = reader.get(header["edges"])
+        graph.add_vertices(vids.tolist())
+        graph.add_edges(reader.get(header["sources"]).tolist(), reader.get(header["targets"]).tolist(),
+                        eids.tolist())
+
+        for element, ids, selection, property_type in [("vertex", vids, vertex_properties, VertexProperty),
+                                                       ("edge", eids, edge_properties, EdgeProperty)]:
+            properties = getattr(graph, "_%s_property" % element)
+            rows = None
+            for entry in reader.entries(element):
+                if entry["kind"] == "column":
+                    name = _name(entry["name"])
+                    if selection is not None and name not in selection:
+                        continue
+                    values = reader.get(entry["values"])
+                    defined = None if entry["defined"] is None else reader.get(entry["defined"])
+                    if lazy and len(ids) > 0:
+                        if rows is None:
+                            rows = graph._property_rows(property_type)
+                            rows.rows(ids, create=True)
+                        prop = ColumnProperty.from_arrays(rows, values, defined)
+                    else:
+                        prop = _to_dict(np.asarray(ids), np.asarray(values),
+                                        None if defined is None else np.asarray(defined))
+                else:
+                    name, prop = reader.get(entry["section"])
+                    if selection is not None and name not in selection:
+                        continue
+                properties.pop(name, None)
+                if element == "vertex":
+                    graph.add_vertex_property(name, prop)
+                else:
+                    graph.add_edge_property(name, prop)
+
+        graph_properties, extra = reader.get(header["graph"])
+        graph._graph_property = graph_properties
+        graph.__dict__.update(extra)
+    finally:
+        reader.close()
+    graph._invalidate_topology()
+    return graph
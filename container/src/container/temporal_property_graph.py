@@ -21,8 +21,161 @@ __revision__ = " $Id$ "
 
 import warnings, numpy as np
 from property_graph import *
+from utils.csr import csr_gather as _csr_gather
+
+from vplants.tissue_analysis.temporal_graph_analysis import translate_keys_Graph2Image
+
+
+class _LineageIndex(object):
+    """
+    Array based index of the temporal edges (lineage) of a TemporalPropertyGraph.
+
+    Vertices are refered to by their row in the sorted array of vids. The index
+    stores the time point of each vertex and the children and parents of each
+    vertex in CSR form. When the lineage is a forest (at most one parent per
+    vertex, and children at the next time point), it also stores the Euler-tour
+    interval [tin, tout) of each vertex: the descendants of a vertex at a given
+    time point are then a contiguous slice of this time point rows sorted by tin.
+    """
+    def __init__(self, vids, times, rows, cols):
+        nb = len(vids)
+        self.vids = vids
+        self.times = times
+        if len(rows) > 0:
+            pairs = np.unique(rows*nb+cols)
+            rows, cols = pairs//nb, pairs%nb
+        self.child_ptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=nb))]).astype(int)
+        self.child_rows = cols
+        order = np.argsort(cols, kind='mergesort')
+        self.parent_ptr = np.concatenate([[0], np.cumsum(np.bincount(cols, minlength=nb))]).astype(int)
+        self.parent_rows = rows[order]
+
+        self.is_forest = bool(np.all(times >= 0)
+                              and np.all(np.diff(self.parent_ptr) <= 1)
+                              and np.all(times[cols] == times[rows]+1))
+        self.level_rows = {}
+        for t in np.unique(times).tolist():
+            self.level_rows[t] = np.flatnonzero(times == t)
+        if self.is_forest:
+            self._euler_tour(rows, cols)
+
+    def _euler_tour(self, rows, cols):
+        """ Compute the Euler-tour intervals of the lineage forest, level by level."""
+        nb = len(self.vids)
+        parent = np.full(nb, -1, dtype=int)
+        parent[cols] = rows
+        self.parent = parent
+        levels = sorted(self.level_rows)
+        # subtree sizes, from the last time point to the first one
+        size = np.ones(nb, dtype=int)
+        for t in reversed(levels):
+            level = self.level_rows[t]
+            level = level[parent[level] >= 0]
+            np.add.at(size, parent[level], size[level])
+        # preorder position of each vertex, from the first time point to the last one
+        tin = np.zeros(nb, dtype=int)
+        roots = np.flatnonzero(parent < 0)
+        roots = roots[np.lexsort((roots, self.times[roots]))]
+        tin[roots] = np.cumsum(size[roots]) - size[roots]
+        for t in levels:
+            level = self.level_rows[t]
+            level = level[parent[level] >= 0]
+            if len(level) == 0:
+                continue
+            level = level[np.lexsort((level, tin[parent[level]]))]
+            offset = np.cumsum(size[level]) - size[level]
+            first = np.concatenate([[True], parent[level][1:] != parent[level][:-1]])
+            group_start = offset[first][np.cumsum(first)-1]
+            tin[level] = tin[parent[level]] + 1 + offset - group_start
+        self.tin, self.tout = tin, tin + size
+        for t, level in self.level_rows.iteritems():
+            self.level_rows[t] = level[np.argsort(tin[level])]
+        self.level_tin = dict((t, tin[level]) for t, level in self.level_rows.iteritems())
+
+    def rows(self, vids):
+        """ Return the rows of `vids`, raise InvalidVertex for unknown vids."""
+        vids = np.asarray(vids, dtype=int).reshape(-1)
+        rows = np.searchsorted(self.vids, vids)
+        unknown = (rows >= len(self.vids))
+        unknown[~unknown] = self.vids[rows[~unknown]] != vids[~unknown]
+        if unknown.any():
+            raise InvalidVertex(vids[unknown][0])
+        return rows
+
+    def reach(self, rows, n, descendants=True):
+        """ Return the rows at a distance lower or equal to `n` of `rows` (any distance if `n` is None)."""
+        ptr, targets = (self.child_ptr, self.child_rows) if descendants else (self.parent_ptr, self.parent_rows)
+        seen = np.unique(rows)
+        frontier, levels = seen, [seen]
+        step = 0
+        while len(frontier) > 0 and (n is None or step < n):
+            frontier = np.unique(_csr_gather(frontier, ptr, targets))
+            if not self.is_forest:
+                frontier = np.setdiff1d(frontier, seen, assume_unique=True)
+                seen = np.union1d(seen, frontier)
+            levels.append(frontier)
+            step += 1
+        return np.unique(np.concatenate(levels))
+
+    def rank_rows(self, row, rank, descendants=True):
+        """ Return the rows of the relatives of `row` at exactly `rank`."""
+        if rank <= 0:
+            return np.zeros(0, dtype=int)
+        if not self.is_forest:
+            return np.setdiff1d(self.reach([row], rank, descendants), self.reach([row], rank-1, descendants))
+        if not descendants:
+            for i in xrange(rank):
+                row = self.parent[row]
+                if row < 0:
+                    return np.zeros(0, dtype=int)
+            return np.array([row])
+        t = self.times[row] + rank
+        if t not in self.level_rows:
+            return np.zeros(0, dtype=int)
+        level_tin = self.level_tin[t]
+        start, stop = np.searchsorted(level_tin, [self.tin[row], self.tout[row]])
+        return self.level_rows[t][start:stop]
+
+    def nb_rank_relatives(self, rows, rank, descendants=True):
+        """ Return the number of relatives at exactly `rank` of each row of `rows`."""
+        rows = np.asarray(rows, dtype=int)
+        if rank <= 0:
+            return np.zeros(len(rows), dtype=int)
+        if not self.is_forest:
+            return np.array([len(self.rank_rows(row, rank, descendants)) for row in rows], dtype=int)
+        if not descendants:
+            relatives = rows
+            for i in xrange(rank):
+                relatives = np.where(relatives >= 0, self.parent[relatives], -1)
+            return (relatives >= 0).astype(int)
+        counts = np.zeros(len(rows), dtype=int)
+        targets = self.times[rows] + rank
+        for t in np.unique(targets).tolist():
+            if t not in self.level_rows:
+                continue
+            selected = targets == t
+            level_tin = self.level_tin[t]
+            counts[selected] = (np.searchsorted(level_tin, self.tout[rows[selected]])
+                                - np.searchsorted(level_tin, self.tin[rows[selected]]))
+        return counts
+
+    def all_rank_relatives(self, rows, rank, descendants=True):
+        """
+        Return a boolean array telling if all the relatives of each row of `rows`
+        at ranks 0, ..., `rank`-1 have a relative at the next rank, i.e. if every
+        branch of its lineage reaches `rank`.
+        """
+        rows = np.asarray(rows, dtype=int)
+        if rank <= 0:
+            return np.ones(len(rows), dtype=bool)
+        all_rows = np.arange(len(self.vids))
+        dead_ends = all_rows[self.nb_rank_relatives(all_rows, 1, descendants) == 0]
+        if len(dead_ends) == 0:
+            return np.ones(len(rows), dtype=bool)
+        # the rows reaching a dead end in less than `rank` steps
+        incomplete = self.reach(dead_ends, rank-1, not descendants)
+        return ~np.in1d(rows, incomplete)
 
-from vplants.tissue_analysis.temporal_graph_analysis import translate_keys_Graph2Image, exist_all_relative_at_rank
 
 class TemporalPropertyGraph(PropertyGraph):
     """
@@ -32,6 +185,8 @@ class TemporalPropertyGraph(PropertyGraph):
     """
     STRUCTURAL = 's'
     TEMPORAL = 't'
+    # vertex properties whose changes invalidate the cached indices
+    _VERSIONED = ('index', 'label')
 
     def __init__(self, graph=None, **kwds):
         PropertyGraph.__init__(self, graph, idgenerator='max',**kwds)
@@ -48,6 +203,23 @@ class TemporalPropertyGraph(PropertyGraph):
         # (self._old_to_new_ids[tp][0] = old_to_new_vids; self._old_to_new_ids[tp][1] = old_to_new_eids).
         self._old_to_new_ids = []
 
+    def __setstate__(self, state):
+        PropertyGraph.__setstate__(self, state)
+        for name in self._VERSIONED:
+            prop = self._vertex_property.get(name)
+            if type(prop) is dict:
+                self._vertex_property[name] = VersionedProperty(prop)
+
+    def add_vertex_property(self, property_name, values = None, columnar = False, dtype = None):
+        """ Add a new property to the vertices.
+
+        The 'index' and 'label' properties are stored as `VersionedProperty`
+        (unless columnar), so that the indices built on them follow their changes.
+        """
+        if property_name in self._VERSIONED and not columnar and type(values) in (dict, type(None)):
+            values = VersionedProperty(values or {})
+        PropertyGraph.add_vertex_property(self, property_name, values, columnar, dtype)
+
 
     def extend(self, graphs, mappings, time_steps = None, disable_lineage_checking=True):
         """
@@ -205,6 +377,8 @@ class TemporalPropertyGraph(PropertyGraph):
             if no_all_desc != {}:
                 print "   - {} have missing descendants in their topological graph (at time {}).".format(len(no_all_desc), current_index)
 
+        # the time indices are set after the vertices: drop the lineage index built meanwhile
+        self._invalidate_topology()
         return relabel_ids
 
     def clear(self):
@@ -313,32 +487,100 @@ class TemporalPropertyGraph(PropertyGraph):
         """
         return iter(self.sibling(vid))
 
+    def _versions(self, names):
+        """
+        Return the state of the vertex properties `names` an index depends on,
+        None if one of them is not a `VersionedProperty` (the index can not be cached).
+        """
+        state = []
+        for name in names:
+            prop = self._vertex_property.get(name)
+            if not isinstance(prop, VersionedProperty):
+                return None
+            state.append((prop, prop.version))
+        return tuple(state)
+
+    def _cached(self, key, names):
+        """ Return the index cached under `key` if the properties `names` did not change since, else None."""
+        cached = self.__dict__.setdefault('_topology_cache', {}).get(key)
+        if cached is None:
+            return None
+        state, value = cached
+        current = self._versions(names)
+        if current is None or len(current) != len(state):
+            return None
+        for (prop, version), (cprop, cversion) in zip(state, current):
+            if prop is not cprop or version != cversion:
+                return None
+        return value
+
+    def _cache(self, key, names, value):
+        """ Cache the index `value` built on the vertex properties `names` under `key`."""
+        state = self._versions(names)
+        if state is not None:
+            self.__dict__.setdefault('_topology_cache', {})[key] = state, value
+        return value
+
+    def _lineage(self):
+        """
+        Return the lineage index (see `_LineageIndex`), built once and cached
+        until the topology or the values of the 'index' property change.
+        """
+        # claim the edge type index first: it drops the caches built without it
+        self._edge_type_adjacency()
+        lineage = self._cached('lineage', ('index',))
+        if lineage is not None:
+            return lineage
+        vids, rows, cols, eids = self._topology_snapshot(self.TEMPORAL)
+        indices = self.vertex_property('index')
+        times = np.array([indices.get(vid, -1) for vid in vids.tolist()], dtype=int)
+        return self._cache('lineage', ('index',), _LineageIndex(vids, times, rows, cols))
+
+    def _relatives(self, vids, n, descendants):
+        lineage = self._lineage()
+        vids = self.__to_set(vids)
+        if n == 0:
+            return vids
+        rows = lineage.rows(list(vids))
+        return set(lineage.vids[lineage.reach(rows, n, descendants)].tolist())
+
+    def _rank_relatives(self, vid, rank, descendants):
+        if isinstance(vid, list):
+            return [self._rank_relatives(v, rank, descendants) for v in vid]
+        lineage = self._lineage()
+        row = lineage.rows([vid])[0]
+        return set(lineage.vids[lineage.rank_rows(row, rank, descendants)].tolist())
+
+    def _rank_relatives_at_time(self, time_point, rank, descendants):
+        lineage = self._lineage()
+        rows = lineage.level_rows.get(time_point, np.zeros(0, dtype=int))
+        return dict((vid, set(lineage.vids[lineage.rank_rows(row, rank, descendants)].tolist()))
+                    for vid, row in zip(lineage.vids[rows].tolist(), rows))
+
+    def _has_rank_relatives(self, vids, rank, descendants):
+        """ Return a boolean array telling if each vid of `vids` has at least a relative at `rank`."""
+        lineage = self._lineage()
+        return lineage.nb_rank_relatives(lineage.rows(vids), rank, descendants) > 0
+
+    def _has_all_rank_relatives(self, vids, rank, descendants):
+        """
+        Return a boolean array telling if each vid of `vids` has all its relatives
+        at `rank`, i.e. if all its relatives at a lower rank have a relative at the next one.
+        """
+        lineage = self._lineage()
+        return lineage.all_rank_relatives(lineage.rows(vids), rank, descendants)
+
     def descendants(self, vids, n = None):
         """ Return the 0, 1, ..., nth descendants of the vertex vid
 
         Args:
           vids: : a set of vertex id
+          n: : the maximal rank, all the descendants if None
 
         Returns:
           descendant_list: : the set of the 0, 1, ..., nth descendant of the vertex vid
         """
-        edge_type='t'
-        neighbs=set()
-        vids=self.__to_set(vids)
-        if n==0 :
-            return vids
-        elif n==1 :
-            for vid in vids:
-                neighbs |= (self.out_neighbors(vid, edge_type) | set([vid]))
-            return neighbs
-        else :
-            if n is None :
-                n = self.nb_time_points-1
-            for vid in vids :
-                neighbs |= (self.descendants(self.out_neighbors(vid, edge_type), n-1) | set([vid]))
-                if list(neighbs)==self._vertices.keys():
-                    return neighbs
-        return neighbs
+        return self._relatives(vids, n, True)
 
     def iter_descendants(self, vids, n = None):
         """ Return the 0, 1, ..., nth descendants of the vertex vid
@@ -354,67 +596,40 @@ class TemporalPropertyGraph(PropertyGraph):
     def rank_descendants(self, vid, rank=1):
         """ Return the descendants of the vertex vid only at a given rank
         Args:
-          vid: : a vertex id or a set of vertex id
+          vid: : a vertex id or a list of vertex id
         Returns:
           descendant_list: : the set of the rank-descendant of the vertex vid or a list of set
         """
-        if isinstance(vid,list):
-            return [self.rank_descendants(v,rank) for v in vid]
-        else:
-            return self.descendants(vid,rank)- self.descendants(vid,rank-1)
-
-    def has_descendants(self, vid, rank=1):
-        """
-        Return True if the vid `vid` has at least a descendant at `rank`.
-        """
-        return self.rank_descendants(vid,rank) != set()
+        return self._rank_relatives(vid, rank, True)
 
-    def rank_descendants(self, vid, rank=1):
-        """ Return the descendants of the vertex vid only at a given rank
+    def rank_descendants_at_time(self, time_point, rank=1):
+        """ Return the descendants at a given rank of all the vertices of a time point
         Args:
-          vid: : a vertex id or a set of vertex id
+          time_point: : a time point
         Returns:
-          descendant_list: : the set of the rank-descendant of the vertex vid or a list of set
+          descendant_dict: : *keys* the vids of `time_point`, *values* the set of their rank-descendants
         """
-        if isinstance(vid,list):
-            return [self.rank_descendants(v,rank) for v in vid]
-        else:
-            return self.descendants(vid,rank)- self.descendants(vid,rank-1)
+        return self._rank_relatives_at_time(time_point, rank, True)
 
     def has_descendants(self, vid, rank=1):
         """
         Return True if the vid `vid` has at least a descendant at `rank`.
         """
-        return self.rank_descendants(vid,rank) != set()
+        return bool(self._has_rank_relatives([vid], rank, True)[0])
 
     def ancestors(self, vids, n = None):
         """Return the 0, 1, ..., nth ancestors of the vertex vid
 
         Args:
           vids: : a set of vertex id
+          n: : the maximal rank, all the ancestors if None
 
         Returns:
           anestors_list: : the set of the 0, 1, ..., nth ancestors of the vertex vid
         """
-        edge_type='t'
-        neighbs=set()
-        vids=self.__to_set(vids)
-        if n==0 :
-            return vids
-        elif n==1 :
-            for vid in vids:
-                neighbs |= (self.in_neighbors(vid, edge_type) | set([vid]))
-            return neighbs
-        else :
-            if n is None:
-                n = self.nb_time_points-1
-            for vid in vids :
-                neighbs |= (self.ancestors(self.in_neighbors(vid, edge_type), n-1) | set([vid]))
-                if list(neighbs)==self._vertices.keys():
-                    return neighbs
-        return neighbs
-
-    def iter_ancestors(self, vids, n):
+        return self._relatives(vids, n, False)
+
+    def iter_ancestors(self, vids, n = None):
         """ Return the 0, 1, ..., nth ancestors of the vertex vid
 
         Args:
@@ -428,44 +643,53 @@ class TemporalPropertyGraph(PropertyGraph):
     def rank_ancestors(self, vid, rank=1):
         """ Return the ancestor of the vertex vid only at a given rank
         Args:
-          vid: : a vertex id or a set of vertex id
+          vid: : a vertex id or a list of vertex id
         Returns:
           descendant_list: : the set of the rank-ancestor of the vertex vid or a list of set
         """
-        if isinstance(vid,list):
-            return [self.rank_ancestors(v,rank) for v in vid]
-        else:
-            return self.ancestors(vid,rank)- self.ancestors(vid,rank-1)
+        return self._rank_relatives(vid, rank, False)
+
+    def rank_ancestors_at_time(self, time_point, rank=1):
+        """ Return the ancestors at a given rank of all the vertices of a time point
+        Args:
+          time_point: : a time point
+        Returns:
+          ancestor_dict: : *keys* the vids of `time_point`, *values* the set of their rank-ancestors
+        """
+        return self._rank_relatives_at_time(time_point, rank, False)
 
     def has_ancestors(self, vid, rank=1):
         """
         Return True if the vid `vid` has at least an ancestor at `rank`.
         """
-        return self.rank_ancestors(vid,rank) != set()
+        return bool(self._has_rank_relatives([vid], rank, False)[0])
 
+    def _candidate_vertex(self, time_point=None):
+        """ Return the array of vids of `time_point` (all the vids if None)."""
+        lineage = self._lineage()
+        if time_point is None:
+            return lineage.vids
+        return lineage.vids[lineage.level_rows.get(time_point, np.zeros(0, dtype=int))]
 
     def _lineaged_as_ancestor(self, time_point=None, rank=1):
         """ Return a list of vertex lineaged as ancestors."""
-        if time_point is None:
-            return [k for k in self.vertices() if self.has_descendants(k,rank)]
-        else:
-            return [k for k,v in self.vertex_property('index').iteritems() if v==time_point and self.has_descendants(k,rank)]
+        vids = self._candidate_vertex(time_point)
+        return vids[self._has_rank_relatives(vids, rank, True)].tolist()
 
     def _lineaged_as_descendant(self, time_point=None, rank=1):
         """ Return a list of vertex lineaged as descendants."""
-        if time_point is None:
-            return [k for k in self.vertices() if self.has_ancestors(k,rank)]
-        else:
-            return [k for k,v in self.vertex_property('index').iteritems() if v==time_point and self.has_ancestors(k,rank)]
+        vids = self._candidate_vertex(time_point)
+        return vids[self._has_rank_relatives(vids, rank, False)].tolist()
 
     def _fully_lineaged_vertex(self, time_point=None):
         """
         Return a list of fully lineaged vertex (from a given `time_point` if not None), i.e. lineaged from start to end.
         """
         rank = self.nb_time_points-1
-        flv = self.descendants([k for k in self.vertex_at_time(0) if exist_all_relative_at_rank(self, k, rank)], rank)
+        vids = self._candidate_vertex(0)
+        flv = self.descendants(vids[self._has_all_rank_relatives(vids, rank, True)].tolist(), rank)
         if time_point is None:
-            return flv
+            return list(flv)
         else:
             return [vid for vid in flv if self.vertex_temporal_index(vid)==time_point]
 
@@ -483,25 +707,69 @@ class TemporalPropertyGraph(PropertyGraph):
            as_children: (bool) : if True, return vertices lineaged as children;
          - 'lineage_rank' (int): usefull if you want to check the lineage for a different rank than the rank-1 temporal neighborhood.
         """
-        if as_ancestor:
-            vids_anc = self._lineaged_as_ancestor(time_point=None, rank=lineage_rank)
+        if fully_lineaged:
+            vids = set(self._fully_lineaged_vertex(time_point=None))
         else:
-            vids_anc = self.vertices()
+            vids = self._candidate_vertex()
+            vids = set(vids[self._has_all_rank_relatives(vids, lineage_rank, True) |
+                            self._has_all_rank_relatives(vids, lineage_rank, False)].tolist())
+        if as_ancestor:
+            vids &= set(self._lineaged_as_ancestor(time_point=None, rank=lineage_rank))
         if as_descendant:
-            vids_desc = self._lineaged_as_descendant(time_point=None, rank=lineage_rank)
-        else:
-            vids_desc = self.vertices()
+            vids &= set(self._lineaged_as_descendant(time_point=None, rank=lineage_rank))
+        return list(vids)
 
-        if fully_lineaged:
-            vids = self._fully_lineaged_vertex(time_point=None)
+    def _time_point_index(self):
+        """
+        Return a dict *keys* time points, *values* the arrays of the vids and
+        of the eids (edges between two vertices of this time point) of each time point.
+        It is built once and cached until the topology or the values of the 'index' property change.
+        """
+        time_points = self._cached('time_points', ('index',))
+        if time_points is not None:
+            return time_points
+        vids, rows, cols, eids = self._topology_snapshot()
+        indices = self.vertex_property('index')
+        times = np.array([indices.get(vid, -1) for vid in vids.tolist()], dtype=int)
+        edge_times = np.where(times[rows] == times[cols], times[rows], -1)
+        time_points = {}
+        for t in np.unique(times[times >= 0]).tolist():
+            time_points[t] = vids[times == t], eids[edge_times == t]
+        return self._cache('time_points', ('index',), time_points)
+
+    def _label_maps(self, time_point, edges=False):
+        """
+        Return the (label -> vid, vid -> label) maps of a time point, or the
+        (labelpair -> eid, eid -> labelpair) maps if `edges` is True.
+        They are memoized until the topology or the values of the 'label' or 'index' properties change.
+        """
+        labels = self.vertex_property('label')
+        key = ('labelpairs' if edges else 'labels', time_point)
+        maps = self._cached(key, ('label', 'index'))
+        if maps is not None:
+            return maps
+        vids, eids = self._time_point_index().get(time_point, ((), ()))
+        vertex2label = dict((vid, labels[vid]) for vid in vids.tolist() if vid in labels)
+        if edges:
+            to_label = {}
+            for eid in eids.tolist():
+                sid, tid = self._edges[eid]
+                if sid in vertex2label and tid in vertex2label:
+                    to_label[eid] = (vertex2label[sid], vertex2label[tid])
         else:
-            vids = [k for k in self.vertices() if (exist_all_relative_at_rank(self, k, lineage_rank) or exist_all_relative_at_rank(self, k, -lineage_rank))]
-        return list( set(vids) & set(vids_anc) & set(vids_desc) )
-
+            to_label = vertex2label
+        maps = dict((label, elt) for elt, label in to_label.iteritems()), to_label
+        return self._cache(key, ('label', 'index'), maps)
 
     def _all_vertex_at_time(self, time_point):
         """ Return a list containing all vertex assigned to a given `time_point`."""
-        return [k for k,v in self.vertex_property('index').iteritems() if v==time_point]
+        vids, eids = self._time_point_index().get(time_point, ((), ()))
+        return list(vids)
+
+    def edge_at_time(self, time_point):
+        """ Return the list of the (structural) edges between vertices of a given `time_point`."""
+        vids, eids = self._time_point_index().get(time_point, ((), ()))
+        return list(eids)
 
     def vertex_at_time(self, time_point, lineaged=False, fully_lineaged=False, as_ancestor=False, as_descendant=False, lineage_rank=1):
         """
@@ -537,7 +805,8 @@ class TemporalPropertyGraph(PropertyGraph):
            as_children: (bool) : if True, return vertices lineaged as children.
         """
         vids = self.vertex_at_time(time_point, lineaged, fully_lineaged, as_ancestor, as_descendant)
-        return dict([(k,self.vertex_property(vertex_property)[k]) for k in vids if self.vertex_property(vertex_property).has_key(k)])
+        prop = self.vertex_property(vertex_property)
+        return dict([(k,prop[k]) for k in vids if k in prop])
 
     def vertex_property_with_image_labels(self, vertex_property, time_point, lineaged=False, fully_lineaged=False, as_ancestor=False, as_descendant=False, lineage_rank=1):
         """
@@ -635,7 +904,7 @@ def label2vertex_map(graph, time_point = None):
     """
     if isinstance(graph, TemporalPropertyGraph):
         assert time_point is not None
-        return dict([(j,i) for i,j in graph.vertex_property('label').iteritems() if graph.vertex_property('index')[i]==time_point])
+        return dict(graph._label_maps(time_point)[0])
     else:
         return dict([(j,i) for i,j in graph.vertex_property('label').iteritems()])
 
@@ -648,7 +917,7 @@ def vertex2label_map(graph, time_point = None):
     """
     if isinstance(graph, TemporalPropertyGraph):
         assert time_point is not None
-        return dict([(i,j) for i,j in graph.vertex_property('label').iteritems() if graph.vertex_property('index')[i]==time_point])
+        return dict(graph._label_maps(time_point)[1])
     else:
         return dict([(i,j) for i,j in graph.vertex_property('label').iteritems()])
 
@@ -672,6 +941,9 @@ def labelpair2edge_map(graph, time_point = None):
 
         :rtype: dict
     """
+    if isinstance(graph, TemporalPropertyGraph):
+        assert time_point is not None
+        return dict(graph._label_maps(time_point, edges=True)[0])
     mvertex2label = vertex2label_map(graph, time_point)
 
     return dict([((mvertex2label[graph.source(eid)],mvertex2label[graph.target(eid)]),eid) for eid in graph.edges()
@@ -684,6 +956,9 @@ def edge2labelpair_map(graph, time_point):
 
         :rtype: dict
     """
+    if isinstance(graph, TemporalPropertyGraph):
+        assert time_point is not None
+        return dict(graph._label_maps(time_point, edges=True)[1])
     mvertex2label = vertex2label_map(graph, time_point)
 
     return dict([(eid, (mvertex2label[graph.source(eid)],mvertex2label[graph.target(eid)])) for eid in graph.edges()
@@ -709,11 +984,8 @@ def edge2vertexpair_map(graph, time_point = None):
         return dict([(eid,(graph.source(eid),graph.target(eid))) for eid in graph.edges()])
     else:
         e2v = {}
-        for eid in graph.edges():
-            vid1 = graph.source(eid)
-            vid2 = graph.target(eid)
-            if (graph.vertex_temporal_index(vid1) == time_point) and (graph.vertex_temporal_index(vid2) == time_point):
-                e2v[eid] = sorted((vid1, vid2))
+        for eid in graph.edge_at_time(time_point):
+            e2v[eid] = sorted((graph.source(eid), graph.target(eid)))
         return e2v
 
 def add_vertex_property_from_dictionary(graph, name, dictionary, mlabel2vertex = None, time_point = None, overwrite = False):
@@ -864,7 +1136,7 @@ def extend_edge_property_from_dictionary(graph, name, dictionary, time_point = N
     edges_not_found = []
     for k in dictionary:
         sk = tuple(sorted(k)) # make sure the keys of the `dictionary` are sorted tuples
-        if sk in mlabelpair2edge.keys():
+        if sk in mlabelpair2edge:
             graph.edge_property(name).update({mlabelpair2edge[sk]: dictionary[k]})
         else:
             edges_not_found.append(sk)
@@ -888,7 +1160,7 @@ def extend_vertex_property_from_dictionary(graph, name, dictionary, mlabel2verte
     missing_vertex = list(set(dictionary.keys())-set(mlabel2vertex.keys()))
     if missing_vertex != []:
         print "The dictionary extending vertex property '{}' contains {} labels, against {} vertices for time-point #{} !".format(name, len(dictionary.keys()), len(mlabel2vertex.keys()), time_point)
-    graph.vertex_property(name).update( dict([(mlabel2vertex[k], dictionary[k]) for k in dictionary if k in mlabel2vertex.keys()]) )
+    graph.vertex_property(name).update( dict([(mlabel2vertex[k], dictionary[k]) for k in dictionary if k in mlabel2vertex]) )
     return "Done."
 
 def extend_graph_property_from_dictionary(graph, name, dictionary):
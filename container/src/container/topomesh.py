@@ -23,6 +23,10 @@ __license__= "Cecill-C"
 __revision__=" $Id$ "
 
 from array import array
+from itertools import chain
+import numpy as np
+from scipy.sparse import csr_matrix
+from utils.csr import csr_gather,csr_counts
 from interface.topomesh import (TopomeshError,InvalidWisp,InvalidDegree,
                                 ITopomesh,IWispListMesh,INeighborhoodMesh,IMutableMesh)
 from utils import IdDict
@@ -52,6 +56,7 @@ class Topomesh (ITopomesh,IWispListMesh,INeighborhoodMesh,IMutableMesh) :
         self._degree=degree
         self._borders = [None] + [IdDict(idgenerator = idgenerator) for i in xrange(degree)]
         self._regions = [IdDict(idgenerator = idgenerator)] + [{} for i in xrange(degree-1)]
+        self._topology_cache = {}
 
     def get_idgenerator_type(self):
         return self._regions[0].get_generator_type()
@@ -64,6 +69,21 @@ class Topomesh (ITopomesh,IWispListMesh,INeighborhoodMesh,IMutableMesh) :
     def id_reuse_enabled(self):
         return self._regions[0].id_reuse_enabled()
 
+    def _invalidate_topology (self) :
+        """Internal function that drops the cached incidence matrices
+        """
+        self._topology_cache = {}
+
+    def freeze (self) :
+        """
+        create a compact read only copy of this mesh
+        that store incidence relations in arrays
+
+        :Returns Type: CompactTopomesh
+        """
+        from compact_topomesh import CompactTopomesh
+        return CompactTopomesh.from_topomesh(self)
+
     ########################################################################
     #
     #               Mesh concept
@@ -205,6 +225,7 @@ class Topomesh (ITopomesh,IWispListMesh,INeighborhoodMesh,IMutableMesh) :
     #
     ########################################################################
     def add_wisp (self, degree, wid = None) :
+        self._invalidate_topology()
         if degree > 0 :
             wid = self._borders[degree].add(array("L"),wid)
             if degree < self.degree() :
@@ -215,6 +236,7 @@ class Topomesh (ITopomesh,IWispListMesh,INeighborhoodMesh,IMutableMesh) :
     add_wisp.__doc__=IMutableMesh.add_wisp.__doc__
 
     def remove_wisp (self, degree, wid) :
+        self._invalidate_topology()
         #remove links
         if degree < self.degree() :
             for rid in tuple(self.regions(degree,wid) ) :
@@ -232,6 +254,7 @@ class Topomesh (ITopomesh,IWispListMesh,INeighborhoodMesh,IMutableMesh) :
     def link (self, degree, wid, border_id) :
         if degree < 1 :
             raise InvalidDegree ("smallest wisps have no neighbors")
+        self._invalidate_topology()
         self._borders[degree][wid].append(border_id)
         self._regions[degree - 1][border_id].append(wid)
     link.__doc__=IMutableMesh.link.__doc__
@@ -239,7 +262,119 @@ class Topomesh (ITopomesh,IWispListMesh,INeighborhoodMesh,IMutableMesh) :
     def unlink (self, degree, wid, border_id) :
         if degree < 1 :
             raise InvalidDegree ("smallest wisps have no neighbors")
+        self._invalidate_topology()
         self._borders[degree][wid].remove(border_id)
         self._regions[degree - 1][border_id].remove(wid)
     unlink.__doc__=IMutableMesh.unlink.__doc__
+    ########################################################################
+    #
+    #               Batched queries
+    #
+    ########################################################################
+    def _cache (self) :
+        try :
+            return self._topology_cache
+        except AttributeError :
+            #mesh created before the cache
+            self._topology_cache = {}
+            return self._topology_cache
+
+    def _sorted_wisps (self, degree) :
+        """Internal function that returns the sorted array of wisps of a degree
+        """
+        cache = self._cache()
+        try :
+            return cache[("wisps",degree)]
+        except KeyError :
+            wids = np.sort(np.fromiter(self.wisps(degree),int,self.nb_wisps(degree) ) )
+            cache[("wisps",degree)] = wids
+            return wids
+
+    def _incidence (self, degree, offset) :
+        """Internal function that returns the sparse matrix whose rows are
+        the sorted wisps of degree and columns the sorted wisps of
+        degree - offset, nonzero if the latter is a border of the former
+        """
+        cache = self._cache()
+        try :
+            return cache[("borders",degree,offset)]
+        except KeyError :
+            pass
+        wids = self._sorted_wisps(degree)
+        bids = self._sorted_wisps(degree - offset)
+        if offset == 1 :
+            borders = [self._borders[degree][wid] for wid in wids.tolist()]
+            ptr = np.zeros(len(wids) + 1,int)
+            np.cumsum([len(row) for row in borders],out = ptr[1:])
+            cols = np.searchsorted(bids,np.fromiter(chain.from_iterable(borders),int,ptr[-1]) )
+            mat = csr_matrix( (np.ones(len(cols),int),cols,ptr),shape = (len(wids),len(bids) ) )
+        else :
+            mat = (self._incidence(degree,1) * self._incidence(degree - 1,offset - 1) ).tocsr()
+        mat.sum_duplicates()
+        mat.sort_indices()
+        cache[("borders",degree,offset)] = mat
+        return mat
+
+    def _batch (self, degree, wids, mat, target_degree) :
+        """Internal function that extracts the rows of wids from mat
+        """
+        sorted_wids = self._sorted_wisps(degree)
+        wids = np.asarray(wids,int)
+        rows = np.searchsorted(sorted_wids,wids)
+        rows[rows == len(sorted_wids)] = 0
+        invalid = (sorted_wids[rows] != wids) if len(sorted_wids) > 0 else np.ones(wids.shape,bool)
+        if invalid.any() :
+            raise StrInvalidWisp(degree,wids[invalid][0])
+        ptr = np.zeros(len(rows) + 1,int)
+        np.cumsum(csr_counts(rows,mat.indptr),out = ptr[1:])
+        cols = csr_gather(rows,mat.indptr,mat.indices)
+        return ptr,self._sorted_wisps(target_degree)[cols]
 
+    def batch_borders (self, degree, wids, offset = 1) :
+        """
+        borders at degree - offset of an array of wisps
+
+        computed by products of the sparse incidence matrices
+        of successive degrees, cached until the mesh is modified
+
+        :Parameters:
+         - `degree` (int) - degree of the wisps
+         - `wids` (array of int) - ids of the wisps
+         - `offset` (int) - degree offset of the borders
+
+        :Returns: ptr, bids - CSR structure, sorted ids of the borders
+                  of wids[i] are bids[ptr[i]:ptr[i + 1]]
+        """
+        if degree - offset < 0 :
+            raise InvalidDegree ("smallest wisps have no borders")
+        if offset == 0 :
+            return np.arange(len(wids) + 1),np.asarray(wids,int)
+        return self._batch(degree,wids,self._incidence(degree,offset),degree - offset)
+
+    def batch_regions (self, degree, wids, offset = 1) :
+        """
+        regions at degree + offset of an array of wisps
+
+        computed by products of the sparse incidence matrices
+        of successive degrees, cached until the mesh is modified
+
+        :Parameters:
+         - `degree` (int) - degree of the wisps
+         - `wids` (array of int) - ids of the wisps
+         - `offset` (int) - degree offset of the regions
+
+        :Returns: ptr, rids - CSR structure, sorted ids of the regions
+                  of wids[i] are rids[ptr[i]:ptr[i + 1]]
+        """
+        if (degree + offset) > self.degree() :
+            raise InvalidDegree ("biggest wisps do not separate regions")
+        if offset == 0 :
+            return np.arange(len(wids) + 1),np.asarray(wids,int)
+        cache = self._cache()
+        try :
+            mat = cache[("regions",degree,offset)]
+        except KeyError :
+            mat = self._incidence(degree + offset,offset).T.tocsr()
+            mat.sort_indices()
+            cache[("regions",degree,offset)] = mat
+        return self._batch(degree,wids,mat,degree + offset)
@@ -22,7 +22,9 @@ for a some topomesh algorithms
 __license__= "Cecill-C"
 __revision__=" $Id$ "
 
+import numpy as np
 from topomesh import Topomesh
+from utils.csr import csr_gather,csr_counts,csr_row_ids,csr_from_pairs,pair_order
 
 __all__ = ["clean_remove","clean_geometry","clean_orphans",
            "is_flip_topo_allowed","flip_edge",
@@ -35,7 +37,8 @@ __all__ = ["clean_remove","clean_geometry","clean_orphans",
            "find_cycles","clone_mesh",
            "topo_divide_edge","topo_divide_face","topo_divide_cell",
            "ordered_pids","topo_triangulate_polygon","topo_triangulate_face",
-           "find_connex_parts"]
+           "find_connex_parts",
+           "connected_components","cycle_basis","face_cycles"]
 ###########################################################
 #
 #       mesh edition
@@ -262,8 +265,7 @@ def clean_duplicated_wisps (mesh, deg, wid1, wid2) :
     
     :Returns Type: None
     """
-    regions = set(mesh.regions(deg,wid2) )
-    regions.discard(mesh.regions(deg,wid1) )
+    regions = set(mesh.regions(deg,wid2) ) - set(mesh.regions(deg,wid1) )
     
     mesh.remove_wisp(deg,wid2)
     
@@ -887,7 +889,8 @@ def find_cycles (mesh, scale, length_max) :
     connected by borders such as the first element
     of the cycle is connected to the last element
 
-    Brut force algorithm.
+    Brut force algorithm, use `cycle_basis` or `face_cycles`
+    on big meshes.
 
     mesh : a container.topomesh instance
     scale : the scale to consider for cycles
@@ -919,6 +922,92 @@ def find_cycles (mesh, scale, length_max) :
     #drop keys to return only ordered paths
     return cycles.values()
 
+###########################################################
+#
+#       connectivity
+#
+###########################################################
+def _union_find (nb, first, second) :
+    """Internal function that merges the sets of nodes
+    linked by the pairs (first[i], second[i])
+    
+    Roots of the sets are hooked, by round, on the
+    smallest root they are linked to, then the paths
+    to the roots are fully compressed.
+    
+    :Returns: the smallest node of the set of each node
+    """
+    parent = np.arange(nb)
+    first = np.asarray(first,int)
+    second = np.asarray(second,int)
+    while len(first) > 0 :
+        first = parent[first]
+        second = parent[second]
+        linked = first != second
+        first,second = first[linked],second[linked]
+        if len(first) == 0 :
+            break
+        low = np.minimum(first,second)
+        high = np.maximum(first,second)
+        #the last write wins, i.e. the smallest root
+        order = pair_order(high,nb - 1 - low)
+        parent[high[order]] = low[order]
+        grand_parent = parent[parent]
+        while (grand_parent != parent).any() :
+            parent = grand_parent
+            grand_parent = parent[parent]
+    return parent
+
+def _wisp_array (mesh, degree, wids) :
+    """Internal function that returns wids as an array,
+    all wisps of degree if wids is None
+    """
+    if wids is None :
+        return np.fromiter(mesh.wisps(degree),int,mesh.nb_wisps(degree) )
+    return np.asarray(wids,int)
+
+def connected_components (mesh, degree, wids = None) :
+    """Label wisps connected by shared borders
+    
+    Two wisps of degree > 0 are connected if they share
+    a border, two points are connected if they share an
+    edge. Only paths through wids are considered.
+    
+    Sets of connected wisps are merged with a union-find
+    on the pairs of wisps that share a border, in nearly
+    linear time.
+    
+    :Parameters:
+     - `mesh` (:class:`Topomesh`)
+     - `degree` (int) - degree of the wisps
+     - `wids` (list of wid) - wisps to consider,
+                all wisps of degree if None
+    
+    :Returns: label of each wid, from 0 to the number
+              of components - 1, in order of first
+              appearance in wids
+    
+    :Returns Type: array of int
+    """
+    wids = _wisp_array(mesh,degree,wids)
+    if degree > 0 :
+        ptr,links = mesh.batch_borders(degree,wids)
+    elif mesh.degree() > 0 :
+        ptr,links = mesh.batch_regions(degree,wids)
+    else :
+        return np.arange(len(wids) )
+    
+    #pair each wisp with the first wisp sharing the same link
+    rows = csr_row_ids(ptr)
+    order = np.argsort(links,kind = "mergesort")
+    links,rows = links[order],rows[order]
+    first = np.ones(len(links),bool)
+    first[1:] = links[1:] != links[:-1]
+    heads = rows[first][np.cumsum(first) - 1]
+    
+    roots = _union_find(len(wids),rows,heads)
+    return np.unique(roots,return_inverse = True)[1]
+
 def find_connex_parts (mesh, deg, wids) :
     """Breaks wids into parts connected by borders
     
@@ -932,24 +1021,164 @@ def find_connex_parts (mesh, deg, wids) :
     
     :Returns Type: iter of (list of wid)
     """
-    remaining = set(wids)
-    
-    while len(remaining) > 0 :
-        wid = remaining.pop()
-        front = list(mesh.borders(deg,wid) )
-        part = [wid]
-        for bid in front :
-            for rid in set(mesh.regions(deg - 1,bid) ) & remaining :
-                part.append(rid)
-                remaining.remove(rid)
-                for wid in mesh.borders(deg,rid) :
-                    front.append(wid)
-        
-        yield part
-
-
-
+    wids = list(wids)
+    labels = connected_components(mesh,deg,wids)
+    order = np.argsort(labels,kind = "mergesort")
+    bounds = np.searchsorted(labels[order],np.arange(labels.max() + 2) ) \
+             if len(wids) > 0 else [0]
+    for start,stop in zip(bounds[:-1],bounds[1:]) :
+        yield [wids[i] for i in order[start:stop]]
 
+def _spanning_forest (nb, src, dst) :
+    """Internal function that computes a breadth first
+    spanning forest of a graph
+    
+    The graph is explored level by level from the smallest
+    node of each connected component.
+    
+    :Parameters:
+     - `nb` (int) - number of nodes
+     - `src`, `dst` (array of int) - extremities of each edge
+    
+    :Returns: depth of each node in its tree, edge
+              linking each node to its parent (-1 for roots)
+    """
+    nb_edges = len(src)
+    ptr,adjacent = csr_from_pairs(np.concatenate( (src,dst) ),
+                                  np.tile(np.arange(nb_edges),2),
+                                  nb)
+    depth = np.empty(nb,int)
+    depth.fill(-1)
+    parent_edge = np.empty(nb,int)
+    parent_edge.fill(-1)
+    
+    roots = _union_find(nb,src,dst)
+    front = np.flatnonzero(roots == np.arange(nb) )
+    depth[front] = 0
+    level = 0
+    while len(front) > 0 :
+        eids = csr_gather(front,ptr,adjacent)
+        nids = src[eids] + dst[eids] - np.repeat(front,csr_counts(front,ptr) )
+        new = depth[nids] < 0
+        nids,first = np.unique(nids[new],return_index = True)
+        level += 1
+        depth[nids] = level
+        parent_edge[nids] = eids[new][first]
+        front = nids
+    
+    return depth,parent_edge
 
+def cycle_basis (mesh, degree = 1, wids = None) :
+    """Fundamental cycles of the graph of wisps
+    
+    Wisps of degree are the edges of a graph whose nodes
+    are their borders, e.g. edges and points for degree 1
+    or faces and cells of the dual mesh using
+    `mesh.regions`. Each wisp must have exactly two borders.
+    
+    A breadth first spanning forest of the graph is computed,
+    each wisp outside of the forest closes one cycle with
+    the paths in the forest that join its borders. All
+    cycles are extracted together, one step up the trees
+    at a time, in a time linear with the size of the
+    basis.
+    
+    :Parameters:
+     - `mesh` (:class:`Topomesh`)
+     - `degree` (int) - degree of the edges of the graph
+     - `wids` (list of wid) - wisps to consider,
+                all wisps of degree if None
+    
+    :Returns: ptr, cycles - CSR structure, wisps of cycle i
+              ordered along the cycle are
+              cycles[ptr[i]:ptr[i + 1]]
+    """
+    wids = _wisp_array(mesh,degree,wids)
+    ptr,bids = mesh.batch_borders(degree,wids)
+    if (np.diff(ptr) != 2).any() :
+        raise ValueError("cycle basis needs wisps with exactly two borders")
+    nids,ends = np.unique(bids,return_inverse = True)
+    src,dst = ends[0::2],ends[1::2]
+    depth,parent_edge = _spanning_forest(len(nids),src,dst)
+    
+    in_tree = np.zeros(len(wids),bool)
+    in_tree[parent_edge[parent_edge >= 0]] = True
+    closing = np.flatnonzero(~in_tree)
+    
+    #climb from both extremities of the closing edges
+    #up to their common ancestor
+    cycle = np.arange(len(closing) )
+    pieces = [(cycle,np.zeros(len(cycle),int),np.zeros(len(cycle),int),closing)]
+    first,second = src[closing],dst[closing]
+    step = 0
+    while len(cycle) > 0 :
+        active = first != second
+        cycle,first,second = cycle[active],first[active],second[active]
+        step += 1
+        ups = (depth[second] >= depth[first],depth[first] >= depth[second])
+        for side,nodes,up in ( (1,second,ups[0]),(2,first,ups[1]) ) :
+            eids = parent_edge[nodes[up]]
+            key = step if side == 1 else -step
+            pieces.append( (cycle[up],np.repeat(side,len(eids) ),np.repeat(key,len(eids) ),eids) )
+            nodes[up] = src[eids] + dst[eids] - nodes[up]
+    
+    cycle,side,key,eids = [np.concatenate(col) for col in zip(*pieces)]
+    order = pair_order(cycle,side * (2 * step + 1) + key + step)
+    ptr = np.zeros(len(closing) + 1,int)
+    np.cumsum(np.bincount(cycle,minlength = len(closing) ),out = ptr[1:])
+    return ptr,wids[eids[order]]
 
+def face_cycles (mesh, fids = None) :
+    """Ordered loops of points and edges around faces
+    
+    All faces are walked together, one edge at a time.
+    
+    :Parameters:
+     - `mesh` (:class:`Topomesh`)
+     - `fids` (list of fid) - faces to consider,
+                all faces if None
+    
+    :Returns: ptr, pids, eids - CSR structure, for face i
+              and ptr[i] <= j < ptr[i + 1], edge eids[j]
+              joins pids[j] to the next point of the loop
+    """
+    fids = _wisp_array(mesh,2,fids)
+    ptr,eids = mesh.batch_borders(2,fids)
+    eptr,pids = mesh.batch_borders(1,eids)
+    if (np.diff(eptr) != 2).any() :
+        raise ValueError("face edges must have exactly two points")
+    face = csr_row_ids(ptr)
+    
+    #half 2 * slot + k of an edge is its k-th point,
+    #after[half] is the half of the other edge at this point
+    half_face = np.repeat(face,2)
+    order = pair_order(half_face,pids)
+    points = pids[order]
+    if (points[0::2] != points[1::2]).any() :
+        raise ValueError("face edges must form a loop")
+    after = np.empty(len(pids),int)
+    after[order[0::2]] = order[1::2]
+    after[order[1::2]] = order[0::2]
+    if (half_face[after] != half_face).any() :
+        raise ValueError("face edges must form a loop")
+    
+    #walk along each face, through the second point of its first edge
+    nb = np.diff(ptr)
+    start = ptr[:-1][nb > 0]
+    nb = nb[nb > 0]
+    loop = np.empty(len(eids),int)
+    loop_pids = np.empty(len(eids),int)
+    current = start
+    through = 2 * current + 1
+    for step in xrange(nb.max() if len(nb) > 0 else 0) :
+        active = step < nb
+        out = start[active] + step
+        loop[out] = current[active]
+        loop_pids[out] = pids[through[active] ^ 1]
+        nxt = after[through]
+        current = nxt // 2
+        through = nxt ^ 1
+    if len(loop) > 0 and (np.bincount(loop,minlength = len(eids) ) != 1).any() :
+        raise ValueError("face edges must form a single loop")
+    return ptr,loop_pids,eids[loop]
 
@@ -0,0 +1,146 @@
+# -*- python -*-
+#
+#       OpenAlea.Container
+#
+#       Copyright 2006-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite: http://openalea.gforge.inria.fr
+#
+################################################################################
+"""
+This module provide a binary, versioned, file format for Topomesh,
+PropertyTopomesh and CompactTopomesh.
+
+The file layout is the one of `property_graph_bin` (preamble, JSON header,
+raw sections aligned on 64 bytes) with its own magic string:
+ - the sorted wids of each degree, the borders and the regions of the
+   wisps of each degree in CSR form (offsets, rows of the border or region
+   in the sorted wids of its degree) are stored as int arrays, that a
+   CompactTopomesh uses without copy;
+ - numerical wisp properties of a PropertyTopomesh are stored as a pair
+   of arrays (keys, values) of the array_dict;
+ - other wisp properties and the other attributes of the mesh (interfaces,
+   interface and topomesh properties) are pickled.
+
+Sections can be read with `numpy.memmap`, so that `read_topomesh` only
+reads the degrees and the properties it is asked for.
+"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import numpy as np
+
+from array_dict import array_dict
+from compact_topomesh import CompactTopomesh
+from topomesh import Topomesh
+from property_graph_bin import _Writer, _Reader, _name
+
+MAGIC = "OAMESH\0\0"
+FORMAT_VERSION = 1
+# attributes rebuilt from the sections of the file
+_STRUCTURE = set(['_degree', '_wids', '_borders', '_regions', '_topology_cache', '_wisp_properties'])
+
+
+def write_topomesh(filename, mesh):
+    """
+    Write a Topomesh (a PropertyTopomesh or a CompactTopomesh) in a binary file.
+
+    :Parameters:
+    - `filename` (str) - the name of the file
+    - `mesh` (Topomesh) - the mesh to save
+    """
+    writer = _Writer()
+    compact = mesh if isinstance(mesh, CompactTopomesh) else mesh.freeze()
+    degree = compact.degree()
+    header = {"class": [type(mesh).__module__, type(mesh).__name__],
+              "degree": degree,
+              "idgenerator": mesh.get_idgenerator_type() if isinstance(mesh, Topomesh) else "set",
+              "wisps": [writer.add(compact.wisp_array(d)) for d in xrange(degree+1)],
+              "borders": [None] + [[writer.add(a) for a in compact._borders[d]] for d in xrange(1, degree+1)],
+              "regions": [[writer.add(a) for a in compact._region_csr(d)] for d in xrange(degree)]}
+
+    header["wisp_properties"] = []
+    for d, properties in enumerate(getattr(mesh, "_wisp_properties", [])):
+        for name, prop in properties.iteritems():
+            keys, values = prop.keys(), prop.values()
+            if isinstance(name, basestring) and keys.ndim == 1 and keys.dtype.kind in "iu" \
+               and values.dtype.kind in "biufc":
+                header["wisp_properties"].append({"kind": "column", "degree": d, "name": name,
+                                                  "keys": writer.add(keys), "values": writer.add(values)})
+            else:
+                header["wisp_properties"].append({"kind": "pickle", "degree": d,
+                                                  "section": writer.add((name, prop))})
+    extra = dict((k, v) for k, v in mesh.__dict__.iteritems() if k not in _STRUCTURE)
+    header["mesh"] = writer.add(extra)
+    writer.write(filename, MAGIC, FORMAT_VERSION, header)
+
+
+def read_topomesh(filename, degrees=None, wisp_properties=None, lazy=False, compact=False):
+    """
+    Read a mesh written by `write_topomesh`.
+
+    :Parameters:
+    - `filename` (str) - the name of the file
+    - `degrees` (list of int) - degrees whose wisps are loaded, all of them if None.
+      Borders of the wisps of degree d are loaded if d and d - 1 are loaded.
+    - `wisp_properties` (list of (int, str)) - (degree, name) of the wisp properties
+      to load, all the properties of the loaded degrees if None
+    - `lazy` (bool) - if True, numerical wisp properties are array_dict on memory
+      mapped arrays, read from the disk when accessed
+    - `compact` (bool) - if True, return a CompactTopomesh built on the arrays of the
+      file instead of a mutable mesh of the saved class (wisp properties and other
+      attributes of the mesh are then not read)
+
+    :Returns:
+    - the mesh
+    """
+    reader = _Reader(filename, mmap=lazy, magic=MAGIC, format_version=FORMAT_VERSION, kind="topomesh")
+    try:
+        header = reader.header
+        degree = header["degree"]
+        if degrees is None:
+            degrees = range(degree+1)
+        wids = [reader.get(header["wisps"][d]) if d in degrees else np.zeros(0, int)
+                for d in xrange(degree+1)]
+
+        def incidence(element, d, other):
+            if d in degrees and other in degrees:
+                return [reader.get(index) for index in header[element][d]]
+            return np.zeros(len(wids[d])+1, int), np.zeros(0, int)
+        mesh = CompactTopomesh.from_arrays(degree, wids,
+                                           [None] + [incidence("borders", d, d-1) for d in xrange(1, degree+1)],
+                                           [incidence("regions", d, d+1) for d in xrange(degree)])
+
+        module, class_name = header["class"]
+        mesh_class = getattr(__import__(str(module), fromlist=[str(class_name)]), str(class_name))
+        if not compact and not issubclass(mesh_class, CompactTopomesh):
+            mesh = mesh.thaw(str(header["idgenerator"]))
+            if mesh_class is not Topomesh and issubclass(mesh_class, Topomesh):
+                thawed = mesh
+                mesh = mesh_class(degree)
+                mesh._borders, mesh._regions = thawed._borders, thawed._regions
+            mesh.__dict__.update(reader.get(header["mesh"]))
+
+            if hasattr(mesh, "_wisp_properties"):
+                for entry in header["wisp_properties"]:
+                    d = entry["degree"]
+                    if d not in degrees:
+                        continue
+                    if entry["kind"] == "column":
+                        name = _name(entry["name"])
+                        if wisp_properties is not None and (d, name) not in wisp_properties:
+                            continue
+                        prop = array_dict.from_arrays(reader.get(entry["keys"]), reader.get(entry["values"]))
+                    else:
+                        name, prop = reader.get(entry["section"])
+                        if wisp_properties is not None and (d, name) not in wisp_properties:
+                            continue
+                    mesh._wisp_properties[d][name] = prop
+    finally:
+        reader.close()
+    return mesh
@@ -29,7 +29,7 @@ from topomesh_algo import topo_triangulate_polygon,ordered_pids,flip_edge
 try :
     from numpy import subtract,cross,dot
     from numpy.linalg import norm
-    __all__ = ["triangle_quality","flip_necessary",
+    __all__ = ["triangle_quality","flip_gain","flip_necessary",
                "triangulate_polygon","triangulate_face"]
 except ImportError :
     __all__ = []
@@ -71,9 +71,8 @@ def triangle_quality (pt1, pt2, pt3) :
     else :
         return hmax * P / 2. / sqrt(3.) / sqrt(S2)
 
-def flip_necessary (mesh, eid, pos) :
-    """Test wether flipping the edge gain something
-    in terms of triangles quality.
+def flip_gain (mesh, eid, pos) :
+    """Gain in terms of triangles quality of flipping an edge
     
     .. warning:: mesh must be planar with triangle faces only
     
@@ -82,11 +81,16 @@ def flip_necessary (mesh, eid, pos) :
      - `eid` (eid) - id of edge to test
      - `pos` (dict of (pid|Vector) ) - position of points
     
-    :Returns Type: bool
+    :Returns: decrease of the sum of the quality indices of the
+              two triangles around the edge, None if the edge is
+              not between two triangles or if the flipped edge
+              would lie outside of the quadrangle
+    
+    :Returns Type: float
     """
     #test wether edge is between two triangles
     if mesh.nb_regions(1,eid) != 2 :
-        return False
+        return None
     
     #find points
     lpids = set()
@@ -99,11 +103,11 @@ def flip_necessary (mesh, eid, pos) :
     #test wether flipped edge is inside the quadrangle
     if dot(cross(subtract(pt2,pt1),subtract(pta,pt1) ),
            cross(subtract(pt2,pt1),subtract(ptb,pt1) ) ) > 0 :
-        return False
+        return None
     
     if dot(cross(subtract(ptb,pta),subtract(pt1,pta) ),
            cross(subtract(ptb,pta),subtract(pt2,pta) ) ) > 0 :
-        return False
+        return None
     
     #test the quality of triangles
     cur_shape_qual = triangle_quality(pt1,pt2,pta) \
@@ -111,7 +115,23 @@ def flip_necessary (mesh, eid, pos) :
     flp_shape_qual = triangle_quality(pta,ptb,pt1) \
                    + triangle_quality(pta,ptb,pt2)
     
-    return flp_shape_qual < cur_shape_qual
+    return cur_shape_qual - flp_shape_qual
+
+def flip_necessary (mesh, eid, pos) :
+    """Test wether flipping the edge gain something
+    in terms of triangles quality.
+    
+    .. warning:: mesh must be planar with triangle faces only
+    
+    :Parameters:
+     - `mesh` (Topomesh)
+     - `eid` (eid) - id of edge to test
+     - `pos` (dict of (pid|Vector) ) - position of points
+    
+    :Returns Type: bool
+    """
+    gain = flip_gain(mesh,eid,pos)
+    return gain is not None and gain > 0
 
 ###############################################
 #
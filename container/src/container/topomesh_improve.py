@@ -0,0 +1,398 @@
+# -*- python -*-
+# -*- coding: utf-8 -*-
+#
+#       Topomesh : container package
+#
+#       Copyright or  or Copr. 2006 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       VPlants WebSite : https://gforge.inria.fr/projects/vplants/
+#
+
+__doc__="""
+This module provide an incremental driver to improve
+triangulated surfaces with edge flips and edge collapses
+"""
+
+__license__= "Cecill-C"
+__revision__=" $Id$ "
+
+from heapq import heapify,heappush,heappop
+from time import time
+import numpy as np
+from numpy import add,subtract,cross,dot
+from numpy.linalg import norm
+from topomesh_algo import is_flip_topo_allowed,flip_edge,collapse_edge
+from topomesh_geom_algo import flip_gain
+
+__all__ = ["MeshImprover","improve_mesh"]
+
+COLLAPSE = 0
+FLIP = 1
+
+def _cross_dot (u1, v1, u2, v2) :
+    """Dot products of the cross products of rows
+    of 2D or 3D vectors
+    """
+    prod = cross(u1,v1) * cross(u2,v2)
+    return prod if prod.ndim == 1 else prod.sum(axis = -1)
+
+def _triangle_quality (pt1, pt2, pt3) :
+    """Same as `triangle_quality` on arrays of corners
+    """
+    e1 = norm(pt3 - pt2,axis = -1)
+    e2 = norm(pt3 - pt1,axis = -1)
+    e3 = norm(pt2 - pt1,axis = -1)
+
+    P = (e1 + e2 + e3) / 2.
+    hmax = np.maximum(np.maximum(e1,e2),e3)
+    S2 = P * (P - e1) * (P - e2) * (P - e3)
+    valid = S2 > 0
+    quality = np.empty(len(S2) )
+    quality.fill(1e6)
+    quality[valid] = hmax[valid] * P[valid] / 2. / np.sqrt(3.) / np.sqrt(S2[valid])
+    return quality
+
+class MeshImprover (object) :
+    """Improve a triangulated surface edge by edge
+
+    Candidate operations are kept in a priority queue:
+    collapses of edges shorter than `collapse_length`,
+    shortest first, then flips of edges by decreasing gain
+    of triangles quality (see `flip_gain`).
+
+    Each edge has at most one valid entry in the queue.
+    After an operation, only the edges of the modified faces
+    are evaluated again, older entries of these edges are
+    dropped when popped. The cost of an operation does not
+    depend on the size of the mesh.
+
+    Topological validity of an operation is tested when it
+    is popped out of the queue.
+
+    Counters of evaluations and operations are available
+    as attributes and through `statistics`.
+    """
+    def __init__ (self, mesh, pos, collapse_length = None,
+                        flip = True, protected_edges = ()) :
+        """Constructor
+
+        Evaluate all the edges of the mesh.
+
+        :Parameters:
+         - `mesh` (:class:`Topomesh`) - a mesh of degree 2 with
+                   triangle faces, modified in place
+         - `pos` (dict of (pid|Vector) ) - position of points,
+                   modified in place by collapses
+         - `collapse_length` (float) - edges shorter than this
+                   length are collapsed, no collapse if None
+         - `flip` (bool) - if True, flip edges when it improves
+                   the quality of triangles
+         - `protected_edges` (list of eid) - edges that must
+                   be neither flipped nor collapsed
+        """
+        self._mesh = mesh
+        self._pos = pos
+        self._collapse_length = collapse_length
+        self._flip = flip
+        self._protected = set(protected_edges)
+        self._stamp = {}
+        self._queue = []
+
+        self.nb_evaluations = 0
+        self.nb_outdated = 0
+        self.nb_rejected = 0
+        self.nb_flips = 0
+        self.nb_collapses = 0
+        self.elapsed = 0.
+
+        self._evaluate_all()
+
+    ########################################################################
+    #
+    #               edge evaluation
+    #
+    ########################################################################
+    def _evaluate (self, eid) :
+        """Internal function that returns the priority
+        and the kind of the best operation on an edge
+        """
+        self.nb_evaluations += 1
+        if eid in self._protected :
+            return None
+        if self._collapse_length is not None :
+            pid1,pid2 = self._mesh.borders(1,eid)
+            length = norm(subtract(self._pos[pid2],self._pos[pid1]) )
+            if length < self._collapse_length :
+                return (COLLAPSE,length),COLLAPSE
+        if self._flip :
+            gain = flip_gain(self._mesh,eid,self._pos)
+            if gain is not None and gain > 1e-9 :
+                return (FLIP,-gain),FLIP
+        return None
+
+    def _evaluate_all (self) :
+        """Internal function that evaluates all the edges of the mesh
+        at once, with the same criteria than `_evaluate`
+        """
+        mesh = self._mesh
+        eids = np.fromiter(mesh.wisps(1),int,mesh.nb_wisps(1) )
+        self._stamp = dict.fromkeys(eids.tolist(),1)
+        self.nb_evaluations += len(eids)
+        if len(eids) == 0 :
+            return
+        eptr,ends = mesh.batch_borders(1,eids)
+        pids = np.fromiter(mesh.wisps(0),int,mesh.nb_wisps(0) )
+        pids.sort()
+        coords = np.array([self._pos[pid] for pid in pids.tolist()],float)
+        valid = np.diff(eptr) == 2
+        first = coords[np.searchsorted(pids,ends[eptr[:-1][valid]])]
+        second = coords[np.searchsorted(pids,ends[eptr[:-1][valid] + 1])]
+
+        key = np.zeros(len(eids) )
+        kind = np.empty(len(eids),int)
+        kind.fill(-1)
+        if self._flip :
+            gain = np.zeros(len(eids) )
+            gain[valid] = self._flip_gains(eids[valid],ends[eptr[:-1][valid]],
+                                           ends[eptr[:-1][valid] + 1],pids,coords)
+            flip = gain > 1e-9
+            kind[flip] = FLIP
+            key[flip] = -gain[flip]
+        if self._collapse_length is not None :
+            length = np.zeros(len(eids) )
+            length[valid] = norm(second - first,axis = -1)
+            collapse = valid & (length < self._collapse_length)
+            kind[collapse] = COLLAPSE
+            key[collapse] = length[collapse]
+        if len(self._protected) > 0 :
+            kind[np.in1d(eids,list(self._protected) )] = -1
+
+        queued = kind >= 0
+        self._queue = zip(kind[queued].tolist(),key[queued].tolist(),
+                          [1] * int(queued.sum() ),eids[queued].tolist(),
+                          kind[queued].tolist() )
+        heapify(self._queue)
+
+    def _flip_gains (self, eids, pid1, pid2, pids, coords) :
+        """Internal function that computes `flip_gain`
+        for an array of edges, zero if undefined
+        """
+        mesh = self._mesh
+        gain = np.zeros(len(eids) )
+        fptr,fids = mesh.batch_regions(1,eids)
+        inner = np.flatnonzero(np.diff(fptr) == 2)
+        fid1 = fids[fptr[inner]]
+        fid2 = fids[fptr[inner] + 1]
+
+        #corners of the faces, opposite points of the edge
+        faces = np.unique(fids)
+        cptr,corners = mesh.batch_borders(2,faces,2)
+        triangle = np.diff(cptr) == 3
+        corner_sum = np.add.reduceat(corners,cptr[:-1]) if len(corners) > 0 \
+                     else np.zeros(len(faces),int)
+        row1 = np.searchsorted(faces,fid1)
+        row2 = np.searchsorted(faces,fid2)
+        ok = triangle[row1] & triangle[row2]
+        inner,row1,row2 = inner[ok],row1[ok],row2[ok]
+        ends = pid1[inner] + pid2[inner]
+
+        def point (pid) :
+            return coords[np.searchsorted(pids,pid)]
+        pt1,pt2 = point(pid1[inner]),point(pid2[inner])
+        pta,ptb = point(corner_sum[row1] - ends),point(corner_sum[row2] - ends)
+
+        #flipped edge inside the quadrangle
+        ok = (_cross_dot(pt2 - pt1,pta - pt1,pt2 - pt1,ptb - pt1) <= 0) \
+           & (_cross_dot(ptb - pta,pt1 - pta,ptb - pta,pt2 - pta) <= 0)
+        cur_shape_qual = _triangle_quality(pt1,pt2,pta) \
+                       + _triangle_quality(pt1,pt2,ptb)
+        flp_shape_qual = _triangle_quality(pta,ptb,pt1) \
+                       + _triangle_quality(pta,ptb,pt2)
+        gain[inner[ok]] = (cur_shape_qual - flp_shape_qual)[ok]
+        return gain
+
+    def _push (self, eid) :
+        """Internal function that evaluates an edge again
+        and outdates its previous entries in the queue
+        """
+        stamp = self._stamp.get(eid,0) + 1
+        self._stamp[eid] = stamp
+        entry = self._evaluate(eid)
+        if entry is not None :
+            (rank,key),kind = entry
+            heappush(self._queue,(rank,key,stamp,eid,kind) )
+
+    def _update (self, fids, pids = ()) :
+        """Internal function that evaluates again all the edges
+        of fids and the edges around pids
+        """
+        mesh = self._mesh
+        eids = set()
+        for fid in fids :
+            eids.update(mesh.borders(2,fid) )
+        for pid in pids :
+            eids.update(mesh.regions(0,pid) )
+        for eid in eids :
+            self._push(eid)
+
+    ########################################################################
+    #
+    #               operations
+    #
+    ########################################################################
+    def _is_boundary (self, pid) :
+        mesh = self._mesh
+        for eid in mesh.regions(0,pid) :
+            if mesh.nb_regions(1,eid) == 1 :
+                return True
+        return False
+
+    def _collapse_position (self, eid) :
+        """Internal function that tests wether an edge can be
+        safely collapsed
+
+        :Returns: position of the remaining point, None if
+                  the collapse is not allowed
+        """
+        mesh = self._mesh
+        pos = self._pos
+        pid1,pid2 = mesh.borders(1,eid)
+        fids = tuple(mesh.regions(1,eid) )
+        if len(fids) not in (1,2) :
+            return None
+        opposite = set()
+        for fid in fids :
+            if mesh.nb_borders(2,fid) != 3 :
+                return None
+            opposite.update(mesh.borders(2,fid,2) )
+        opposite -= set( (pid1,pid2) )
+
+        #link condition, points joined to both extremities
+        #are the corners of the faces around the edge
+        common = set(mesh.region_neighbors(0,pid1) ) \
+               & set(mesh.region_neighbors(0,pid2) )
+        if common != opposite or len(opposite) != len(fids) :
+            return None
+
+        #do not pinch the boundary
+        bnd1 = self._is_boundary(pid1)
+        bnd2 = self._is_boundary(pid2)
+        if bnd1 and bnd2 and len(fids) == 2 :
+            return None
+        if bnd1 and not bnd2 :
+            target = pos[pid1]
+        elif bnd2 and not bnd1 :
+            target = pos[pid2]
+        else :
+            target = add(pos[pid1],pos[pid2]) / 2.
+
+        #no face around the edge must be turned over
+        moved = set( (pid1,pid2) )
+        for fid in set(mesh.regions(0,pid1,2) ) | set(mesh.regions(0,pid2,2) ) :
+            if fid in fids :
+                continue
+            corners = tuple(mesh.borders(2,fid,2) )
+            old = [pos[pid] for pid in corners]
+            new = [target if pid in moved else pos[pid] for pid in corners]
+            if dot(cross(subtract(old[1],old[0]),subtract(old[2],old[0]) ),
+                   cross(subtract(new[1],new[0]),subtract(new[2],new[0]) ) ) <= 0 :
+                return None
+        return target
+
+    def step (self) :
+        """Apply the best operation of the queue
+
+        :Returns: kind of the applied operation (COLLAPSE or
+                  FLIP), None if the queue is empty
+        """
+        mesh = self._mesh
+        while len(self._queue) > 0 :
+            rank,key,stamp,eid,kind = heappop(self._queue)
+            if self._stamp.get(eid) != stamp or not mesh.has_wisp(1,eid) :
+                self.nb_outdated += 1
+                continue
+            if kind == FLIP :
+                if not is_flip_topo_allowed(mesh,eid) :
+                    self.nb_rejected += 1
+                    continue
+                flip_edge(mesh,eid)
+                self.nb_flips += 1
+                self._update(mesh.regions(1,eid) )
+                return FLIP
+            else :
+                target = self._collapse_position(eid)
+                if target is None :
+                    self.nb_rejected += 1
+                    continue
+                pid1,pid2 = collapse_edge(mesh,eid)
+                self._pos[pid1] = target
+                del self._pos[pid2]
+                self.nb_collapses += 1
+                self._update(mesh.regions(0,pid1,2),(pid1,) )
+                return COLLAPSE
+        return None
+
+    def run (self, max_operations = None) :
+        """Apply operations until no more operation
+        improves the mesh
+
+        :Parameters:
+         - `max_operations` (int) - maximum number of
+                     operations, no limit if None
+
+        :Returns: number of applied operations
+        :Returns Type: int
+        """
+        start = time()
+        nb = 0
+        while max_operations is None or nb < max_operations :
+            if self.step() is None :
+                break
+            nb += 1
+        self.elapsed += time() - start
+        return nb
+
+    def statistics (self) :
+        """Counters of the work done so far
+
+        :Returns Type: dict of (str|number)
+        """
+        nb = self.nb_flips + self.nb_collapses
+        return {"flips" : self.nb_flips,
+                "collapses" : self.nb_collapses,
+                "evaluations" : self.nb_evaluations,
+                "outdated" : self.nb_outdated,
+                "rejected" : self.nb_rejected,
+                "queued" : len(self._queue),
+                "elapsed" : self.elapsed,
+                "operations_per_second" : nb / self.elapsed if self.elapsed > 0 else 0.}
+
+def improve_mesh (mesh, pos, collapse_length = None, flip = True,
+                  protected_edges = (), max_operations = None) :
+    """Improve a triangulated surface by edge flips and collapses
+
+    .. seealso:: :class:`MeshImprover`
+
+    :Parameters:
+     - `mesh` (:class:`Topomesh`) - a mesh of degree 2 with
+               triangle faces, modified in place
+     - `pos` (dict of (pid|Vector) ) - position of points,
+               modified in place
+     - `collapse_length` (float) - edges shorter than this
+               length are collapsed, no collapse if None
+     - `flip` (bool) - if True, flip edges to improve triangles
+     - `protected_edges` (list of eid) - edges that must
+               be neither flipped nor collapsed
+     - `max_operations` (int) - maximum number of operations
+
+    :Returns: counters of the work done, see
+              `MeshImprover.statistics`
+    :Returns Type: dict of (str|number)
+    """
+    improver = MeshImprover(mesh,pos,collapse_length,flip,protected_edges)
+    improver.run(max_operations)
+    return improver.statistics()
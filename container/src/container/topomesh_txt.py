@@ -21,9 +21,27 @@ This module provide a simple way to serialize a mesh in a txt file
 __license__= "Cecill-C"
 __revision__=" $Id$ "
 
+from ast import literal_eval
+from itertools import chain,izip
+import numpy as np
 from data_prop import DataProp
-from topomesh import Topomesh
-from utils.utils_txt import write_description,read_description
+from topomesh import StrInvalidWisp
+from compact_topomesh import CompactTopomesh
+from utils.csr import csr_from_pairs
+from utils.utils_txt import write_description
+
+#number of lines written in one call to the stream
+CHUNK_SIZE = 10000
+
+def _write_lines (f, line, values, nb_fields) :
+    """Internal function that writes the same formatted line for
+    consecutive groups of nb_fields values of a flat list,
+    by chunks of CHUNK_SIZE lines formatted at once
+    """
+    chunk = CHUNK_SIZE * nb_fields
+    for i in xrange(0,len(values),chunk) :
+        fields = tuple(values[i:i + chunk])
+        f.write( (line * (len(fields) // nb_fields) ) % fields)
 
 def topomesh_to_txt (f, mesh, description, props) :
     """Write the txt representation of a topomesh.
@@ -53,23 +71,28 @@ def topomesh_to_txt (f, mesh, description, props) :
     #write wisps
     for deg in xrange(mesh.degree() + 1) :
         if deg < len(props) :
-            deg_props = props[deg]
+            deg_props = [prop for name,prop in props[deg]]
         else :
             deg_props = []
         f.write("BEGIN wisp degree %d\n" % deg)
-        for wid in mesh.wisps(deg) :
-            f.write("id %d" % wid)
-            for name,prop in deg_props :
-                f.write("\t%s" % prop[wid])
-            f.write("\n")
+        wids = list(mesh.wisps(deg) )
+        columns = [wids] + [[prop[wid] for wid in wids] for prop in deg_props]
+        _write_lines(f,"id %d" + "\t%s" * len(deg_props) + "\n",
+                     list(chain.from_iterable(izip(*columns) ) ),len(columns) )
         f.write("END wisp degree %d\n" % deg)
 
     #write links between wisps
     f.write("BEGIN decomposition\n")
     for deg in xrange(1,mesh.degree() + 1) :
-        for wid in mesh.wisps(deg) :
-            for bid in mesh.borders(deg,wid) :
-                f.write("link degree %d wid %d bid %d\n" % (deg,wid,bid))
+        wids = list(mesh.wisps(deg) )
+        if hasattr(mesh,"batch_borders") :
+            ptr,bids = mesh.batch_borders(deg,wids)
+            wids = np.repeat(wids,np.diff(ptr) )
+            links = np.column_stack( (wids,bids) ).ravel().tolist()
+        else :
+            links = [wid_or_bid for wid in wids for bid in mesh.borders(deg,wid)
+                                for wid_or_bid in (wid,bid)]
+        _write_lines(f,"link degree %d wid %%d bid %%d\n" % deg,links,2)
     f.write("END decomposition\n")
 
     f.write("END topomesh\n")
@@ -77,64 +100,102 @@ def topomesh_to_txt (f, mesh, description, props) :
     #return
     return f
 
+def _section (txt, begin, end, start = 0) :
+    """Internal function that returns the text between the lines
+    begin and end, and the position after the end line
+    raise ValueError if begin can not be found
+    """
+    ind = txt.index(begin,start)
+    ind = txt.index("\n",ind) + 1
+    ind_end = txt.index(end,ind)
+    return txt[ind:ind_end],txt.index("\n",ind_end) + 1
+
+#types of values that can be converted in bulk
+_NUMERIC_TYPES = {"int":int,"long":int,"float":float,"complex":complex}
+
+#builtin types that can be rebuilt from a python literal
+_LITERAL_TYPES = {"tuple":tuple,"list":list,"dict":dict,"set":set}
+
+def _convert_values (typ, values) :
+    """Internal function that converts a list of strings
+    into values of the given type, without eval
+    """
+    if typ == "str" :
+        return values
+    elif typ in _NUMERIC_TYPES :
+        return np.array(values).astype(_NUMERIC_TYPES[typ]).tolist()
+    elif typ == "bool" :
+        return [val == "True" for val in values]
+    else :
+        constructor = _LITERAL_TYPES.get(typ,lambda val : val)
+        return [constructor(literal_eval(val) ) for val in values]
+
 def txt_to_topomesh (f, method = "set") :
     """
     retrieve the topomesh structure from txt stream
     returns topomesh,description
     """
-    #create topomesh
-    line = ""
-    while "BEGIN topomesh" not in line :
-        line = f.readline()
-    deg = int(line.split(" ")[3])
-    mesh = Topomesh(deg,method)
+    txt = f.read()
+    #topomesh degree
+    ind = txt.index("BEGIN topomesh")
+    line = txt[ind:txt.index("\n",ind)]
+    degree = int(line.split(" ")[3])
+
     #read description
-    descr = read_description(f)
+    ind_props = txt.index("BEGIN properties description",ind)
+    if "BEGIN description" in txt[ind:ind_props] :
+        descr,ind = _section(txt,"BEGIN description","END description",ind)
+        descr = descr[:-1]
+    else :
+        descr = ""
     
     #read properties
-    props = [[] for i in xrange(mesh.degree() + 1)]
-    line = ""
-    while "BEGIN properties description" not in line :
-        line = f.readline()
-    line = f.readline()
-    while "END properties description" not in line :
-        gr = line[:-1].split("\t")
+    props = [[] for i in xrange(degree + 1)]
+    props_txt,ind = _section(txt,"BEGIN properties description",
+                                 "END properties description",ind)
+    for line in props_txt.splitlines() :
+        gr = line.split("\t")
         prop_deg = int(gr[0][3:])
         for prop_descr in gr[1:] :
             name,prop = prop_descr.split("(")
             typ,unit = prop[:-1].split(",")
             props[prop_deg].append( (name,DataProp(type = typ,unit = unit) ) )
-        
-        line = f.readline()
 
     #wisps
-    for i in xrange(mesh.degree() + 1) :
-        line = ""
-        while "BEGIN wisp" not in line :
-            line = f.readline()
-        deg = int(line.split(" ")[3])
-        line = f.readline().rstrip()
-        while "END wisp" not in line :
-            gr = line.split()
-            wid = int(gr[1])
-            mesh.add_wisp(deg,wid)
+    wids = [None] * (degree + 1)
+    for i in xrange(degree + 1) :
+        ind_wisp = txt.index("BEGIN wisp",ind)
+        deg = int(txt[ind_wisp:txt.index("\n",ind_wisp)].split(" ")[3])
+        block,ind = _section(txt,"BEGIN wisp","END wisp",ind_wisp)
+        lines = block.splitlines()
+        if len(props[deg]) == 0 :
+            wids[deg] = np.fromstring(block.replace("id",""),int,sep = " ")
+        else :
+            columns = zip(*[line.split("\t") for line in lines])
+            if len(columns) == 0 :
+                columns = [[]] * (len(props[deg]) + 1)
+            wids[deg] = np.fromstring(" ".join(col[3:] for col in columns[0]),int,sep = " ")
             #props
-            for ind,val in enumerate(gr[2:]) :
-                if props[deg][ind][1].type() == 'str' :
-                    props[deg][ind][1][wid] = val
-                else :
-                    props[deg][ind][1][wid] = eval("%s(%s)" % (props[deg][ind][1].type(),val) )
-            line = f.readline().rstrip()
+            wid_list = wids[deg].tolist()
+            for (name,prop),values in izip(props[deg],columns[1:]) :
+                prop.update(izip(wid_list,_convert_values(prop.type(),list(values) ) ) )
 
     #links
-    line = ""
-    while "BEGIN decomposition" not in line :
-        line = f.readline()
-    line = f.readline()
-    while "END decomposition" not in line :
-        gr = line.split(" ")
-        mesh.link(int(gr[2]),int(gr[4]),int(gr[6]))
-        line = f.readline()
+    block,ind = _section(txt,"BEGIN decomposition","END decomposition",ind)
+    links = np.fromstring(block.replace("link degree","").replace("wid","").replace("bid",""),
+                          int,sep = " ").reshape(-1,3)
+    borders = [None]
+    for deg in xrange(1,degree + 1) :
+        deg_links = links[links[:,0] == deg]
+        sorted_wids = np.sort(wids[deg])
+        rows = np.searchsorted(sorted_wids,deg_links[:,1])
+        invalid = rows >= len(sorted_wids)
+        invalid[~invalid] = sorted_wids[rows[~invalid]] != deg_links[~invalid,1]
+        if invalid.any() :
+            raise StrInvalidWisp(deg,deg_links[invalid,1][0])
+        wids[deg] = sorted_wids
+        borders.append(csr_from_pairs(rows,deg_links[:,2],len(sorted_wids) ) )
+    mesh = CompactTopomesh(degree,wids,borders).thaw(method)
 
     #return
     return mesh,descr,props
@@ -35,40 +35,37 @@ def pre_order(tree, vtx_id, edge_type_property = None):
 
     This is a non recursive implementation.
     '''
-
-    if edge_type_property is None:
-        yield vtx_id
-        for vid in tree.children(vtx_id):
-            for node in pre_order(tree, vid):
-                yield node
-    else:
-
-        # 1. select first '+' edges
-        successor = []
-        yield vtx_id
-        for vid in tree.children(vtx_id):
-            if edge_type_property.get(vid) == '<':
-                successor.append(vid)
-                continue
-
-            for node in pre_order(tree, vid):
-                yield node
-
-        # 2. select then '<' edges
-        for vid in successor:
-            for node in pre_order(tree, vid):
-                yield node
+    stack = [iter([vtx_id])]
+    while stack:
+        for vid in stack[-1]:
+            yield vid
+            children = tree.children(vid)
+            if edge_type_property is not None:
+                # 1. select first '+' edges, then '<' edges
+                children = [cid for cid in children if edge_type_property.get(cid) != '<'] + \
+                           [cid for cid in children if edge_type_property.get(cid) == '<']
+            stack.append(iter(children))
+            break
+        else:
+            stack.pop()
 
 
 def post_order(tree, vtx_id):
     '''
     Traverse a tree in a postfix way.
     (from leaves to root)
+
+    This is a non recursive implementation.
     '''
-    for vid in tree.children(vtx_id):
-        for node in post_order(tree, vid):
-            yield node
-    yield vtx_id
+    stack = [(vtx_id, iter(tree.children(vtx_id)))]
+    while stack:
+        vid, children = stack[-1]
+        for cid in children:
+            stack.append((cid, iter(tree.children(cid))))
+            break
+        else:
+            stack.pop()
+            yield vid
 
 def level_order(tree, vtx_id):
     ''' Traverse the vertices in a level order.
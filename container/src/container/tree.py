@@ -56,6 +56,15 @@ class Tree(IRootedGraph,
         self._children = {}
 
 
+    def freeze(self):
+        '''
+        Create a compact copy of this tree that stores its structure in arrays.
+
+        :returns: ArrayTree
+        '''
+        from array_tree import ArrayTree
+        return ArrayTree.from_tree(self)
+
     #########################################################################
     # Some Vertex List Graph Concept methods.
     #########################################################################
@@ -84,7 +93,7 @@ class Tree(IRootedGraph,
         return list(self.vertices_iter())
 
     def __iter__(self):
-        return self.vertices()
+        return self.vertices_iter()
 
     #########################################################################
     # GraphConcept methods.
@@ -1,3 +1,3 @@
-from id_generator import IdMaxGenerator,IdSetGenerator,IdListGenerator
+from id_generator import IdMaxGenerator,IdSetGenerator,IdListGenerator,IdIntervalGenerator
 from id_generator import IdSetGenerator as IdGenerator
 from id_dict import IdDict
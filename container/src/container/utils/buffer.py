@@ -0,0 +1,45 @@
+# -*- python -*-
+# -*- coding: utf-8 -*-
+#
+#       buffer : container package
+#
+#       Copyright  or Copr. 2006 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       VPlants WebSite : https://gforge.inria.fr/projects/vplants/
+#
+
+__doc__="""
+This module provide helpers to manage growable NumPy buffers:
+arrays allocated with spare capacity, so that adding elements
+one at a time is amortized O(1)
+"""
+
+__license__= "Cecill-C"
+__revision__=" $Id$ "
+
+import numpy as np
+
+def grow_buffer (array, size, fill) :
+    """Return `array` with a first dimension of at least `size`
+
+    The capacity is at least doubled, new elements are set to `fill`.
+    `array` itself is returned if it is already large enough.
+
+    :Parameters:
+     - `array` (array) - the buffer
+     - `size` (int) - the number of elements needed
+     - `fill` - value of the new elements
+
+    :Returns Type: array
+    """
+    if len(array) >= size :
+        return array
+    capacity = max(size,2 * len(array),16)
+    new_array = np.empty( (capacity,) + array.shape[1:],dtype = array.dtype)
+    new_array[:len(array)] = array
+    new_array[len(array):] = fill
+    return new_array
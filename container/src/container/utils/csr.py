@@ -0,0 +1,97 @@
+# -*- python -*-
+# -*- coding: utf-8 -*-
+#
+#       CSR : container package
+#
+#       Copyright  or Copr. 2006 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       VPlants WebSite : https://gforge.inria.fr/projects/vplants/
+#
+
+__doc__="""
+This module provide helpers to manipulate relations stored
+in compressed sparse row (CSR) form: an array `ptr` of
+nb_rows + 1 offsets in an array of `targets`, the targets
+of row i being targets[ptr[i]:ptr[i + 1]]
+"""
+
+__license__= "Cecill-C"
+__revision__=" $Id$ "
+
+import numpy as np
+
+def csr_gather (rows, ptr, targets) :
+    """Concatenation of the targets of each row of `rows`
+
+    :Parameters:
+     - `rows` (array of int) - rows to gather, may be repeated
+     - `ptr` (array of int) - offsets of the rows in `targets`
+     - `targets` (array) - targets of all the rows
+
+    :Returns Type: array
+    """
+    counts = ptr[rows + 1] - ptr[rows]
+    nb = counts.sum()
+    if nb == 0 :
+        return targets[:0]
+    idx = np.repeat(ptr[rows + 1] - np.cumsum(counts), counts) + np.arange(nb)
+    return targets[idx]
+
+def csr_counts (rows, ptr) :
+    """Number of targets of each row of `rows`
+    """
+    return ptr[rows + 1] - ptr[rows]
+
+def csr_row_ids (ptr) :
+    """Row of each target of the CSR structure
+    """
+    return np.repeat(np.arange(len(ptr) - 1), np.diff(ptr) )
+
+def pair_order (first, second) :
+    """Indices that sort pairs by first, then by second
+    
+    Same as numpy.lexsort( (second,first) ) but much faster
+    for non negative integers, sorted as a single int64 key.
+    """
+    first = np.asarray(first)
+    second = np.asarray(second)
+    if len(first) == 0 or first.dtype.kind not in "iu" or second.dtype.kind not in "iu" :
+        return np.lexsort( (second,first) )
+    nb_first = int(first.max() ) + 1
+    nb_second = int(second.max() ) + 1
+    if first.min() < 0 or second.min() < 0 or nb_first * nb_second >= 2 ** 63 :
+        return np.lexsort( (second,first) )
+    return np.argsort(first.astype(np.int64) * nb_second + second,kind = "mergesort")
+
+def csr_from_pairs (rows, targets, nb_rows, unique = False) :
+    """Build a CSR structure from (row, target) pairs
+
+    :Parameters:
+     - `rows` (array of int) - row of each pair, in [0, nb_rows)
+     - `targets` (array) - target of each pair
+     - `nb_rows` (int) - number of rows
+     - `unique` (bool) - if True, targets of each row are sorted
+                         and duplicated pairs are removed, else
+                         targets keep their order in each row
+
+    :Returns: ptr, targets
+    """
+    rows = np.asarray(rows,int)
+    targets = np.asarray(targets)
+    if unique :
+        order = pair_order(rows,targets)
+        rows,targets = rows[order],targets[order]
+        if len(rows) > 0 :
+            keep = np.ones(len(rows),bool)
+            keep[1:] = (rows[1:] != rows[:-1]) | (targets[1:] != targets[:-1])
+            rows,targets = rows[keep],targets[keep]
+    else :
+        order = np.argsort(rows,kind = "mergesort")
+        targets = targets[order]
+    ptr = np.zeros(nb_rows + 1,int)
+    np.cumsum(np.bincount(rows,minlength = nb_rows),out = ptr[1:])
+    return ptr,targets
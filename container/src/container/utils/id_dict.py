@@ -21,11 +21,12 @@ This module provide a dictionnary that create keys when needed
 __license__= "Cecill-C"
 __revision__=" $Id$ "
 
-from id_generator import IdMaxGenerator,IdSetGenerator,IdListGenerator
+from id_generator import IdMaxGenerator,IdSetGenerator,IdListGenerator,IdIntervalGenerator
 
 IdGen = {"max":IdMaxGenerator,
          "set":IdSetGenerator,
-         "list":IdListGenerator}
+         "list":IdListGenerator,
+         "interval":IdIntervalGenerator}
 
 class IdDict (dict) :
     """
@@ -62,6 +63,30 @@ class IdDict (dict) :
         except IndexError :
             raise KeyError(key)
 
+    def add_many (self, vals, keys=None) :
+        """
+        add a sequence of values in one shot, create the keys if `keys` is None
+        return the list of keys
+        """
+        vals = list(vals)
+        if keys is None :
+            keys = self._id_generator.get_ids(len(vals))
+        else :
+            keys = list(keys)
+            if len(keys) != len(vals) :
+                raise ValueError("%d keys for %d values" % (len(keys),len(vals)) )
+            for key in keys :
+                if key in self :
+                    raise KeyError(key)
+            if len(set(keys)) != len(keys) :
+                raise KeyError("duplicated keys")
+            try :
+                keys = self._id_generator.get_ids(ids = keys)
+            except IndexError, e :
+                raise KeyError(str(e))
+        dict.update(self,zip(keys,vals))
+        return keys
+
     def __deepcopy__(self, memo):
         from copy import deepcopy
         newval = IdDict(idgenerator=self.get_generator_type())
@@ -22,6 +22,8 @@ This module provide a generator for id numbers
 __license__= "Cecill-C"
 __revision__=" $Id$ "
 
+from bisect import bisect_right
+
 class IdMaxGenerator(object) :
     def __init__ (self) :
         self.clear()
@@ -37,6 +39,19 @@ class IdMaxGenerator(object) :
             self._id_max = max(self._id_max,id+1)
             return id
 
+    def get_ids (self, nb = 0, ids = None) :
+        """ Reserve `nb` new ids, or the given `ids` if not None, in one shot.
+        """
+        if ids is None :
+            ret = range(self._id_max,self._id_max + nb)
+            self._id_max += nb
+            return ret
+        else :
+            ids = list(ids)
+            if len(ids) > 0 :
+                self._id_max = max(self._id_max,max(ids)+1)
+            return ids
+
     def release_id (self, id) :
         pass
 
@@ -75,6 +90,33 @@ class IdSetGenerator(object) :
                 except KeyError :
                     raise IndexError("id %d already used" % id)
 
+    def get_ids (self, nb = 0, ids = None) :
+        """ Reserve `nb` new ids, or the given `ids` if not None, in one shot.
+        """
+        if ids is None :
+            ret = []
+            if self.reuse_enabled :
+                while len(ret) < nb and len(self._available_ids) > 0 :
+                    ret.append(self._available_ids.pop())
+            nb_new = nb - len(ret)
+            ret.extend(xrange(self._id_max,self._id_max + nb_new))
+            self._id_max += nb_new
+            return ret
+        ids = list(ids)
+        id_set = set(ids)
+        if len(id_set) != len(ids) :
+            raise IndexError("duplicated ids")
+        used = set(id for id in id_set if id < self._id_max) - self._available_ids
+        if len(used) > 0 :
+            raise IndexError("id %d already used" % used.pop())
+        self._available_ids -= id_set
+        if len(id_set) > 0 :
+            id_max = max(id_set) + 1
+            if id_max > self._id_max :
+                self._available_ids.update(id for id in xrange(self._id_max,id_max) if id not in id_set)
+                self._id_max = id_max
+        return ids
+
     def release_id (self, id) :
         if id > self._id_max :
             raise IndexError("id out of range")
@@ -124,6 +166,36 @@ class IdListGenerator(object) :
                 except ValueError :
                     raise IndexError("id %d already used" % id)
 
+    def get_ids (self, nb = 0, ids = None) :
+        """ Reserve `nb` new ids, or the given `ids` if not None, in one shot.
+        """
+        if ids is None :
+            ret = []
+            if self.reuse_enabled :
+                nb_reused = min(nb,len(self._id_list))
+                if nb_reused > 0 :
+                    ret = self._id_list[-nb_reused:][::-1]
+                    del self._id_list[-nb_reused:]
+            nb_new = nb - len(ret)
+            ret.extend(xrange(self._id_max,self._id_max + nb_new))
+            self._id_max += nb_new
+            return ret
+        ids = list(ids)
+        id_set = set(ids)
+        if len(id_set) != len(ids) :
+            raise IndexError("duplicated ids")
+        available = set(self._id_list)
+        used = set(id for id in id_set if id < self._id_max) - available
+        if len(used) > 0 :
+            raise IndexError("id %d already used" % used.pop())
+        self._id_list = [id for id in self._id_list if id not in id_set]
+        if len(id_set) > 0 :
+            id_max = max(id_set) + 1
+            if id_max > self._id_max :
+                self._id_list.extend(id for id in xrange(self._id_max,id_max) if id not in id_set)
+                self._id_max = id_max
+        return ids
+
     def release_id (self, id) :
         if id>self._id_max :
             raise IndexError("id out of range")
@@ -142,3 +214,131 @@ class IdListGenerator(object) :
 
     def id_reuse_enabled(self):
         return self.reuse_enabled
+
+class IdIntervalGenerator(object) :
+    """
+    Id generator storing the unused ids as sorted intervals [start,stop[
+    (run-length free list): memory is proportional to the number of holes
+    and not to their size, and getting or releasing a given id is a
+    dichotomic search in the intervals.
+    """
+    def __init__ (self) :
+        self.clear()
+
+    def _find (self, id) :
+        """ Return the index of the interval containing `id`, -1 if none.
+        """
+        ind = bisect_right(self._starts,id) - 1
+        if ind >= 0 and id < self._stops[ind] :
+            return ind
+        return -1
+
+    def get_id (self, id = None) :
+        if id is None :
+            if len(self._starts) == 0 or not self.reuse_enabled :
+                ret = self._id_max
+                self._id_max += 1
+                return ret
+            else :
+                # take the last free id, only the last interval changes
+                ret = self._stops[-1] - 1
+                if ret == self._starts[-1] :
+                    del self._starts[-1]
+                    del self._stops[-1]
+                else :
+                    self._stops[-1] = ret
+                return ret
+        else :
+            if id >= self._id_max :
+                if id > self._id_max :
+                    if len(self._stops) > 0 and self._stops[-1] == self._id_max :
+                        self._stops[-1] = id
+                    else :
+                        self._starts.append(self._id_max)
+                        self._stops.append(id)
+                self._id_max = id+1
+                return id
+            ind = self._find(id)
+            if ind < 0 :
+                raise IndexError("id %d already used" % id)
+            start,stop = self._starts[ind],self._stops[ind]
+            if start == id and stop == id+1 :
+                del self._starts[ind]
+                del self._stops[ind]
+            elif start == id :
+                self._starts[ind] = id+1
+            elif stop == id+1 :
+                self._stops[ind] = id
+            else :
+                self._stops[ind] = id
+                self._starts.insert(ind+1,id+1)
+                self._stops.insert(ind+1,stop)
+            return id
+
+    def get_ids (self, nb = 0, ids = None) :
+        """ Reserve `nb` new ids, or the given `ids` if not None, in one shot.
+        """
+        if ids is None :
+            ret = []
+            if self.reuse_enabled :
+                while len(ret) < nb and len(self._starts) > 0 :
+                    start,stop = self._starts[-1],self._stops[-1]
+                    nb_taken = min(nb - len(ret),stop - start)
+                    ret.extend(xrange(stop - nb_taken,stop))
+                    if nb_taken == stop - start :
+                        del self._starts[-1]
+                        del self._stops[-1]
+                    else :
+                        self._stops[-1] = stop - nb_taken
+            nb_new = nb - len(ret)
+            ret.extend(xrange(self._id_max,self._id_max + nb_new))
+            self._id_max += nb_new
+            return ret
+        ids = list(ids)
+        if len(set(ids)) != len(ids) :
+            raise IndexError("duplicated ids")
+        for id in ids :
+            if id < self._id_max and self._find(id) < 0 :
+                raise IndexError("id %d already used" % id)
+        for id in sorted(ids) :
+            self.get_id(id)
+        return ids
+
+    def release_id (self, id) :
+        if id >= self._id_max :
+            raise IndexError("id out of range")
+        ind = bisect_right(self._starts,id) - 1
+        if ind >= 0 and id < self._stops[ind] :
+            raise IndexError("id already not used")
+        merge_before = ind >= 0 and self._stops[ind] == id
+        merge_after = ind+1 < len(self._starts) and self._starts[ind+1] == id+1
+        if merge_before and merge_after :
+            self._stops[ind] = self._stops[ind+1]
+            del self._starts[ind+1]
+            del self._stops[ind+1]
+        elif merge_before :
+            self._stops[ind] = id+1
+        elif merge_after :
+            self._starts[ind+1] = id
+        else :
+            self._starts.insert(ind+1,id)
+            self._stops.insert(ind+1,id+1)
+
+    def nb_free_intervals (self) :
+        """ Return the number of intervals of unused ids.
+        """
+        return len(self._starts)
+
+    def clear (self) :
+        """ Reset the generator.
+        """
+        self._id_max = 0
+        self._starts = []
+        self._stops = []
+        self.reuse_enabled = True
+
+    def enable_id_reuse(self, enabled = True) :
+        self.reuse_enabled = enabled
+
+    def id_reuse_enabled(self):
+        return self.reuse_enabled
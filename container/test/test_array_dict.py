@@ -0,0 +1,101 @@
+import pickle
+import numpy as np
+from openalea.container.array_dict import array_dict
+
+def test_array_dict_growth():
+    d = array_dict()
+    for i in xrange(1000):
+        d[i] = float(i)
+    assert len(d) == 1000 and d[10] == 10.
+    for i in xrange(0, 1000, 2):
+        del d[i]
+    assert len(d) == 500 and 2 not in d and 3 in d
+    assert list(d.keys()[:3]) == [1, 3, 5] and list(d.values([7, 9])) == [7., 9.]
+    d[2] = 4
+    assert d.keys()[-1] == 2 and d[2] == 4.
+    try:
+        d.values([0, 1])
+        assert False
+    except KeyError:
+        pass
+
+def test_array_dict_vector_values():
+    d = array_dict()
+    for i in xrange(100):
+        d[i] = np.array([i, 0., 1.])
+    d[100] = (1, 2, 3)
+    assert d.values().shape == (101, 3) and d[50][0] == 50. and d[100][2] == 3.
+    d[3] = np.array([1, 2, 3])
+    d[101] = np.array([0.5, 0.5, 0.5], np.float32)
+    assert d.values().dtype == np.float64 and list(d[3]) == [1., 2., 3.] and d[101][0] == 0.5
+    try:
+        d[102] = np.zeros(4)
+        assert False
+    except ValueError:
+        pass
+    assert 102 not in d and len(d) == 102
+    d[102] = np.array([1+1j, 0, 0])
+    assert d.values().dtype == np.complex128 and d[102][0] == 1+1j
+
+def test_array_dict_value_shape():
+    d = array_dict(np.zeros((3, 3)), [0, 1, 2])
+    for key, value in [(5, 7.), (0, 7.), (5, np.ones(1)), (10**12, 7.)]:
+        try:
+            d[key] = value
+            assert False
+        except ValueError:
+            pass
+    assert len(d) == 3 and 5 not in d and (d.values() == 0).all()
+
+def test_array_dict_values_copy():
+    d = array_dict([1., 2., 3.], [10, 11, 12])
+    v = d.values()
+    v[0] = 99.
+    assert d[10] == 1.
+    for i in xrange(100):
+        d[20+i] = 0.
+    d[10] = 5.
+    assert v[0] == 99. and d.values()[0] == 5.
+
+def test_array_dict_sparse_keys():
+    d = array_dict([1., 2., 3.], [10**12, -5, 3])
+    assert d[10**12] == 1. and -5 in d and 4 not in d
+    d[7] = 2.5
+    d.delete([-5, 8])
+    assert d.to_dict() == {10**12: 1., 3: 3., 7: 2.5}
+
+    d = array_dict(np.ones((3, 2)), np.array([[0, 1], [1, 2], [2, 3]]))
+    assert (1, 2) in d and (d.values(np.array([[2, 3], [0, 1]])) == 1).all()
+
+def test_array_dict_update():
+    d = array_dict(np.arange(5)*2., [4, 3, 2, 1, 0])
+    d.update(np.array([7, 6]), np.array([0, 10]), ignore_missing_keys=False)
+    assert d.to_dict() == {4: 0, 3: 2, 2: 4, 1: 6, 0: 7, 10: 6}
+    e = pickle.loads(pickle.dumps(d))
+    assert e.to_dict() == d.to_dict() and 10 in e
+
+def test_array_dict_select():
+    d = array_dict(np.arange(6)*1., [5, 4, 3, 2, 1, 0])
+    assert list(d.iterkeys()) == [5, 4, 3, 2, 1, 0] and list(d.iteritems())[1] == (4, 1.)
+    assert list(d.keys_where('>2')) == [2, 1, 0]
+    assert list(d.keys_where(('>=1', '<4'))) == [4, 3, 2]
+    assert list(d.keys_where(lambda v : v%2 == 0)) == [5, 3, 1]
+    assert d.select(d.values() > 3).to_dict() == {1: 4., 0: 5.}
+
+    # slice selections share the arrays of the dict
+    s = d.select(slice(1, 3))
+    s[4] = 10.
+    assert d[4] == 10. and s.to_dict() == {4: 10., 3: 2.}
+
+def test_array_dict_arithmetic():
+    d = array_dict(np.arange(6)*1., [5, 4, 3, 2, 1, 0])
+    e = array_dict([1., 2.], [0, 5])
+    assert (e*d).to_dict() == {0: 5., 5: 0.}
+    assert (2-e).to_dict() == {0: 1., 5: 0.}
+    assert (np.float64(2)*e).to_dict() == {0: 2., 5: 4.}
+    assert (-e + np.array([1, 2])).to_dict() == {0: 0., 5: 0.}
+    try:
+        d+e
+        assert False
+    except KeyError:
+        pass
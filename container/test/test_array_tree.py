@@ -0,0 +1,98 @@
+import numpy as np
+from openalea.container import Tree, PropertyTree
+from openalea.container.array_tree import ArrayTree
+from openalea.container.generator import regular_tree
+from openalea.container.traversal.tree import pre_order, post_order, level_order
+
+def random_tree (nb, seed = 0) :
+    rnd = np.random.RandomState(seed)
+    tree = PropertyTree()
+    tree.add_property("label")
+    for vid in xrange(1,nb) :
+        tree.add_child(rnd.randint(0,vid),label = "v%d" % vid)
+    return tree
+
+def test_traversals () :
+    for tree in (regular_tree(Tree(),0,nb_vertices = 19),random_tree(200) ) :
+        atree = tree.freeze()
+        assert len(atree) == len(tree)
+        assert atree.root == tree.root
+        for vid in tree :
+            assert atree.parent(vid) == tree.parent(vid)
+            assert atree.children(vid) == list(tree.children(vid) )
+            assert sorted(atree.siblings(vid) ) == sorted(tree.siblings(vid) )
+            assert atree.is_leaf(vid) == tree.is_leaf(vid)
+            assert list(atree.pre_order(vid) ) == list(pre_order(tree,vid) )
+            assert list(atree.post_order(vid) ) == list(post_order(tree,vid) )
+            assert list(atree.level_order(vid) ) == list(level_order(tree,vid) )
+            assert atree.subtree_size(vid) == len(list(pre_order(tree,vid) ) )
+        assert sorted(atree.iteredges() ) == sorted( (tree.parent(vid),vid) for vid in tree if vid != tree.root)
+
+def test_deep_tree () :
+    tree = Tree()
+    vid = tree.root
+    for i in xrange(20000) :
+        vid = tree.add_child(vid)
+    atree = tree.freeze()
+    assert atree.depth(vid) == 20000
+    assert list(atree.post_order() ) == range(20000,-1,-1)
+    assert list(post_order(tree,tree.root) ) == range(20000,-1,-1)
+    assert len(list(pre_order(tree,tree.root) ) ) == 20001
+
+def test_remove_tree () :
+    tree = random_tree(100,seed = 1)
+    atree = tree.freeze()
+    vid = tree.children(tree.root)[0]
+    removed = atree.remove_tree(vid)
+    assert removed == tree.remove_tree(vid)
+    assert len(atree) == len(tree)
+    assert vid not in atree
+    assert list(atree.pre_order() ) == list(pre_order(tree,tree.root) )
+    assert list(atree.post_order() ) == list(post_order(tree,tree.root) )
+    assert atree.children(tree.root) == tree.children(tree.root)
+    assert atree.property("label") == tree.property("label")
+
+    leaf = [v for v in tree if tree.is_leaf(v)][0]
+    atree.remove_vertex(leaf)
+    assert leaf not in atree
+    try :
+        atree.remove_vertex(atree.root)
+        assert False
+    except Exception :
+        pass
+
+def test_sub_tree () :
+    tree = random_tree(100,seed = 2)
+    atree = tree.freeze()
+    vid = tree.children(tree.root)[-1]
+    sub = atree.sub_tree(vid)
+    assert sub.root == vid
+    assert list(sub.pre_order() ) == list(pre_order(tree,vid) )
+    assert set(sub.property("label") ) == set(pre_order(tree,vid) )
+    assert len(atree) == 100
+
+    atree.remove_tree(tree.children(vid)[0])
+    atree.sub_tree(vid,copy = False)
+    assert list(atree.pre_order() ) == list(pre_order(sub,vid) )[:1] + \
+           [v for v in pre_order(sub,vid) if v in atree][1:]
+    assert atree.root == vid
+
+def test_thaw () :
+    tree = random_tree(50,seed = 3)
+    atree = ArrayTree.from_tree(tree)
+    thawed = atree.thaw()
+    assert isinstance(thawed,PropertyTree)
+    assert list(pre_order(thawed,thawed.root) ) == list(pre_order(tree,tree.root) )
+    assert thawed.property("label") == tree.property("label")
+    assert thawed.add_child(thawed.root) == 50
+
+    assert type(atree.thaw(Tree) ) is Tree
+
+def test_invalid_order () :
+    #level order of a tree is not a pre order
+    for parent in ([-1,0,0,1,1],[0,-1],[-1,1]) :
+        try :
+            ArrayTree(range(len(parent) ),parent)
+            assert False
+        except Exception :
+            pass
@@ -0,0 +1,86 @@
+import numpy as np
+from openalea.container import Topomesh, CompactTopomesh
+
+def square_grid_mesh(n):
+    """ mesh of degree 3: one cell made of n*n square faces"""
+    m = Topomesh(3)
+    pid = dict(((i, j), m.add_wisp(0)) for i in xrange(n+1) for j in xrange(n+1))
+    eid = {}
+    for (i, j) in pid:
+        for di, dj in [(1, 0), (0, 1)]:
+            if (i+di, j+dj) in pid:
+                eid[(i, j, di, dj)] = e = m.add_wisp(1)
+                m.link(1, e, pid[(i, j)])
+                m.link(1, e, pid[(i+di, j+dj)])
+    cid = m.add_wisp(3)
+    for i in xrange(n):
+        for j in xrange(n):
+            fid = m.add_wisp(2)
+            for key in [(i, j, 1, 0), (i, j, 0, 1), (i+1, j, 0, 1), (i, j+1, 1, 0)]:
+                m.link(2, fid, eid[key])
+            m.link(3, cid, fid)
+    return m
+
+def test_compact_topomesh():
+    m = square_grid_mesh(4)
+    m.remove_wisp(0, 3)
+    c = m.freeze()
+    assert isinstance(c, CompactTopomesh)
+    for deg in xrange(4):
+        assert sorted(c.wisps(deg)) == sorted(m.wisps(deg))
+        assert not c.has_wisp(deg, 1000)
+        wids = list(m.wisps(deg))
+        for offset in xrange(1, deg+1):
+            ptr, bids = c.batch_borders(deg, wids, offset)
+            for i, wid in enumerate(wids):
+                assert list(bids[ptr[i]:ptr[i+1]]) == sorted(m.borders(deg, wid, offset))
+                assert sorted(c.borders(deg, wid, offset)) == sorted(m.borders(deg, wid, offset))
+        for offset in xrange(1, 4-deg):
+            ptr, rids = c.batch_regions(deg, wids, offset)
+            for i, wid in enumerate(wids):
+                assert list(rids[ptr[i]:ptr[i+1]]) == sorted(m.regions(deg, wid, offset))
+        if deg > 0:
+            ptr, nids = c.batch_border_neighbors(deg, wids)
+            for i, wid in enumerate(wids):
+                assert list(nids[ptr[i]:ptr[i+1]]) == sorted(set(m.border_neighbors(deg, wid)))
+                assert c.nb_border_neighbors(deg, wid) == m.nb_border_neighbors(deg, wid)
+    # borders keep their link order
+    assert list(c.borders(2, 0)) == list(m._borders[2][0])
+
+    t = c.thaw()
+    for deg in xrange(4):
+        assert sorted(t.wisps(deg)) == sorted(m.wisps(deg))
+        for wid in m.wisps(deg):
+            if deg > 0:
+                assert list(t._borders[deg][wid]) == list(m._borders[deg][wid])
+            if deg < 3:
+                assert sorted(t.regions(deg, wid)) == sorted(m.regions(deg, wid))
+    t.add_wisp(0)
+    assert t.nb_wisps(0) == m.nb_wisps(0)+1
+
+def test_topomesh_batch_queries():
+    m = square_grid_mesh(3)
+    c = m.freeze()
+    for deg in xrange(4):
+        wids = list(m.wisps(deg))[::-1]
+        for offset in xrange(0, deg+1):
+            ptr, bids = m.batch_borders(deg, wids, offset)
+            cptr, cbids = c.batch_borders(deg, wids, offset)
+            assert list(ptr) == list(cptr) and list(bids) == list(cbids)
+        for offset in xrange(0, 4-deg):
+            ptr, rids = m.batch_regions(deg, wids, offset)
+            cptr, crids = c.batch_regions(deg, wids, offset)
+            assert list(ptr) == list(cptr) and list(rids) == list(crids)
+
+    # the cache is dropped when the mesh is modified
+    ptr, pids = m.batch_borders(3, [0], 3)
+    assert len(pids) == 16
+    pid = m.add_wisp(0)
+    m.link(1, 0, pid)
+    ptr, pids = m.batch_borders(3, [0], 3)
+    assert len(pids) == 17 and pids[-1] == pid
+    try:
+        m.batch_borders(2, [1000])
+        assert False
+    except KeyError:
+        pass
@@ -147,6 +147,19 @@ def test_add_vertex () :
     vid=g.add_vertex()
     assert g.has_vertex(vid)
 
+@with_setup(setup_func,teardown_func)
+def test_add_vertices () :
+    assert g.add_vertices([100,50])==[100,50]
+    vids=g.add_vertices(3)
+    assert len(vids)==3
+    assert all(g.has_vertex(vid) for vid in vids)
+    assert g.nb_vertices()==15
+    try :
+        g.add_vertices([3])
+        assert False
+    except KeyError :
+        pass
+
 @with_setup(setup_func,teardown_func)
 def test_remove_vertex () :
     g.remove_vertex(5)
@@ -174,6 +187,30 @@ def test_add_edge () :
     assert eid in list(g.in_edges(1))
     assert eid in list(g.out_edges(2))
 
+@with_setup(setup_func,teardown_func)
+def test_add_edges () :
+    eids=g.add_edges([0,2],[9,1])
+    assert len(eids)==2
+    assert g.edge_vertices(eids[0])==(0,9)
+    assert eids[1] in list(g.in_edges(1))
+    assert g.add_edges([3],[4],[100])==[100]
+    try :
+        g.add_edges([3],[4],[100])
+        assert False
+    except KeyError :
+        pass
+
+def test_from_edge_arrays () :
+    from numpy import array
+    for idgenerator in ["set","list","max"] :
+        h=Graph.from_edge_arrays(array([0,1,5]),array([1,5,0]),idgenerator=idgenerator)
+        assert sorted(h.vertices())==[0,1,5]
+        assert sorted(h.edges())==[0,1,2]
+        assert set(h.out_neighbors(5))==set([0])
+        vids=h.add_vertices(3)
+        assert len(set(vids)|set([0,1,5]))==6
+        assert h.nb_vertices()==6
+
 @with_setup(setup_func,teardown_func)
 def test_remove_edge () :
     g.remove_edge(4)
@@ -197,3 +234,21 @@ def test_extend () :
     trans_vid,trans_eid=g.extend(g)
     assert len(trans_vid)==10
     assert len(trans_eid)==9
+
+def test_interval_idgenerator () :
+    h=Graph(idgenerator="interval")
+    assert h.add_vertex(10**7)==10**7
+    assert h._vertices._id_generator.nb_free_intervals()==1
+    vid=h.add_vertex()
+    assert vid==10**7-1
+    assert h.add_vertex(5)==5
+    assert h._vertices._id_generator.nb_free_intervals()==2
+    h.remove_vertex(5)
+    h.remove_vertex(vid)
+    assert h._vertices._id_generator.nb_free_intervals()==1
+    assert sorted(h.add_vertices(3))==[10**7-3,10**7-2,10**7-1]
+    try :
+        h.add_vertex(10**7)
+        assert False
+    except KeyError :
+        pass
@@ -0,0 +1,37 @@
+import numpy as np
+from openalea.container import CompactTopomesh
+from openalea.container.mesh_shapes import regular_grid, hexagonal_grid
+
+def test_regular_grid():
+    m, pos = regular_grid((2, 3, 4), positions=True)
+    assert [m.nb_wisps(deg) for deg in xrange(4)] == [60, 133, 98, 24]
+    assert pos.shape == (60, 3) and tuple(pos.max(axis=0)) == (2, 3, 4)
+    for cid in m.wisps(3):
+        pids = list(m.borders(3, cid, 3))
+        assert len(pids) == 8
+        assert (pos[pids].max(axis=0) - pos[pids].min(axis=0) == 1).all()
+    for fid in m.wisps(2):
+        eids = list(m._borders[2][fid])
+        # edges of faces are in cyclic order
+        for eid1, eid2 in zip(eids, eids[1:]+eids[:1]):
+            assert len(set(m.borders(1, eid1)) & set(m.borders(1, eid2))) == 1
+    assert max(m.nb_regions(2, fid) for fid in m.wisps(2)) == 2
+
+    m = regular_grid((3, 2), compact=True)
+    assert isinstance(m, CompactTopomesh)
+    assert [m.nb_wisps(deg) for deg in xrange(3)] == [12, 17, 6]
+    m = regular_grid(4)
+    assert [m.nb_wisps(deg) for deg in xrange(2)] == [5, 4]
+
+def test_hexagonal_grid():
+    m, pos = hexagonal_grid((3, 4), positions=True)
+    assert m.nb_wisps(2) == 12
+    # Euler characteristic of a disk
+    assert m.nb_wisps(0) - m.nb_wisps(1) + m.nb_wisps(2) == 1
+    for fid in m.wisps(2):
+        pids = list(m.borders(2, fid, 2))
+        assert len(pids) == 6
+        center = pos[pids].mean(axis=0)
+        assert np.allclose(np.sqrt(((pos[pids]-center)**2).sum(axis=1)), 1.)
+    assert max(m.nb_regions(1, eid) for eid in m.wisps(1)) == 2
+    assert max(m.nb_border_neighbors(2, fid) for fid in m.wisps(2)) == 6
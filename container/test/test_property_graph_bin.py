@@ -0,0 +1,64 @@
+import os
+from tempfile import mkstemp
+import numpy as np
+from openalea.container import ColumnProperty
+from openalea.container.property_graph_bin import write_property_graph, read_property_graph, read_property_column
+from temporal_property_graph_input import create_TemporalGraph
+
+def test_property_graph_bin():
+    g = create_TemporalGraph()
+    g.add_vertex_property('volume', dict((vid, vid/2.) for vid in g.vertices()))
+    g.add_vertex_property('barycenter', dict((vid, np.array([vid, 0, 1])) for vid in g.vertices()))
+    g.add_vertex_property('partial', {1: 2, 3: 4})
+    g.add_edge_property('area', dict((eid, 2*eid) for eid in g.edges()))
+    g.add_graph_property('time_steps', [0, 12, 24])
+
+    fd, filename = mkstemp(suffix='.bin')
+    os.close(fd)
+    try:
+        write_property_graph(filename, g)
+        for lazy in [False, True]:
+            h = read_property_graph(filename, lazy=lazy)
+            assert type(h) == type(g) and h.nb_time_points == 3
+            assert sorted(h.vertices()) == sorted(g.vertices())
+            assert all(h.edge_vertices(eid) == g.edge_vertices(eid) for eid in g.edges())
+            for name in ['volume', 'partial', 'index', 'old_label']:
+                assert dict(h.vertex_property(name).iteritems()) == g.vertex_property(name)
+            assert all((h.vertex_property('barycenter')[vid] == g.vertex_property('barycenter')[vid]).all()
+                       for vid in g.vertices())
+            assert dict(h.edge_property('area').iteritems()) == g.edge_property('area')
+            assert h.edge_property('edge_type') == g.edge_property('edge_type')
+            assert h.graph_property('time_steps') == [0, 12, 24]
+            assert h.out_neighbors(4, 't') == g.out_neighbors(4, 't')
+            assert isinstance(h.vertex_property('volume'), ColumnProperty) == lazy
+
+        # the file is not modified by the changes of a lazily loaded graph
+        h.vertex_property('volume')[3] = 100.
+        vids, values = read_property_column(filename, 'volume')
+        assert values[list(vids).index(3)] == 1.5
+        vids, values = read_property_column(filename, 'partial')
+        assert list(vids) == [1, 3] and list(values) == [2, 4]
+
+        h = read_property_graph(filename, vertex_properties=['volume'], edge_properties=[])
+        assert 'volume' in h.vertex_property_names() and 'barycenter' not in h.vertex_property_names()
+        assert len(h.vertex_property('index')) == 0
+    finally:
+        os.remove(filename)
+
+
+def test_property_graph_bin_stray_keys():
+    g = create_TemporalGraph()
+    vids = sorted(g.vertices())
+    stray = {max(vids)+5: 1., -5: 2., vids[0]: 3.}
+    g.add_vertex_property('stray', stray)
+    g.add_vertex_property('named', {'a': 1., vids[0]: 2.})
+
+    fd, filename = mkstemp(suffix='.bin')
+    os.close(fd)
+    try:
+        write_property_graph(filename, g)
+        h = read_property_graph(filename)
+        assert dict(h.vertex_property('stray').iteritems()) == stray
+        assert dict(h.vertex_property('named').iteritems()) == {'a': 1., vids[0]: 2.}
+    finally:
+        os.remove(filename)
@@ -3,6 +3,7 @@ __license__ = "Cecill-C"
 __revision__ = " $Id: test_property_graph.py 7865 2010-02-08 18:04:39Z cokelaer $ "
 
 # Test node module
+import numpy as np
 from openalea.container import PropertyGraph
 from openalea.container import TemporalPropertyGraph
 from temporal_property_graph_input import create_TemporalGraph
@@ -123,6 +124,198 @@ def test_temporalPropertyGraph():
                                                                 18: 6,
                                                                 19: 6}
 
+def test_floyd_warshall():
+    g = create_TemporalGraph()
+    for edge_type in [None, 's', 't']:
+        distances = g.floyd_warshall(edge_type)
+        for vid in g.vertices():
+            assert dict(enumerate(distances[vid])) == g.topological_distance(vid, edge_type)
+        assert (g.floyd_warshall(edge_type, method='sparse', dtype=np.float32) == distances).all()
+        bounded = g.floyd_warshall(edge_type, max_depth=2).toarray()
+        assert (bounded == np.where(distances <= 2, distances, 0)).all()
+
+def test_to_csr():
+    g = create_TemporalGraph()
+    adjacency, vids = g.to_csr()
+    assert list(vids) == sorted(g.vertices())
+    assert adjacency.nnz == g.nb_edges()
+    assert g.to_csr()[0] is adjacency
+    assert g.to_csr('t', oriented=False)[0].nnz == 2*len(g.edges(edge_type='t'))
+
+    vid = g.add_vertex()
+    adjacency, vids = g.to_csr()
+    assert adjacency.shape == (21, 21) and vids[-1] == vid
+    g.add_edge(vid, 0)
+    assert g.to_csr()[0].nnz == g.nb_edges()
+    g.remove_vertex(vid)
+    assert g.to_csr()[0].shape == (20, 20)
+
+def test_neighborhoods():
+    g = create_TemporalGraph()
+    for edge_type in [None, 's', 't']:
+        for max_distance in [0, 1, 2, float('inf')]:
+            neighborhoods = g.neighborhoods(max_distance=max_distance, edge_type=edge_type)
+            for vid in g.vertices():
+                assert neighborhoods[vid] == g.neighborhood(vid, max_distance, edge_type)
+    assert g.neighborhoods([2, 3], 2, 's') == {2: set([2, 3, 4, 5]), 3: set([2, 3, 4, 5, 6])}
+    assert g.topological_distance(3, max_depth=1, full_dict=False) == {0: 1, 2: 1, 3: 0, 4: 1, 5: 1, 9: 1}
+
+def test_edge_type_index():
+    g = create_TemporalGraph()
+    nb_temporal = len(g.edges(edge_type='t'))
+    assert g.to_csr('t')[0].nnz == nb_temporal
+    assert sorted(g.iter_out_neighbors(4, 't')) == [10, 11, 12, 13]
+
+    g.edge_property('edge_type')[g.edge(4, 5)] = 't'
+    assert g.out_neighbors(4, 't') == set([5, 10, 11, 12, 13])
+    assert g.out_neighbors(4, 's') == set()
+    assert g.to_csr('t')[0].nnz == nb_temporal + 1
+
+    eid = g.add_edge(4, 6, edge_type='s')
+    assert g.out_edges(4, 's') == set([eid])
+    g.remove_edge(eid)
+    assert g.out_edges(4, 's') == set()
+    assert g.edges(edge_type=set(['s', 't'])) == set(g.edges())
+
+def test_lineage_index():
+    g = create_TemporalGraph()
+    assert g.descendants(0, 1) == set([0, 2, 3, 4])
+    assert g.descendants(0) == set([0, 2, 3, 4, 7, 8, 9, 10, 11, 12, 13])
+    assert g.rank_descendants(0, 2) == set([7, 8, 9, 10, 11, 12, 13])
+    assert g.rank_descendants([2, 3]) == [set([7, 8]), set([9])]
+    assert g.ancestors(16) == set([1, 6, 16])
+    assert g.rank_ancestors(16, 2) == set([1])
+    assert g.has_descendants(2) and not g.has_descendants(2, 2)
+    assert g.rank_descendants_at_time(1) == dict((vid, g.rank_descendants(vid)) for vid in g.vertex_at_time(1))
+    assert g.rank_ancestors_at_time(2, 2)[16] == set([1])
+
+    # the index follows the changes of the temporal edges
+    eid = g.add_edge(0, 5, edge_type='t')
+    assert g.descendants(0, 1) == set([0, 2, 3, 4, 5])
+    assert g.rank_ancestors(5) == set([0, 1])
+    g.remove_edge(eid)
+    assert g.descendants(0, 1) == set([0, 2, 3, 4])
+
+def test_fully_lineaged_vertex():
+    graphs = []
+    for nb_vertices in (2, 3, 2):
+        p = PropertyGraph()
+        for vid in range(nb_vertices):
+            p.add_vertex(vid)
+        graphs.append(p)
+    g = TemporalPropertyGraph()
+    # mother 0 has a tracked daughter (2) and an untracked one (3), mother 1 a tracked daughter (4)
+    g.extend(graphs, [{0: [0, 1], 1: [2]}, {0: [0], 2: [1]}])
+    assert g.rank_descendants([0, 1]) == [set([2, 3]), set([4])]
+    assert g.rank_descendants([0, 1], 2) == [set([5]), set([6])]
+    # all the relatives must be tracked, not only one of them
+    assert sorted(g.lineaged_vertex(fully_lineaged=True)) == [1, 4, 6]
+    assert g._fully_lineaged_vertex(1) == [4]
+    assert sorted(g.lineaged_vertex(lineage_rank=2)) == [1, 5, 6]
+    assert sorted(g.lineaged_vertex()) == range(7)
+
+def test_time_point_index():
+    from openalea.container.temporal_property_graph import label2vertex_map, labelpair2edge_map, edge2vertexpair_map
+    g = create_TemporalGraph()
+    assert g.vertex_at_time(1) == [2, 3, 4, 5, 6]
+    assert sorted(g.edge_at_time(0)) == [0]
+    assert edge2vertexpair_map(g, 1)[5] == [3, 5]
+
+    g.add_vertex_property('label', dict((vid, 2*vid) for vid in g.vertices()))
+    assert label2vertex_map(g, 1) == {4: 2, 6: 3, 8: 4, 10: 5, 12: 6}
+    assert labelpair2edge_map(g, 0) == {(0, 2): 0}
+    # the maps follow the changes of the graph and of the labels
+    vid = g.add_vertex()
+    g.vertex_property('index')[vid] = 0
+    g.vertex_property('label')[vid] = 100
+    eid = g.add_edge(0, vid)
+    assert label2vertex_map(g, 0)[100] == vid
+    assert labelpair2edge_map(g, 0)[(0, 100)] == eid
+
+def test_time_point_index_property_edits():
+    import cPickle as pickle
+    from openalea.container.temporal_property_graph import label2vertex_map
+    g = create_TemporalGraph()
+    g.add_vertex_property('label', dict((vid, 2*vid) for vid in g.vertices()))
+    # edited label values, same number of labels
+    assert label2vertex_map(g, 1)[6] == 3
+    g.vertex_property('label')[3] = 99
+    assert label2vertex_map(g, 1)[99] == 3
+    assert 6 not in label2vertex_map(g, 1)
+    # index value set after the maps were built
+    vid = g.add_vertex()
+    label2vertex_map(g, 0)
+    g.vertex_property('index')[vid] = 0
+    assert vid in g.vertex_at_time(0)
+    # the indices of a pickled graph follow its edits too
+    g = pickle.loads(pickle.dumps(g))
+    assert label2vertex_map(g, 1)[99] == 3
+    g.vertex_property('label')[3] = 6
+    assert label2vertex_map(g, 1)[6] == 3
+
+def test_columnar_property():
+    g = create_TemporalGraph()
+    volume = dict((vid, float(vid)) for vid in g.vertices())
+    g.add_vertex_property('volume', volume, columnar=True)
+    g.add_vertex_property('volume_dict', volume)
+    prop = g.vertex_property('volume')
+    assert prop == volume
+    assert prop[3] == 3. and 25 not in prop
+
+    vids = [5, 1, 7]
+    assert list(g.vertex_property('volume', vids)) == [5., 1., 7.]
+    assert g.vertex_property('volume_dict', vids) == {5: 5., 1: 1., 7: 7.}
+    assert sorted(prop.select(lambda v: v >= 17)) == [17, 18, 19]
+
+    prop.assign([1, 2], [10, 20])
+    assert prop[1] == 10. and prop[2] == 20.
+    prop[4] = 'label'
+    assert prop[4] == 'label' and prop[5] == 5.
+
+    g.add_edge_property('weight', columnar=True, dtype=np.float32)
+    eid = g.edge(4, 5)
+    g.edge_property('weight')[eid] = 2
+    assert list(g.edge_property('weight', [eid])) == [2.]
+
+    g.remove_vertex(4)
+    assert 4 not in prop and eid not in g.edge_property('weight')
+    assert len(prop) == len(g)
+
+def test_columnar_property_dtype():
+    g = create_TemporalGraph()
+    g.add_vertex_property('a', columnar=True, dtype=np.float32)
+    prop = g.vertex_property('a')
+    prop[0] = 1.5
+    prop[1] = 2
+    prop.assign([2, 3], [0.25, 1e30])
+    prop.update({4: 3.})
+    assert prop.values_array().dtype == np.float32
+    assert prop[1] == 2. and prop[2] == 0.25
+    try:
+        prop[5] = 1e300
+        assert False
+    except ValueError:
+        pass
+    assert 5 not in prop
+
+    g.add_vertex_property('b', columnar=True, dtype=np.int32)
+    prop = g.vertex_property('b')
+    prop[0] = 3
+    prop.assign([1, 2], np.array([4, 5], dtype=np.int64))
+    for value in [2**40, 2.5, 'label']:
+        try:
+            prop[3] = value
+            assert False
+        except ValueError:
+            pass
+    try:
+        prop.assign([3, 4], [1, 2**40])
+        assert False
+    except ValueError:
+        pass
+    assert prop.values_array().dtype == np.int32 and 3 not in prop
+    assert list(g.vertex_property('b', [0, 1, 2])) == [3, 4, 5]
+
 def func_regional_bin(graph, vid):
     return (len(graph.neighborhood(vid))-1)==4
 
@@ -0,0 +1,55 @@
+import os
+from mmap import mmap
+from tempfile import mkstemp
+import numpy as np
+from openalea.container import PropertyTopomesh, CompactTopomesh, array_dict
+from openalea.container.topomesh_bin import write_topomesh, read_topomesh
+from test_compact_topomesh import square_grid_mesh
+
+def is_mapped(array):
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return isinstance(array, mmap)
+
+def test_topomesh_bin():
+    m = square_grid_mesh(3)
+    pm = PropertyTopomesh(3, m)
+    pids = np.array(list(pm.wisps(0)))
+    pm.add_wisp_property('barycenter', 0, array_dict(np.random.rand(len(pids), 3), pids))
+    pm.add_wisp_property('label', 2, dict((fid, 'f%d' % fid) for fid in pm.wisps(2)))
+    pm.add_wisp_property('area', 2, dict((fid, 1.) for fid in pm.wisps(2)))
+
+    fd, filename = mkstemp(suffix='.bin')
+    os.close(fd)
+    try:
+        write_topomesh(filename, pm)
+        for lazy in [False, True]:
+            n = read_topomesh(filename, lazy=lazy)
+            assert type(n) == PropertyTopomesh
+            for deg in xrange(4):
+                assert sorted(n.wisps(deg)) == sorted(m.wisps(deg))
+                for wid in m.wisps(deg):
+                    if deg > 0:
+                        assert list(n._borders[deg][wid]) == list(m._borders[deg][wid])
+                    if deg < 3:
+                        assert sorted(n.regions(deg, wid)) == sorted(m.regions(deg, wid))
+            assert (n.wisp_property('barycenter', 0).values(pids) == pm.wisp_property('barycenter', 0).values(pids)).all()
+            assert n.wisp_property('label', 2).to_dict() == pm.wisp_property('label', 2).to_dict()
+            # lazily read properties are views on the mapped file
+            assert is_mapped(n.wisp_property('barycenter', 0).values()) == lazy
+            n.add_wisp(0)
+
+        n = read_topomesh(filename, degrees=[2, 3], wisp_properties=[(2, 'area')])
+        assert n.nb_wisps(0) == 0 and n.nb_wisps(2) == 9 and n.nb_borders(2, 0) == 0
+        assert sorted(n.borders(3, 0)) == range(9)
+        assert list(n.wisp_property_names(2)) == ['area'] and list(n.wisp_property_names(0)) == []
+
+        c = read_topomesh(filename, lazy=True, compact=True)
+        assert isinstance(c, CompactTopomesh) and c.nb_wisps(1) == m.nb_wisps(1)
+        assert is_mapped(c.wisp_array(1))
+        write_topomesh(filename, c)
+        assert isinstance(read_topomesh(filename), CompactTopomesh)
+    finally:
+        os.remove(filename)
@@ -0,0 +1,89 @@
+import numpy as np
+from openalea.container import Topomesh
+from openalea.container.mesh_shapes import regular_grid
+from openalea.container.topomesh_algo import connected_components, \
+                                             find_connex_parts, \
+                                             cycle_basis, face_cycles
+
+def two_squares () :
+    """Two disjoint squares, each cut in two triangles
+    """
+    mesh = Topomesh(2)
+    for offset in (0,10) :
+        for i in xrange(4) :
+            mesh.add_wisp(0,offset + i)
+        for eid,(pid1,pid2) in enumerate([(0,1),(1,2),(2,3),(3,0),(0,2)]) :
+            mesh.add_wisp(1,offset + eid)
+            mesh.link(1,offset + eid,offset + pid1)
+            mesh.link(1,offset + eid,offset + pid2)
+        for fid,eids in enumerate([(0,1,4),(2,3,4)]) :
+            mesh.add_wisp(2,offset + fid)
+            for eid in eids :
+                mesh.link(2,offset + fid,offset + eid)
+    return mesh
+
+def test_connected_components () :
+    mesh = two_squares()
+    labels = connected_components(mesh,2,[0,1,10,11])
+    assert list(labels) == [0,0,1,1]
+    labels = connected_components(mesh,0,[10,11,12,13,0,1,2,3])
+    assert list(labels) == [0,0,0,0,1,1,1,1]
+    labels = connected_components(mesh,1)
+    assert labels.max() == 1
+
+    #only paths through wids
+    assert list(connected_components(mesh,1,[0,2,10]) ) == [0,1,2]
+
+    mesh = regular_grid( (5,4),compact = True)
+    assert (connected_components(mesh,2) == 0).all()
+    assert (connected_components(mesh,0) == 0).all()
+
+def test_find_connex_parts () :
+    mesh = two_squares()
+    parts = sorted(sorted(part) for part in find_connex_parts(mesh,2,[11,0,10,1]) )
+    assert parts == [[0,1],[10,11]]
+    assert list(find_connex_parts(mesh,2,[]) ) == []
+
+def check_loop (mesh, eids) :
+    """Check that consecutive edges share a point
+    """
+    for i,eid in enumerate(eids) :
+        nid = eids[(i + 1) % len(eids)]
+        assert len(set(mesh.borders(1,eid) ) & set(mesh.borders(1,nid) ) ) == 1
+
+def test_cycle_basis () :
+    mesh = two_squares()
+    ptr,cycles = cycle_basis(mesh)
+    #one independent cycle per triangle
+    assert len(ptr) - 1 == 4
+    for i in xrange(len(ptr) - 1) :
+        check_loop(mesh,cycles[ptr[i]:ptr[i + 1]])
+
+    mesh = regular_grid( (6,5) )
+    ptr,cycles = cycle_basis(mesh)
+    assert len(ptr) - 1 == mesh.nb_wisps(1) - mesh.nb_wisps(0) + 1
+    for i in xrange(len(ptr) - 1) :
+        cycle = cycles[ptr[i]:ptr[i + 1]]
+        assert len(set(cycle) ) == len(cycle)
+        check_loop(mesh,cycle)
+
+    #a tree has no cycle
+    ptr,cycles = cycle_basis(mesh,1,[0,1,2])
+    assert len(ptr) == 1 and len(cycles) == 0
+
+def test_face_cycles () :
+    mesh = regular_grid( (3,3) )
+    fids = list(mesh.wisps(2) )
+    ptr,pids,eids = face_cycles(mesh,fids)
+    for i,fid in enumerate(fids) :
+        loop_pids = pids[ptr[i]:ptr[i + 1]]
+        loop_eids = eids[ptr[i]:ptr[i + 1]]
+        assert set(loop_eids) == set(mesh.borders(2,fid) )
+        assert set(loop_pids) == set(mesh.borders(2,fid,2) )
+        for j,eid in enumerate(loop_eids) :
+            assert set(mesh.borders(1,eid) ) == set([loop_pids[j],loop_pids[(j + 1) % len(loop_pids)]])
+
+    mesh = two_squares()
+    ptr,pids,eids = face_cycles(mesh,[11])
+    assert list(ptr) == [0,3]
+    check_loop(mesh,eids)
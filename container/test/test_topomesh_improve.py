@@ -0,0 +1,119 @@
+import numpy as np
+from openalea.container import Topomesh
+from openalea.container.topomesh_geom_algo import flip_necessary
+from openalea.container.topomesh_algo import is_flip_topo_allowed
+from openalea.container.topomesh_improve import MeshImprover, improve_mesh
+
+def triangulated_grid (n, jitter = 0., seed = 0) :
+    """Grid of n x n squares cut in two triangles
+    along the same diagonal, with random moves of points
+    """
+    rnd = np.random.RandomState(seed)
+    mesh = Topomesh(2)
+    pos = {}
+    for j in xrange(n + 1) :
+        for i in xrange(n + 1) :
+            pid = mesh.add_wisp(0)
+            pos[pid] = np.array([i,j],float) + rnd.uniform(-jitter,jitter,2)
+    edges = {}
+    def edge (pid1, pid2) :
+        key = (min(pid1,pid2),max(pid1,pid2) )
+        try :
+            return edges[key]
+        except KeyError :
+            eid = mesh.add_wisp(1)
+            mesh.link(1,eid,pid1)
+            mesh.link(1,eid,pid2)
+            edges[key] = eid
+            return eid
+    for j in xrange(n) :
+        for i in xrange(n) :
+            p00 = j * (n + 1) + i
+            p10,p01,p11 = p00 + 1,p00 + n + 1,p00 + n + 2
+            for corners in ( (p00,p10,p11),(p00,p11,p01) ) :
+                fid = mesh.add_wisp(2)
+                for k in xrange(3) :
+                    mesh.link(2,fid,edge(corners[k],corners[(k + 1) % 3]) )
+    return mesh,pos
+
+def check_mesh (mesh, pos) :
+    assert set(pos) == set(mesh.wisps(0) )
+    for fid in mesh.wisps(2) :
+        assert mesh.nb_borders(2,fid) == 3
+        assert len(set(mesh.borders(2,fid,2) ) ) == 3
+    for eid in mesh.wisps(1) :
+        assert len(set(mesh.borders(1,eid) ) ) == 2
+        assert 1 <= mesh.nb_regions(1,eid) <= 2
+
+def test_flip () :
+    mesh = Topomesh(2)
+    pos = {}
+    for pid,pt in enumerate([(-1,0),(1,0),(0,0.3),(0,-0.3)]) :
+        mesh.add_wisp(0,pid)
+        pos[pid] = np.array(pt,float)
+    for eid,(pid1,pid2) in enumerate([(0,1),(0,2),(1,2),(0,3),(1,3)]) :
+        mesh.add_wisp(1,eid)
+        mesh.link(1,eid,pid1)
+        mesh.link(1,eid,pid2)
+    for fid,eids in enumerate([(0,1,2),(0,3,4)]) :
+        mesh.add_wisp(2,fid)
+        for eid in eids :
+            mesh.link(2,fid,eid)
+
+    improver = MeshImprover(mesh,pos,protected_edges = [0])
+    assert improver.run() == 0
+
+    improver = MeshImprover(mesh,pos)
+    assert improver.run() == 1
+    assert improver.nb_flips == 1
+    assert set(mesh.borders(1,0) ) == set([2,3])
+    assert improver.step() is None
+
+def test_flip_grid () :
+    mesh,pos = triangulated_grid(8,0.3)
+    nb_faces = mesh.nb_wisps(2)
+    stats = improve_mesh(mesh,pos)
+    assert stats["flips"] > 0
+    assert stats["collapses"] == 0
+    assert mesh.nb_wisps(2) == nb_faces
+    check_mesh(mesh,pos)
+    for eid in mesh.wisps(1) :
+        assert not (is_flip_topo_allowed(mesh,eid) and flip_necessary(mesh,eid,pos) )
+
+def test_collapse_grid () :
+    mesh,pos = triangulated_grid(8,0.4,seed = 1)
+    nb_points = mesh.nb_wisps(0)
+    improver = MeshImprover(mesh,pos,collapse_length = 0.5,flip = False)
+    nb = improver.run()
+    assert nb == improver.nb_collapses > 0
+    assert mesh.nb_wisps(0) == nb_points - nb
+    check_mesh(mesh,pos)
+    #euler characteristic of a disk
+    assert mesh.nb_wisps(0) - mesh.nb_wisps(1) + mesh.nb_wisps(2) == 1
+
+    #remaining short edges can not be collapsed
+    for eid in mesh.wisps(1) :
+        pid1,pid2 = mesh.borders(1,eid)
+        if np.linalg.norm(pos[pid1] - pos[pid2]) < 0.5 :
+            assert improver._collapse_position(eid) is None
+
+def test_max_operations () :
+    mesh,pos = triangulated_grid(6,0.3)
+    improver = MeshImprover(mesh,pos,collapse_length = 0.5)
+    assert improver.run(2) == 2
+    stats = improver.statistics()
+    assert stats["flips"] + stats["collapses"] == 2
+    assert stats["evaluations"] >= mesh.nb_wisps(1)
+
+def test_initial_evaluation () :
+    mesh,pos = triangulated_grid(6,0.4,seed = 2)
+    improver = MeshImprover(mesh,pos,collapse_length = 0.6,protected_edges = [0,1])
+    queued = dict( (eid,(rank,key,kind) ) for rank,key,stamp,eid,kind in improver._queue)
+    for eid in mesh.wisps(1) :
+        entry = improver._evaluate(eid)
+        if entry is None :
+            assert eid not in queued
+        else :
+            (rank,key),kind = entry
+            assert queued[eid][0] == rank and queued[eid][2] == kind
+            assert abs(queued[eid][1] - key) < 1e-9
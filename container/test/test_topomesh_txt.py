@@ -0,0 +1,50 @@
+import os
+from tempfile import mkstemp
+from openalea.container import DataProp, write_topomesh, read_topomesh
+from test_compact_topomesh import square_grid_mesh
+
+def test_topomesh_txt():
+    m = square_grid_mesh(3)
+    x = DataProp(dict((pid, pid*0.5) for pid in m.wisps(0)), type="float", unit="m")
+    name = DataProp(dict((pid, "p%d" % pid) for pid in m.wisps(0)), type="str")
+    flag = DataProp(dict((eid, eid%2 == 0) for eid in m.wisps(1)), type="bool")
+    pair = DataProp(dict((eid, (eid, 1)) for eid in m.wisps(1)), type="tuple")
+
+    fd, filename = mkstemp(suffix='.msh')
+    os.close(fd)
+    try:
+        for descr in ["a mesh\non two lines", ""]:
+            write_topomesh(filename, m, descr, [[('x', x), ('name', name)], [('flag', flag), ('pair', pair)]])
+            n, read_descr, props = read_topomesh(filename)
+            assert read_descr == descr
+            for deg in xrange(4):
+                assert sorted(n.wisps(deg)) == sorted(m.wisps(deg))
+                for wid in m.wisps(deg):
+                    if deg > 0:
+                        assert sorted(n.borders(deg, wid)) == sorted(m.borders(deg, wid))
+                    if deg < 3:
+                        assert sorted(n.regions(deg, wid)) == sorted(m.regions(deg, wid))
+            (xname, rx), (_, rname) = props[0]
+            assert xname == 'x' and rx.unit() == 'm' and rx == x and rname == name
+            assert props[1][0][1] == flag and props[1][1][1] == pair
+            assert props[2] == []
+    finally:
+        os.remove(filename)
+
+def test_topomesh_txt_no_eval():
+    fd, filename = mkstemp(suffix='.msh')
+    os.close(fd)
+    try:
+        f = open(filename, 'w')
+        f.write("BEGIN topomesh degree 1\n\nBEGIN properties description\ndeg0\tv(int,)\n"
+                "END properties description\n\nBEGIN wisp degree 0\nid 0\t__import__('os')\n"
+                "END wisp degree 0\nBEGIN wisp degree 1\nEND wisp degree 1\n"
+                "BEGIN decomposition\nEND decomposition\nEND topomesh\n")
+        f.close()
+        try:
+            read_topomesh(filename)
+            assert False
+        except ValueError:
+            pass
+    finally:
+        os.remove(filename)
@@ -0,0 +1,46 @@
+"""
+Compare the throughput of writing and reading a zipped inrimage
+with a single gzip stream (data copied by tostring) and with the
+block gzip files of image.serial, compressed by a pool of threads.
+"""
+import gzip
+import os
+from multiprocessing import cpu_count
+from time import time
+import numpy as np
+from openalea.image.spatial_image import SpatialImage
+from openalea.image.serial.inrimage import read_inrimage, write_inrimage
+
+shape = (512,512,40)
+rnd = np.random.RandomState(0)
+#labelled like image, compressible
+img = SpatialImage( (np.indices(shape).sum(axis = 0) // 50 + rnd.randint(0,4,shape) ).astype(np.uint16) )
+size = img.nbytes / 2. ** 20
+filename = "bench_inrimage.inr.gz"
+
+t = time()
+f = gzip.GzipFile(filename,"wb")
+f.write(img.tostring("F") )
+f.close()
+t_gzip = time() - t
+t = time()
+data = gzip.open(filename,"rb").read()
+t_gunzip = time() - t
+del data
+print "single gzip stream: write %.1f MB/s, read %.1f MB/s" % (size / t_gzip,size / t_gunzip)
+
+for nb_threads in sorted(set([1,cpu_count()]) ) :
+    t = time()
+    write_inrimage(filename,img,nb_threads = nb_threads)
+    t_write = time() - t
+    t = time()
+    read_im = read_inrimage(filename)
+    t_read = time() - t
+    assert (read_im == img).all()
+    t = time()
+    read_inrimage(filename,z_range = (30,32) )
+    t_roi = time() - t
+    print "block gzip, %d threads: write %.1f MB/s, read %.1f MB/s, 2 last planes read in %.3fs" \
+           % (nb_threads,size / t_write,size / t_read,t_roi)
+
+os.remove(filename)
@@ -21,6 +21,6 @@ from openalea.image.gui.all import *
 from openalea.image.interpolation.all import *
 from openalea.image.registration.all import *
 from openalea.image.serial.all import *
-from openalea.image.spatial_image import SpatialImage
+from openalea.image.spatial_image import SpatialImage, LazySpatialImage
 
 #from image_test import *
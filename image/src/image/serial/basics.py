@@ -23,24 +23,27 @@ __revision__=" $Id$ "
 
 from os.path import exists, splitext, split as psplit, expanduser as expusr
 import os, fnmatch
+from collections import deque
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 from scipy.misc import imsave as _imsave
 from struct import pack,unpack,calcsize
 from pickle import dumps,loads
 import numpy as np
 
-from openalea.image.spatial_image import SpatialImage
+from openalea.image.spatial_image import SpatialImage, LazySpatialImage, LAZY_CACHE_SIZE
 from openalea.image.pil import Image, ImageOps
 
 #~ from inrimage import *
-from openalea.image.serial.inrimage import read_inrimage, write_inrimage
+from openalea.image.serial.inrimage import read_inrimage, open_inrimage, write_inrimage
 #~ from lsm import *
-from openalea.image.serial.lsm import read_lsm
+from openalea.image.serial.lsm import read_lsm, open_lsm
 #~ from tif import *
-from openalea.image.serial.tif import read_tif, write_tif
+from openalea.image.serial.tif import read_tif, open_tif, write_tif
 
 
-__all__ = ["save", "load", "read_sequence", "imread", "imsave", "lazy_image_or_path"]
+__all__ = ["save", "load", "open_npy", "read_sequence", "iter_sequence", "imread", "imsave", "lazy_image_or_path"]
 
 def save (filename, img, is_vectorial=False) :
     """Save an array to a binary file in numpy format with a |SpatialImage| header.
@@ -162,76 +165,176 @@ def load (file, mmap_mode=None, is_vectorial=False) :
         return SpatialImage(np.load(file,mmap_mode))
 
 
+def open_npy (filename, chunk_depth=None, cache_size=LAZY_CACHE_SIZE) :
+    """Open a ``.npy`` file, with or without a |SpatialImage| header,
+    without reading its datas
+
+    The array is memory mapped and z planes are copied
+    from the file when accessed.
+
+    :Parameters:
+     - `filename` (str)
+     - `chunk_depth` (int) - number of z planes read at once
+     - `cache_size` (int) - maximal size in bytes of the planes kept in memory
+
+    :Returns Type: |LazySpatialImage|
+    """
+    f = open(filename,'rb')
+    try :
+        res,info = None,{}
+        if f.read(12) == "SpatialImage" :
+            nb, = unpack('i',f.read(calcsize('i') ) )
+            res,info = loads(f.read(nb) )
+        else :
+            f.seek(0)
+        version = np.lib.format.read_magic(f)
+        read_header = getattr(np.lib.format,"read_array_header_%d_%d" % version)
+        shape,fortran_order,dtype = read_header(f)
+        offset = f.tell()
+    finally :
+        f.close()
+
+    data = np.memmap(filename,dtype,'r',offset,shape,'F' if fortran_order else 'C')
+    if len(shape) == 2 :
+        data = data.reshape(shape + (1,) )
+        if res is not None and len(res) == 2 :
+            res += (1.,)
+    if res is None or len(res) == data.ndim :
+        vdim = 1
+    else :
+        vdim = data.shape[-1]
+
+    def read_planes (z_start, z_stop) :
+        return np.array(data[:,:,z_start:z_stop],order='F')
+
+    return LazySpatialImage(data.shape,dtype,read_planes,res,vdim,info,
+                            chunk_depth,cache_size)
+
+
 ##################################################
 # TODO : Read voxels size in xlm file if provided #
 ##################################################
-def read_sequence ( directory, grayscale=True, number_images=None, start=0, increment=1, filename_contains="", voxels_size=None, verbose=True) :
+def _select_sequence (directory, number_images, start, increment, filename_contains, verbose) :
+    """Sorted image files of a folder, selected by `start`, `increment`
+    and `number_images` among the files PIL is able to open
+
+    Only image headers are read. Files of a different size than
+    the first selected one are discarded.
+
+    :Returns: list of filenames
+    """
+    selected = []
+    size = None
+    index = 0
+    for f in sorted(os.listdir(directory)) :
+        if number_images is not None and len(selected) == number_images :
+            break
+        if not fnmatch.fnmatch(f, '*%s*' %filename_contains) :
+            continue
+        try :
+            im_size = Image.open(os.path.join(directory, f)).size
+        except Exception :
+            if verbose : print "\t warning : cannot open %s" %f
+            continue
+        if index >= start and (index - start) % increment == 0 :
+            if size is None :
+                size = im_size
+            if im_size == size :
+                selected.append(f)
+            else :
+                if verbose : print "%s : wrong size - %s expected, %s found" %(f, size, im_size)
+        index += 1
+    return selected
+
+def _decode_frame (filename, grayscale) :
+    """Decode an image file as an array (x, y[, bands]), i.e.
+    (columns, rows[, bands]) of the image, like the z slices
+    of the volumes of the other readers
+    """
+    im = Image.open(filename)
+    if grayscale and len(im.getbands()) > 1 :
+        im = ImageOps.grayscale(im)
+    return np.asarray(im).swapaxes(0, 1)
+
+def iter_sequence ( directory, grayscale=True, number_images=None, start=0, increment=1, filename_contains="", verbose=False, nb_threads=None) :
+    """
+    Iterate on the images of a folder, in the order of their names,
+    decoded in advance by a pool of threads.
+
+    :Parameters: see `read_sequence`
+
+    :Returns: iterator of arrays (x, y[, bands]) in native type, i.e. the
+              z slices of the volume returned by `read_sequence`: the pixel
+              at column i and row j of an image file is frame[i, j]
+    """
+    files = _select_sequence(directory, number_images, start, increment, filename_contains, verbose)
+    if nb_threads is None :
+        nb_threads = cpu_count()
+    pool = ThreadPool(max(1, nb_threads))
+    pending = deque()
+    try :
+        for f in files :
+            pending.append(pool.apply_async(_decode_frame, (os.path.join(directory, f), grayscale) ) )
+            if len(pending) > 2 * nb_threads :
+                yield pending.popleft().get()
+        while len(pending) > 0 :
+            yield pending.popleft().get()
+    finally :
+        pool.terminate()
+
+def read_sequence ( directory, grayscale=True, number_images=None, start=0, increment=1, filename_contains="", voxels_size=None, verbose=True, nb_threads=None) :
     """
     Convert a sequence of images in a folder as a numpy array.
     The images must all be the same size and type.
     They can be in TIFF, .... format.
 
+    Files are sorted by name and only the selected images are decoded,
+    by a pool of threads, into an image of their native type.
+
     :Parameters:
-        - `grayscale` (bool) - convert the image to grayscale
+        - `grayscale` (bool) - convert color images to grayscale
         - `number_images` (int) - specify how many images to open
         - `start` (int) - used to start with the nth image in the folder (default = 0 for the first image)
         - `increment` (int) - set to "n" to open every "n" image (default = 1 for opening all images)
         - `filename_contains` (str) - only files whose name contains that string are opened
         - `voxels_size (tuple) - specify voxels size
         - `verbose` (bool) - verbose mode
+        - `nb_threads` (int) - number of decoding threads, number of cpus if None
     """
-
-    _images = []
-    _files = []
-
     if verbose : print "Loading : "
-    for f in os.listdir(directory):
-        if fnmatch.fnmatch(f, '*%s*' %filename_contains):
-            try :
-                im = Image.open(os.path.join(directory, f))
-                _files.append(f)
-                if grayscale is True :
-                    _images.append(ImageOps.grayscale(im))
-                else:
-                    _images.append(im)
-            except :
-                if verbose : print "\t warning : cannot open %s" %f
-
-    if len(_images) == 0 :
+    files = _select_sequence(directory, number_images, start, increment, filename_contains, verbose)
+
+    if len(files) == 0 :
         if verbose : print "\t no images loaded"
         return -1
 
-    xdim, ydim = _images[0].size
-
-    if number_images is None :
-        zdim = round(float(len(_images) - start)/ increment)
-        _nmax = len(_images) - start
-    else :
-        zdim = number_images
-        _nmax = number_images * increment
-
-    if _images[0].mode == 'RGB':
-        nd_image = np.zeros((xdim,ydim,zdim, 3), dtype=np.uint8)
-
-    nd_image = np.zeros((xdim,ydim,zdim))
-
-    j = 0
-    for i in _images[start:_nmax+start:increment] :
-        if i.size == _images[start].size :
-            nd_image[:,:,j] = i
-            if verbose : print "\t ./%s" %_files[_images.index(i)]
-            j += 1
-        else :
-            if verbose : print "%s : wrong size - %s expected, %s found" %(_files[_images.index(i)], _images[start].size, i.size)
-    result = nd_image.transpose(1,0,2)
-
+    #volume (x, y, z[, bands])
+    first = _decode_frame(os.path.join(directory, files[0]), grayscale)
+    nd_image = np.empty(first.shape[:2] + (len(files),) + first.shape[2:], first.dtype, order="F")
+    nd_image[:,:,0] = first
+
+    def decode (j) :
+        nd_image[:,:,j] = _decode_frame(os.path.join(directory, files[j]), grayscale)
+
+    if nb_threads is None :
+        nb_threads = cpu_count()
+    pool = ThreadPool(max(1, min(nb_threads, len(files) ) ) )
+    try :
+        pool.map(decode, range(1, len(files) ) )
+    finally :
+        pool.terminate()
+    if verbose :
+        for f in files :
+            print "\t ./%s" %f
+
+    vdim = nd_image.shape[3] if nd_image.ndim == 4 else 1
     if voxels_size is None :
-        return SpatialImage(result)
+        return SpatialImage(nd_image, vdim=vdim)
     else :
-        return SpatialImage(result, voxels_size)
+        return SpatialImage(nd_image, voxels_size, vdim)
 
 
-def imread (filename, dimension=3) :
+def imread (filename, dimension=3, lazy=False) :
     """Reads an image file completely into memory.
 
     It uses the file extension to determine how to read the file. It first tries
@@ -243,9 +346,12 @@ def imread (filename, dimension=3) :
 
     :Parameters:
      - `filename` (str)
+     - `lazy` (bool) - if True, volume images (Inrimages, TIFFs, LSMs, NPY)
+        are opened as a |LazySpatialImage| whose z planes are read
+        when accessed
 
     :Returns Type:
-        |SpatialImage|
+        |SpatialImage| or |LazySpatialImage|
     """
     filename = expusr(filename)
     if not exists(filename) :
@@ -256,6 +362,15 @@ def imread (filename, dimension=3) :
     if ext == ".gz":
         root, ext = splitext(root)
         ext = ext.lower()
+    if lazy:
+        if ext == ".inr":
+            return open_inrimage(filename)
+        elif ext == ".lsm":
+            return open_lsm(filename)
+        elif ext in [".tif", ".tiff"]:
+            return open_tif(filename)
+        elif ext == ".npy":
+            return open_npy(filename)
     if ext == ".inr":
         return read_inrimage(filename)
     elif ext == ".lsm":
@@ -0,0 +1,322 @@
+# -*- python -*-
+#
+#       image.serial: read/write spatial nd images
+#
+#       Copyright 2006 - 2011 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite : http://openalea.gforge.inria.fr
+################################################################################
+"""
+This module defines a block gzip file, compressed and decompressed
+by a pool of threads
+
+Datas are cut into blocks of fixed size, each block being stored
+as an independent gzip member. A file is then a valid multi member
+gzip file that any gzip reader can decompress. Like in BGZF, the
+header of each member holds an extra field ('OA' subfield) with the
+size of the member and the size of its uncompressed datas, hence:
+
+ - blocks are compressed (resp. decompressed) concurrently,
+   zlib releasing the GIL
+ - skipping datas does not need to decompress the skipped members
+
+Gzip files without this extra field are read as a single stream.
+"""
+
+__license__= "Cecill-C"
+__revision__=" $Id$ "
+
+import gzip
+import zlib
+from collections import deque
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from struct import pack,unpack
+import numpy as np
+
+__all__ = ["BlockGzipFile","open_block_gzip"]
+
+# default size of the uncompressed datas of a member
+BLOCK_SIZE = 2 ** 20
+
+# id1 id2 cm flg mtime xfl os xlen si1 si2 slen member_size data_size
+_HEADER = "<BBBBIBBHBBHII"
+_HEADER_SIZE = 24
+_FEXTRA = 4
+
+def _compress_member (data, level) :
+    """Compress datas as a complete gzip member
+    """
+    compressor = zlib.compressobj(level,zlib.DEFLATED,-zlib.MAX_WBITS)
+    body = compressor.compress(data) + compressor.flush()
+    size = len(data)
+    header = pack(_HEADER,0x1f,0x8b,8,_FEXTRA,0,0,255,
+                  8 + 4,ord("O"),ord("A"),8,
+                  _HEADER_SIZE + len(body) + 8,size)
+    trailer = pack("<II",zlib.crc32(data) & 0xffffffff,size & 0xffffffff)
+    return header + body + trailer
+
+def _decompress_member (member) :
+    """Decompress a complete gzip member, checking its crc
+    """
+    return zlib.decompress(member,16 + zlib.MAX_WBITS)
+
+def _parse_header (header) :
+    """Sizes of a member stored in its header
+
+    :Returns: (member_size,data_size) or None if
+              header is not a block gzip header
+    """
+    if len(header) < _HEADER_SIZE :
+        return None
+    (id1,id2,cm,flg,mtime,xfl,os,
+     xlen,si1,si2,slen,member_size,data_size) = unpack(_HEADER,header[:_HEADER_SIZE])
+    if (id1,id2,cm) != (0x1f,0x8b,8) or not (flg & _FEXTRA) \
+       or (si1,si2,slen) != (ord("O"),ord("A"),8) :
+        return None
+    return member_size,data_size
+
+class BlockGzipFile (object) :
+    """File like object reading or writing a block gzip file
+
+    In write mode, datas are cut into blocks compressed by a pool
+    of threads and written in order. In read mode, the next members
+    are decompressed in advance by the pool.
+    """
+    def __init__ (self, filename, mode = "rb", compresslevel = 9,
+                        block_size = BLOCK_SIZE, nb_threads = None) :
+        """Constructor
+
+        :Parameters:
+         - `filename` (str) - name of the file
+         - `mode` (str) - either 'rb' or 'wb'
+         - `compresslevel` (int) - compression level, from 1 to 9
+         - `block_size` (int) - size of uncompressed datas
+                           stored in each member
+         - `nb_threads` (int) - number of compression threads,
+                           number of cpus if None
+        """
+        if mode not in ("r","rb","w","wb") :
+            raise ValueError("unsupported mode: %s" % mode)
+        if nb_threads is None :
+            nb_threads = cpu_count()
+        self._writing = mode.startswith("w")
+        self._file = open(filename,"wb" if self._writing else "rb")
+        self._level = compresslevel
+        self._block_size = block_size
+        self._nb_threads = nb_threads
+        self._pool = None
+        #compressed (resp. decompressed) members not yet consumed
+        self._pending = deque()
+        self._pos = 0
+
+        if self._writing :
+            self._block = bytearray()
+            self._nb_members = 0
+            self._pool = ThreadPool(nb_threads)
+        else :
+            self._data = ""
+            self._offset = 0
+            self._stream = None
+            header = self._file.read(_HEADER_SIZE)
+            self._file.seek(0)
+            if _parse_header(header) is None :
+                #any other gzip file is read as a single stream
+                self._stream = gzip.GzipFile(fileobj = self._file,mode = "rb")
+            elif nb_threads > 1 :
+                self._pool = ThreadPool(nb_threads)
+
+    def __enter__ (self) :
+        return self
+
+    def __exit__ (self, *args) :
+        self.close()
+
+    def tell (self) :
+        """Position in the uncompressed datas
+        """
+        return self._pos
+
+    ###########################################################
+    #
+    #               write
+    #
+    ###########################################################
+    def _submit (self, block) :
+        """Compress a block in the pool, writing the oldest
+        pending members to keep a bounded number in memory
+        """
+        self._pending.append(self._pool.apply_async(_compress_member,
+                                                    (block,self._level) ) )
+        self._nb_members += 1
+        while len(self._pending) > 2 * self._nb_threads :
+            self._file.write(self._pending.popleft().get() )
+
+    def write (self, data) :
+        """Write datas (str or any object exposing a buffer)
+
+        Large datas are compressed without copy, the object
+        must not be modified before the file is closed or flushed.
+        """
+        data = np.frombuffer(data,np.uint8)
+        self._pos += len(data)
+        bs = self._block_size
+        if len(self._block) > 0 :
+            nb = min(bs - len(self._block),len(data) )
+            self._block += data[:nb].tostring()
+            data = data[nb:]
+            if len(self._block) < bs :
+                return
+            self._submit(str(self._block) )
+            self._block = bytearray()
+        nb_full = len(data) // bs
+        for i in xrange(nb_full) :
+            self._submit(data[i * bs:(i + 1) * bs])
+        self._block += data[nb_full * bs:].tostring()
+
+    def flush (self) :
+        """Write all the datas written so far
+        """
+        if not self._writing :
+            return
+        if len(self._block) > 0 or self._nb_members == 0 :
+            self._submit(str(self._block) )
+            self._block = bytearray()
+        while len(self._pending) > 0 :
+            self._file.write(self._pending.popleft().get() )
+        self._file.flush()
+
+    ###########################################################
+    #
+    #               read
+    #
+    ###########################################################
+    def _next_header (self) :
+        """Read the header of the next member
+
+        :Returns: ((member_size,data_size),header) or None
+                  at the end of file
+        """
+        header = self._file.read(_HEADER_SIZE)
+        if len(header) == 0 :
+            return None
+        sizes = _parse_header(header)
+        if sizes is None :
+            raise UserWarning("not a block gzip member at %d" % (self._file.tell() - len(header) ) )
+        return sizes,header
+
+    def _prefetch (self) :
+        """Fill the queue of members decompressed in advance
+        """
+        while len(self._pending) < max(1,2 * self._nb_threads) :
+            head = self._next_header()
+            if head is None :
+                return
+            (member_size,data_size),header = head
+            member = header + self._file.read(member_size - _HEADER_SIZE)
+            if self._pool is None :
+                self._pending.append( (data_size,member) )
+            else :
+                self._pending.append( (data_size,self._pool.apply_async(_decompress_member,(member,) ) ) )
+
+    def _next_data (self) :
+        """Decompressed datas of the next member, None at end of file
+        """
+        self._prefetch()
+        if len(self._pending) == 0 :
+            return None
+        data_size,member = self._pending.popleft()
+        if self._pool is None :
+            return _decompress_member(member)
+        return member.get()
+
+    def read (self, size = -1) :
+        """Read at most size bytes, all remaining datas if size < 0
+        """
+        if self._stream is not None :
+            data = self._stream.read(size)
+            self._pos += len(data)
+            return data
+
+        chunks = []
+        nb = 0
+        while size < 0 or nb < size :
+            if self._offset == len(self._data) :
+                data = self._next_data()
+                if data is None :
+                    break
+                self._data,self._offset = data,0
+            end = len(self._data) if size < 0 else min(len(self._data),self._offset + size - nb)
+            chunks.append(self._data[self._offset:end])
+            nb += end - self._offset
+            self._offset = end
+        self._pos += nb
+        return "".join(chunks)
+
+    def skip (self, nb) :
+        """Skip nb bytes of uncompressed datas
+
+        Members entirely skipped are not decompressed.
+
+        :Returns: number of bytes actually skipped
+        """
+        if self._stream is not None :
+            skipped = 0
+            while skipped < nb :
+                data = self._stream.read(min(nb - skipped,BLOCK_SIZE) )
+                if len(data) == 0 :
+                    break
+                skipped += len(data)
+            self._pos += skipped
+            return skipped
+
+        skipped = min(nb,len(self._data) - self._offset)
+        self._offset += skipped
+        #members already queued
+        while skipped < nb and len(self._pending) > 0 \
+              and self._pending[0][0] <= nb - skipped :
+            skipped += self._pending.popleft()[0]
+        #members still in the file
+        while skipped < nb and len(self._pending) == 0 :
+            pos = self._file.tell()
+            head = self._next_header()
+            if head is None :
+                break
+            (member_size,data_size),header = head
+            if data_size > nb - skipped :
+                self._file.seek(pos)
+                break
+            self._file.seek(member_size - _HEADER_SIZE,1)
+            skipped += data_size
+        #inside a member
+        if skipped < nb :
+            data = self.read(nb - skipped)
+            skipped += len(data)
+            self._pos -= len(data)
+        self._pos += skipped
+        return skipped
+
+    def close (self) :
+        """Flush written datas and close the file
+        """
+        if self._file.closed :
+            return
+        try :
+            self.flush()
+        finally :
+            if self._pool is not None :
+                self._pool.terminate()
+                self._pool = None
+            self._pending.clear()
+            self._file.close()
+
+def open_block_gzip (filename, mode = "rb", **kwds) :
+    """Open a block gzip file
+
+    .. seealso:: `BlockGzipFile`
+    """
+    return BlockGzipFile(filename,mode,**kwds)
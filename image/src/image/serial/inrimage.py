@@ -25,11 +25,10 @@ import os
 from os import path
 import numpy as np
 from struct import calcsize,pack,unpack
-import gzip
-from cStringIO import StringIO
-from openalea.image.spatial_image import SpatialImage
+from openalea.image.spatial_image import SpatialImage,LazySpatialImage,LAZY_CACHE_SIZE
+from block_gzip import BlockGzipFile
 
-__all__ = ["read_inriheader","read_inrimage","write_inrimage"]
+__all__ = ["read_inriheader","read_inrimage","open_inrimage","write_inrimage"]
 
 specific_header_keys = ("XDIM","YDIM","ZDIM",
                         "VDIM","TYPE","PIXSIZE",
@@ -38,15 +37,21 @@ specific_header_keys = ("XDIM","YDIM","ZDIM",
                         "TX","TY","TZ",
                         "#GEOMETRY")
 
+# size of the chunks of data read at once from a stream
+CHUNK_SIZE = 2 ** 20
+
+def _is_zipped (filename) :
+    return path.splitext(filename)[1] in (".gz",".zip")
+
 def open_inrifile (filename) :
     """Open an inrimage file
 
-    Manage the gz attribute
+    Manage the gz attribute, zipped files are
+    decompressed while read, by a pool of threads
+    if written as block gzip files
     """
-    if path.splitext(filename)[1] in (".gz",".zip") :
-        fzip = gzip.open(filename,'rb')
-        f = StringIO(fzip.read() )
-        fzip.close()
+    if _is_zipped(filename) :
+        f = BlockGzipFile(filename,'rb')
     else :
         f = open(filename,'rb')
 
@@ -59,7 +64,10 @@ def _read_header (f) :
     #read header string
     header = ""
     while header[-4:] != "##}\n" :
-        header += f.read(256)
+        block = f.read(256)
+        if len(block) == 0 :
+            raise UserWarning("unable to find the end of the header")
+        header += block
 
     #read infos in header
     prop = {}
@@ -88,81 +96,273 @@ def read_inriheader (filename) :
     f.close()
     return prop
 
-def read_inrimage (filename) :
-    """Read an inrimage, either zipped or not according to extension
-
-    :Parameters:
-     - `filename` (str) - name of the file to read
+def _pixel_type (prop) :
+    """Numpy type of the pixels described in a header
     """
-    f = open_inrifile(filename)
-
-    #read header
-    prop = _read_header(f)
-    prop["Filename"] = filename # Jonathan : 14.05.2012
-
-    #extract usefull infos to read image
-    zdim = int(prop.pop("ZDIM") )
-    ydim = int(prop.pop("YDIM") )
-    xdim = int(prop.pop("XDIM") )
-    vdim = int(prop.pop("VDIM") )
-
-    #if vdim != 1 :
-        #   msg = "don't know how to handle vectorial pixel values"
-    #   raise NotImplementedError(msg)
-
-    #find data type
     pixsize = int(prop.pop("PIXSIZE","0").split(" ")[0])
     dtype = prop.pop("TYPE")
 
     if dtype == "unsigned fixed" :
-        if pixsize == 0 :
-            ntyp = np.dtype(np.int)
-        else :
-            try :
-                ntyp = eval("np.dtype(np.uint%d)" % pixsize)
-            except AttributeError :
-                raise UserWarning("undefined pix size: %d" % pixsize)
+        name,default = "uint%d",np.int
     elif dtype == "signed fixed" :
-        if pixsize == 0 :
-            ntyp = np.dtype(np.int)
-        else :
-            try :
-                ntyp = eval("np.dtype(np.int%d)" % pixsize)
-            except AttributeError :
-                raise UserWarning("undefined pix size: %d" % pixsize)
+        name,default = "int%d",np.int
     elif dtype == "float" :
-        if pixsize == 0 :
-            ntyp = np.dtype(np.float)
-        else :
-            try :
-                ntyp = eval("np.dtype(np.float%d)" % pixsize)
-            except AttributeError :
-                raise UserWarning("undefined pix size: %d" % pixsize)
+        name,default = "float%d",np.float
     else :
         msg = "unable to read that type of datas : %s" % dtype
         raise UserWarning(msg)
 
-    #read datas
-    size = ntyp.itemsize * xdim * ydim * zdim * vdim
-    mat = np.fromstring(f.read(size),ntyp)
-    if vdim != 1 :
-        mat = mat.reshape( (vdim,xdim,ydim,zdim), order="F" )
-        mat = mat.transpose(1,2,3,0)
-    else:
-        mat = mat.reshape( (xdim,ydim,zdim), order="F" )
-        #mat = mat.transpose(2,1,0)
+    if pixsize == 0 :
+        ntyp = np.dtype(default)
+    else :
+        try :
+            ntyp = np.dtype(getattr(np,name % pixsize) )
+        except AttributeError :
+            raise UserWarning("undefined pix size: %d" % pixsize)
+
+    #datas written on big endian machines
+    if prop.get("CPU","decm") in ("sun","sgi") :
+        ntyp = ntyp.newbyteorder(">")
+    else :
+        ntyp = ntyp.newbyteorder("<")
+    return ntyp
 
-    #create SpatialImage
+def _image_infos (prop) :
+    """Remove the description of the datas from the header
+
+    :Returns: (xdim,ydim,zdim,vdim),pixel type,voxelsize
+    """
+    shape = tuple(int(prop.pop(k) ) for k in ("XDIM","YDIM","ZDIM","VDIM") )
+    ntyp = _pixel_type(prop)
     res = tuple(float(prop.pop(k) ) for k in ("VX","VY","VZ") )
     for k in ("TX","TY","TZ") :
         prop.pop(k,None)
+    return shape,ntyp,res
+
+def _region (roi, z_range) :
+    """Normalize a region of interest as a tuple of 3 slices
+    """
+    if roi is None :
+        roi = ()
+    elif isinstance(roi,slice) :
+        roi = (roi,)
+    roi = tuple(roi) + (slice(None),) * (3 - len(roi) )
+    if len(roi) != 3 or not all(isinstance(sl,slice) for sl in roi) :
+        raise ValueError("roi must be a tuple of at most 3 slices")
+    if z_range is not None :
+        if roi[2] != slice(None) :
+            raise ValueError("z_range and a z slice in roi are exclusive")
+        roi = roi[:2] + (slice(*z_range),)
+    return roi
+
+def _skip (f, nb) :
+    """Skip nb bytes of a stream
+    """
+    if isinstance(f,file) :
+        f.seek(nb,1)
+        return
+    if isinstance(f,BlockGzipFile) :
+        if f.skip(nb) < nb :
+            raise UserWarning("unexpected end of file")
+        return
+    while nb > 0 :
+        data = f.read(min(nb,CHUNK_SIZE) )
+        if len(data) == 0 :
+            raise UserWarning("unexpected end of file")
+        nb -= len(data)
+
+def _read_into (f, buf) :
+    """Fill a contiguous array with the next bytes of a stream
+    """
+    flat = buf.reshape(-1,order = "A").view(np.uint8)
+    pos = 0
+    while pos < len(flat) :
+        data = f.read(min(len(flat) - pos,CHUNK_SIZE) )
+        if len(data) == 0 :
+            raise UserWarning("unexpected end of file")
+        flat[pos:pos + len(data)] = np.frombuffer(data,np.uint8)
+        pos += len(data)
+
+def _read_planes (f, ntyp, shape, roi) :
+    """Read the region of interest of the datas in a stream,
+    z plane by z plane, into a preallocated image
+
+    :Returns: array of shape (x,y,z) or (x,y,z,v) in fortran order
+    """
+    xdim,ydim,zdim,vdim = shape
+    sx,sy,sz = roi
+    xs,ys,zs = range(xdim)[sx],range(ydim)[sy],range(zdim)[sz]
+    out_shape = (len(xs),len(ys),len(zs) )
+    if vdim != 1 :
+        out_shape += (vdim,)
+    out = np.empty(out_shape,ntyp,order = "F")
+    if len(zs) == 0 :
+        return out
+
+    plane_size = ntyp.itemsize * vdim * xdim * ydim
+    full_planes = vdim == 1 and xs == range(xdim) and ys == range(ydim) \
+                  and zs == range(zs[0],zs[0] + len(zs) )
+    if full_planes :
+        #contiguous block of planes
+        _skip(f,zs[0] * plane_size)
+        _read_into(f,out)
+        return out
+
+    plane = np.empty( (vdim,xdim,ydim),ntyp,order = "F")
+    current = 0
+    #the stream only goes forward, planes are read by increasing z
+    for z,k in sorted( (z,k) for k,z in enumerate(zs) ) :
+        _skip(f,(z - current) * plane_size)
+        _read_into(f,plane)
+        current = z + 1
+        if vdim == 1 :
+            out[:,:,k] = plane[0,sx,sy]
+        else :
+            out[:,:,k,:] = plane.transpose(1,2,0)[sx,sy]
+    return out
+
+def read_inrimage (filename, roi = None, z_range = None, mmap = True) :
+    """Read an inrimage, either zipped or not according to extension
 
+    Uncompressed images are memory mapped (copy on write):
+    datas are read from the disk when accessed. Zipped images
+    are decompressed as a stream into the final image, only
+    up to the last z plane of the region of interest.
+
+    :Parameters:
+     - `filename` (str) - name of the file to read
+     - `roi` (tuple of slice) - region of interest, slices
+                     along x, y and z. Whole image if None
+     - `z_range` (int,int) - only read z planes in
+                     [z_range[0],z_range[1]), a shortcut for
+                     roi = (slice(None),slice(None),slice(*z_range) )
+     - `mmap` (bool) - if False, uncompressed images are read
+                     in memory instead of being memory mapped
+    """
+    f = open_inrifile(filename)
+
+    try :
+        #read header
+        prop = _read_header(f)
+        prop["Filename"] = filename # Jonathan : 14.05.2012
+        header_size = f.tell()
+
+        #extract usefull infos to read image
+        (xdim,ydim,zdim,vdim),ntyp,res = _image_infos(prop)
+        roi = _region(roi,z_range)
+
+        #read datas
+        if mmap and not _is_zipped(filename) :
+            mat = np.memmap(filename,ntyp,"c",header_size,
+                            (vdim,xdim,ydim,zdim),"F")
+            if vdim != 1 :
+                mat = mat.transpose(1,2,3,0)[roi]
+            else :
+                mat = mat[0][roi]
+        else :
+            mat = _read_planes(f,ntyp,(xdim,ydim,zdim,vdim),roi)
+    finally :
+        f.close()
+
+    #native byte order for further computations
+    if not mat.dtype.isnative :
+        mat = mat.astype(mat.dtype.newbyteorder("=") )
+
+    #create SpatialImage
     img = SpatialImage(mat,res,vdim,prop)
 
     #return
-    f.close()
     return img
 
+class _PlaneReader (object) :
+    """Read consecutive z planes of the datas of an inrimage
+
+    Uncompressed datas are memory mapped, zipped datas are
+    read from a stream kept open, only reopened to go backward.
+    """
+    def __init__ (self, filename, header_size, ntyp, shape) :
+        self._filename = filename
+        self._header_size = header_size
+        self._ntyp = ntyp
+        self._shape = shape
+        self._stream = None
+        self._z = 0
+        if _is_zipped(filename) :
+            self._mat = None
+        else :
+            xdim,ydim,zdim,vdim = shape
+            self._mat = np.memmap(filename,ntyp,"r",header_size,
+                                  (vdim,xdim,ydim,zdim),"F")
+
+    def __call__ (self, z_start, z_stop) :
+        xdim,ydim,zdim,vdim = self._shape
+        if self._mat is not None :
+            mat = self._mat[...,z_start:z_stop]
+        else :
+            if self._stream is None or z_start < self._z :
+                self.close()
+                self._stream = open_inrifile(self._filename)
+                _skip(self._stream,self._header_size)
+                self._z = 0
+            _skip(self._stream,(z_start - self._z) * vdim * xdim * ydim * self._ntyp.itemsize)
+            mat = np.empty( (vdim,xdim,ydim,z_stop - z_start),self._ntyp,order = "F")
+            _read_into(self._stream,mat)
+            self._z = z_stop
+        mat = mat.transpose(1,2,3,0) if vdim != 1 else mat[0]
+        return np.array(mat,mat.dtype.newbyteorder("="),order = "F",
+                        copy = self._mat is not None or not mat.dtype.isnative)
+
+    def close (self) :
+        if self._stream is not None :
+            self._stream.close()
+            self._stream = None
+
+def open_inrimage (filename, chunk_depth = None, cache_size = LAZY_CACHE_SIZE) :
+    """Open an inrimage, either zipped or not according to extension,
+    without reading its datas
+
+    Datas are read from the file by chunks of z planes when accessed.
+    Zipped images are read forward as a stream, block gzip files
+    (see `write_inrimage`) skipping the unread planes cheaply.
+
+    :Parameters:
+     - `filename` (str) - name of the file to read
+     - `chunk_depth` (int) - number of z planes read at once
+     - `cache_size` (int) - maximal size in bytes of the planes
+                     kept in memory
+
+    :Returns Type: |LazySpatialImage|
+    """
+    f = open_inrifile(filename)
+    try :
+        prop = _read_header(f)
+        prop["Filename"] = filename
+        header_size = f.tell()
+    finally :
+        f.close()
+
+    shape,ntyp,res = _image_infos(prop)
+    reader = _PlaneReader(filename,header_size,ntyp,shape)
+    xdim,ydim,zdim,vdim = shape
+    return LazySpatialImage(shape[:3] if vdim == 1 else shape,ntyp.newbyteorder("="),
+                            reader,res,vdim,prop,chunk_depth,cache_size,reader.close)
+
+
+def _data_chunks (img) :
+    """Iterate on the datas of an image in the order
+    of an inrimage file, as contiguous buffers
+
+    The whole datas are given as a single buffer without
+    copy if possible, else z plane by z plane.
+    """
+    mat = np.asarray(img)
+    if mat.ndim == 4 :
+        mat = mat.transpose(3,0,1,2)
+    if mat.flags.f_contiguous :
+        yield buffer(mat.T)
+        return
+    for z in xrange(mat.shape[-1]) :
+        yield buffer(np.asfortranarray(mat[...,z]).T)
 
 def write_inrimage_to_stream(stream, img):
     assert img.ndim in (3,4)
@@ -230,31 +430,31 @@ def write_inrimage_to_stream(stream, img):
     header += "##}\n"
 
     stream.write(header)
-    if img.ndim == 3:
-        stream.write(img.tostring("F"))
-    elif img.ndim == 4 :
-        mat = img.transpose(3,0,1,2)
-        stream.write(mat.tostring("F") )
-    else:
-        raise Exception("Unhandled image dimension %d."%img.ndim)
+    for chunk in _data_chunks(img) :
+        stream.write(chunk)
 
 
-def write_inrimage (filename, img) :
+def write_inrimage (filename, img, compresslevel = 9, nb_threads = None) :
     """Write an inrimage zipped or not according to the extension
 
+    Zipped images are written as block gzip files, compressed
+    by a pool of threads, that remain readable by gzip.
+
     .. warning:: if img is not a |SpatialImage|, default values will be used
                  for the resolution of the image
 
     :Parameters:
      - `img` (|SpatialImage|) - image to write
      - `filename` (str) - name of the file to read
+     - `compresslevel` (int) - compression level of zipped images
+     - `nb_threads` (int) - number of compression threads,
+                     number of cpus if None
     """
     #open stream
     zipped = ( path.splitext(filename)[1] in (".gz",".zip") )
 
     if zipped :
-        f = gzip.GzipFile(filename, "wb")
-        #f = StringIO()
+        f = BlockGzipFile(filename,"wb",compresslevel,nb_threads = nb_threads)
     else :
         f = open(filename,'wb')
 
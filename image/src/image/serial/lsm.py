@@ -19,10 +19,12 @@ This module reads lsm format
 __license__ = "Cecill-C"
 __revision__ = " $Id: $ "
 
+from struct import unpack
 import numpy as np
-from openalea.image.spatial_image import SpatialImage
+from openalea.image.spatial_image import SpatialImage, LazySpatialImage, LAZY_CACHE_SIZE
+from openalea.image.serial.tif import _TiffFile
 
-__all__ = []
+__all__ = ["open_lsm"]
 
 try:
     from pylsm import lsmreader
@@ -30,38 +32,109 @@ try:
 except ImportError:
     pass
 
-def read_lsm(filename,channel=0):
-    """Read an lsm image
+#tif tag of the CZ LSM info structure
+_CZ_LSMINFO = 34412
 
-    :Parameters:
-     - `filename` (str) - name of the file to read
-     - `channel` (int) - optional
-    """
+def _lsm_infos(voxelsize,pixsize):
+    """Build the voxelsize and the metadata of an lsm from its header
 
-    # LSM reader
-    imageFile = lsmreader.Lsmimage(filename)
-    imageFile.open()
+    :Parameters:
+     - `voxelsize` (float,float,float) - voxel sizes of the header, in meters
+     - `pixsize` (int) - number of bits per sample
 
+    :Returns: voxelsize, info dict
+    """
     _info = {}
-    #LSM header
-    _VX = imageFile.header['CZ LSM info']['Voxel Size X']
-    _VY = imageFile.header['CZ LSM info']['Voxel Size Y']
-    _VZ = imageFile.header['CZ LSM info']['Voxel Size Z']
+    _VX,_VY,_VZ = voxelsize
     _vx = _VX * 10**6
     _vy = _VY * 10**6
     _vz = _VZ * 10**6
 
-    _PIXSIZE = imageFile.header['Image'][0]['Bit / Sample']
-
     _info["TYPE"] = 'unsigned fixed'
-    _info["PIXSIZE"] = str(_PIXSIZE)
+    _info["PIXSIZE"] = str(pixsize)
     _info["SCALE"] = 2
     _info["CPU"] = 'decm'
     _info["#GEOMETRY"] = 'CARTESIAN'
+    return (_vx,_vy,_vz), _info
+
+def _lsm_tif_infos(tif):
+    """Extract the voxelsize and the metadata of an lsm
+    from the CZ LSM info tag of its first page
+
+    :Returns: voxelsize, info dict
+    """
+    cz_info = tif.pages[0].tags.get(_CZ_LSMINFO)
+    if cz_info is None:
+        raise UserWarning("not an lsm file: %s" % tif.filename)
+    #voxel sizes (in meters) follow 10 int32 fields
+    voxelsize = unpack("<3d",np.asarray(cz_info,np.uint8).tostring()[40:64])
+    return _lsm_infos(voxelsize,tif.pages[0].dtype.itemsize * 8)
+
+def read_lsm(filename,channel=0):
+    """Read an lsm image
+
+    :Parameters:
+     - `filename` (str) - name of the file to read
+     - `channel` (int) - optional
+    """
+
+    # LSM reader
+    imageFile = lsmreader.Lsmimage(filename)
+    imageFile.open()
+    #LSM header
+    header = imageFile.header
+    res, _info = _lsm_infos([header['CZ LSM info']['Voxel Size %s' % ax] for ax in "XYZ"],
+                            header['Image'][0]['Bit / Sample'])
 
     #LSM datas
     _data = imageFile.image['data'][channel]
     im = SpatialImage(_data)
-    im.resolution = _vx,_vy,_vz
+    im.resolution = res
     im.info = _info
     return im
+
+def _fix_lsm_offsets(tif):
+    """Strip offsets of lsm files larger than 4GB are stored modulo 2**32,
+    strips being stored in increasing order, restore their actual values
+    """
+    offsets = np.concatenate([page.offsets for page in tif.pages])
+    wraps = np.concatenate( ([0],np.cumsum(np.diff(offsets) < 0) ) )
+    if wraps[-1] == 0 :
+        return
+    offsets += wraps.astype(np.int64) << 32
+    start = 0
+    for page in tif.pages :
+        page.offsets = offsets[start:start + len(page.offsets)]
+        start += len(page.offsets)
+
+def open_lsm(filename,channel=0,chunk_depth=None,cache_size=LAZY_CACHE_SIZE,nb_threads=None):
+    """Open an lsm image as a |LazySpatialImage|
+
+    Only the headers of the pages are read when opening the file,
+    z planes are read from the file when accessed, as for tif images.
+
+    :Parameters:
+     - `filename` (str) - name of the file to read
+     - `channel` (int) - optional
+     - `chunk_depth` (int) - number of z planes read at once
+     - `cache_size` (int) - maximal size in bytes of the planes kept in memory
+     - `nb_threads` (int) - number of threads decoding planes,
+                       number of cpus if None
+    """
+    tif = _TiffFile(filename)
+    try :
+        res, _info = _lsm_tif_infos(tif)
+        _fix_lsm_offsets(tif)
+        (nx,ny,nchannels),dtype = tif.pages[0].layout()
+        if not 0 <= channel < nchannels :
+            raise UserWarning("no channel %d in %s" % (channel,filename) )
+    except :
+        tif.close()
+        raise
+
+    def read_planes(z_start, z_stop):
+        data = tif.read( (z_start,z_stop),True,nb_threads)[...,channel]
+        return np.array(data,data.dtype.newbyteorder("="),order = "F")
+
+    return LazySpatialImage( (nx,ny,len(tif.pages) ),dtype.newbyteorder("="),read_planes,res,1,_info,
+                            chunk_depth,cache_size,tif.close)
@@ -23,10 +23,10 @@ __license__ = "Cecill-C"
 __revision__ = " $Id$ "
 
 import numpy as np
-from openalea.image.spatial_image import SpatialImage
+from openalea.image.spatial_image import SpatialImage, LazySpatialImage, LAZY_CACHE_SIZE
 
 
-__all__ = []
+__all__ = ["read_tif", "open_tif"]
 
 try:
     import decimal
@@ -36,18 +36,444 @@ try:
     from libtiff import tif_lzw
     from libtiff.utils import bytes2str, VERBOSE
     import os, os.path, sys, time
-    __all__ += ["read_tif", "write_tif","mantissa"]
+    __all__ += ["write_tif","mantissa"]
 except ImportError, e :
-    pass
+    libtiff = None
+
+import zlib
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from struct import unpack, calcsize
+
+# numpy type of the values of each tif field type
+_FIELD_TYPES = {1: "u1", 2: "S1", 3: "u2", 4: "u4", 5: "u4", 6: "i1", 7: "u1",
+                8: "i2", 9: "i4", 10: "i4", 11: "f4", 12: "f8", 13: "u4",
+                16: "u8", 17: "i8", 18: "u8"}
+_RATIONALS = (5, 10)
+
+_TAG_NAMES = {254: "NewSubfileType", 256: "ImageWidth", 257: "ImageLength",
+              258: "BitsPerSample", 259: "Compression", 262: "PhotometricInterpretation",
+              270: "ImageDescription", 273: "StripOffsets", 277: "SamplesPerPixel",
+              278: "RowsPerStrip", 279: "StripByteCounts", 282: "XResolution",
+              283: "YResolution", 284: "PlanarConfiguration", 296: "ResolutionUnit",
+              305: "Software", 306: "DateTime", 317: "Predictor", 322: "TileWidth",
+              323: "TileLength", 324: "TileOffsets", 325: "TileByteCounts",
+              339: "SampleFormat"}
+_TAGS = dict((name, tag) for tag, name in _TAG_NAMES.iteritems())
+# tags describing the layout of the datas, not kept as metadata
+_LAYOUT_TAGS = ("StripOffsets", "StripByteCounts", "TileOffsets", "TileByteCounts")
+
+
+class _UnsupportedTiff(UserWarning):
+    """A tif page the pure python reader can not decode, libtiff may"""
+
+
+def _packbits_decode(data):
+    """Decode a PackBits compressed strip"""
+    data = bytearray(data)
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        n = data[i]
+        i += 1
+        if n < 128:
+            out += data[i:i+n+1]
+            i += n+1
+        elif n > 128:
+            out += data[i:i+1] * (257-n)
+            i += 1
+    return str(out)
+
+
+def _lzw_decode(data, size):
+    try:
+        from libtiff import tif_lzw
+    except ImportError:
+        raise UserWarning("pylibtiff is needed to read LZW compressed tif")
+    return tif_lzw.decode(np.frombuffer(data, np.uint8), size)
+
+
+_DECODERS = {1: lambda data, size: data,
+             5: _lzw_decode,
+             8: lambda data, size: zlib.decompress(data),
+             32946: lambda data, size: zlib.decompress(data),
+             32773: lambda data, size: _packbits_decode(data)}
+
+
+class _TiffPage(object):
+    """Layout of the datas of a tif page, from the fields of its IFD"""
+    def __init__(self, tags, byteorder):
+        self.tags = tags
+
+        def get(name, default):
+            value = tags.get(_TAGS[name])
+            return default if value is None else value[0]
+        self.width = int(get("ImageWidth", 0))
+        self.length = int(get("ImageLength", 0))
+        self.samples = int(get("SamplesPerPixel", 1))
+        self.planar = int(get("PlanarConfiguration", 1))
+        self.compression = int(get("Compression", 1))
+        self.predictor = int(get("Predictor", 1))
+        self.subfile = int(get("NewSubfileType", 0))
+        bits = int(get("BitsPerSample", 8))
+        kind = {1: "u", 2: "i", 3: "f"}.get(int(get("SampleFormat", 1)))
+        if kind is None or bits not in (8, 16, 32, 64):
+            raise _UnsupportedTiff("unsupported tif sample: %d bits, format %s"
+                                   % (bits, get("SampleFormat", 1)))
+        self.dtype = np.dtype("%s%s%d" % (byteorder, kind, bits // 8))
+        if self.compression not in _DECODERS:
+            raise _UnsupportedTiff("unsupported tif compression: %d" % self.compression)
+        if self.compression == 5 and libtiff is None:
+            raise _UnsupportedTiff("pylibtiff is needed to read LZW compressed tif")
+        if self.predictor not in (1, 2):
+            raise _UnsupportedTiff("unsupported tif predictor: %d" % self.predictor)
+
+        if _TAGS["TileOffsets"] in tags:
+            self.block = (int(get("TileLength", 0)), int(get("TileWidth", 0)))
+            self.offsets = tags[_TAGS["TileOffsets"]]
+            self.bytecounts = tags[_TAGS["TileByteCounts"]]
+        else:
+            self.block = (min(int(get("RowsPerStrip", self.length)), self.length), self.width)
+            self.offsets = tags[_TAGS["StripOffsets"]]
+            self.bytecounts = tags[_TAGS["StripByteCounts"]]
+        self.offsets = self.offsets.astype(np.int64)
+        self.bytecounts = self.bytecounts.astype(np.int64)
+
+    def layout(self):
+        """(shape, dtype) of the page"""
+        return (self.width, self.length, self.samples), self.dtype
+
+    def raw_extent(self):
+        """(offset, size) of the datas if the page is stored uncompressed
+        in a single run of bytes, None else"""
+        if self.compression != 1 or (self.samples > 1 and self.planar == 2):
+            return None
+        ends = self.offsets + self.bytecounts
+        if self.block[1] != self.width or (self.offsets[1:] != ends[:-1]).any():
+            return None
+        size = self.width * self.length * self.samples * self.dtype.itemsize
+        if ends[-1] - self.offsets[0] < size:
+            return None
+        return int(self.offsets[0]), size
+
+    def decode(self, data, out):
+        """Decode the page from the bytes of the file
+
+        :Parameters:
+        - `data` (array of uint8) - the whole file
+        - `out` (array) - (length, width, samples) view receiving the page
+        """
+        bl, bw = self.block
+        nrows = (self.length + bl - 1) // bl
+        ncols = (self.width + bw - 1) // bw
+        per_plane = nrows * ncols
+        planes = self.samples if self.planar == 2 else 1
+        samples = 1 if self.planar == 2 else self.samples
+        decode = _DECODERS[self.compression]
+        for i in xrange(min(len(self.offsets), per_plane * planes)):
+            plane, j = divmod(i, per_plane)
+            r, c = divmod(j, ncols)
+            offset, count = self.offsets[i], self.bytecounts[i]
+            size = bl * bw * samples * self.dtype.itemsize
+            raw = decode(data[offset:offset+count], size)
+            block = np.frombuffer(raw, self.dtype)
+            rows = min(bl, len(block) // (bw * samples))
+            block = block[:rows * bw * samples].reshape(rows, bw, samples)
+            if self.predictor == 2:
+                block = np.cumsum(block, axis=1, dtype=self.dtype)
+            rows = min(rows, self.length - r * bl)
+            cols = min(bw, self.width - c * bw)
+            target = out[r*bl:r*bl+rows, c*bw:c*bw+cols]
+            if planes > 1:
+                target[..., plane] = block[:rows, :cols, 0]
+            else:
+                target[...] = block[:rows, :cols]
+
+
+class _TiffFile(object):
+    """Pages of a tif file, found by a single scan of its IFD chain
+
+    Datas are accessed through a copy on write memory map of the file.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        f = open(filename, "rb")
+        try:
+            head = f.read(16)
+            byteorder = {"II": "<", "MM": ">"}.get(head[:2])
+            if byteorder is None:
+                raise UserWarning("not a tif file: %s" % filename)
+            version, = unpack(byteorder + "H", head[2:4])
+            if version == 42:
+                big = False
+                offset, = unpack(byteorder + "I", head[4:8])
+            elif version == 43:
+                big = True
+                offset, = unpack(byteorder + "Q", head[8:16])
+            else:
+                raise UserWarning("not a tif file: %s" % filename)
+
+            self.pages = []
+            seen = set()
+            while offset != 0 and offset not in seen:
+                seen.add(offset)
+                tags, offset = self._read_ifd(f, offset, byteorder, big)
+                #skip thumbnails and reduced resolution images,
+                #before checking their (maybe unsupported) format
+                subfile = tags.get(_TAGS["NewSubfileType"])
+                if subfile is not None and int(subfile[0]) & 1:
+                    continue
+                self.pages.append(_TiffPage(tags, byteorder))
+        finally:
+            f.close()
+        if len(self.pages) == 0:
+            raise UserWarning("no image in tif file: %s" % filename)
+        self.data = np.memmap(filename, np.uint8, "c")
+
+    @staticmethod
+    def _read_ifd(f, offset, byteorder, big):
+        """Read the fields of an IFD
+
+        :Returns: dict of tag: array of values, offset of the next IFD
+        """
+        count_fmt, entry_fmt = ("Q", "HHQ8s") if big else ("H", "HHI4s")
+        entry_size = calcsize(byteorder + entry_fmt)
+        next_fmt = byteorder + ("Q" if big else "I")
+        f.seek(offset)
+        nb, = unpack(byteorder + count_fmt, f.read(calcsize(byteorder + count_fmt)))
+        ifd = f.read(nb * entry_size + calcsize(next_fmt))
+        tags = {}
+        for i in xrange(nb):
+            tag, typ, count, field = unpack(byteorder + entry_fmt,
+                                            ifd[i*entry_size:(i+1)*entry_size])
+            if typ not in _FIELD_TYPES:
+                continue
+            dtype = np.dtype(byteorder + _FIELD_TYPES[typ])
+            nvalues = count * (2 if typ in _RATIONALS else 1)
+            size = nvalues * dtype.itemsize
+            if size <= len(field):
+                raw = field[:size]
+            else:
+                f.seek(unpack(next_fmt, field)[0])
+                raw = f.read(size)
+            if typ == 2:
+                tags[tag] = [raw.rstrip("\0")]
+            else:
+                values = np.frombuffer(raw, dtype)
+                if typ in _RATIONALS:
+                    values = values.reshape(-1, 2)
+                tags[tag] = values
+        next_offset, = unpack(next_fmt, ifd[nb*entry_size:])
+        return tags, next_offset
+
+    def close(self):
+        self.data = None
+
+    def read(self, z_range=None, mmap=True, nb_threads=None):
+        """Read a range of pages as an (x, y, z, samples) array
+
+        :Parameters:
+        - `z_range` (int, int) - pages in [z_range[0], z_range[1]), all if None
+        - `mmap` (bool) - if True, uncompressed pages evenly spaced in the file
+          are returned as a view on the memory map of the file, without copy
+        - `nb_threads` (int) - number of threads decoding pages,
+          number of cpus if None
+        """
+        pages = self.pages[slice(*z_range) if z_range is not None else slice(None)]
+        if len(pages) == 0:
+            shape, dtype = self.pages[0].layout()
+            return np.empty(shape[:2] + (0, shape[2]), dtype.newbyteorder("="), order="F")
+        shape, dtype = pages[0].layout()
+        for page in pages:
+            if page.layout() != (shape, dtype):
+                raise UserWarning("pages of different shapes or types in %s" % self.filename)
+        width, length, samples = shape
+
+        if mmap:
+            extents = [page.raw_extent() for page in pages]
+            if None not in extents:
+                starts = np.array([start for start, size in extents], np.int64)
+                steps = np.unique(np.diff(starts))
+                if len(steps) <= 1:
+                    step = int(steps[0]) if len(steps) == 1 else extents[0][1]
+                    isz = dtype.itemsize
+                    return np.ndarray((samples, width, length, len(pages)), dtype, self.data,
+                                      int(starts[0]),
+                                      (isz, isz*samples, isz*samples*width, step)).transpose(1, 2, 3, 0)
+
+        out = np.empty((width, length, len(pages), samples), dtype.newbyteorder("="), order="F")
+        data = self.data
+
+        def decode(k):
+            pages[k].decode(data, out[:, :, k].transpose(1, 0, 2))
+        if nb_threads is None:
+            nb_threads = cpu_count()
+        nb_threads = min(nb_threads, len(pages))
+        if nb_threads > 1 and pages[0].compression != 1:
+            pool = ThreadPool(nb_threads)
+            try:
+                pool.map(decode, range(len(pages)))
+            finally:
+                pool.terminate()
+        else:
+            for k in xrange(len(pages)):
+                decode(k)
+        return out
+
+
+def _tif_metadata(page, filename, shape):
+    """Extract the voxelsize and the metadata dictionnary of a tif
+
+    Metadata are the fields of the first page and the "key=value"
+    or "key: value" lines of its description.
+
+    :Parameters:
+    - `page` (_TiffPage) - first page of the tif
+    - `filename` (str) - name of the file
+    - `shape` (tuple of int) - (x,y,z) dimensions of the image
+
+    :Returns: voxelsize, info dict
+    """
+    nx, ny, nz = shape
+    # -- prepare metadata dictionnary --
+    info_dict = {}
+    for tag, values in page.tags.iteritems():
+        name = _TAG_NAMES.get(tag, str(tag))
+        if name in _LAYOUT_TAGS:
+            continue
+        if isinstance(values, list) or len(values) != 1:
+            info_dict[name] = str(values[0]) if isinstance(values, list) else str(values.tolist())
+        else:
+            info_dict[name] = str(values[0].tolist())
+    description = info_dict.get("ImageDescription", "")
+    for sep in (":", "="):
+        info_dict.update(dict(filter(lambda x: len(x) == 2,
+                                     (inf.split(sep) for inf in description.split("\n")))))
+    for k, v in info_dict.iteritems():
+        info_dict[k] = v.strip()
+
+    info_dict.update({'Filename':filename.split('/')[-1]})
+
+    def number(name):
+        try:
+            return float(info_dict[name])
+        except (KeyError, ValueError):
+            return None
+
+    def resolution(tag, name):
+        # -- [XYZ]Resolution describes the number of voxels per real unit,
+        # in SpatialImage we want the voxelsizes so we must invert it --
+        values = page.tags.get(tag)
+        if values is not None and len(values) > 0 and values[0][1] != 0:
+            res = float(values[0][0]) / values[0][1]
+        else:
+            res = number(name)
+        return 1./res if res else None
 
-def read_tif(filename,channel=0):
+    # -- getting the voxelsizes from the tiff image: sometimes
+    # there is a BoundingBox attribute, sometimes there are
+    # XResolution, YResolution, ZResolution or spacing. --
+    bbox = info_dict.get("BoundingBox", "").split()
+    try:
+        xm, xM, ym, yM, zm, zM = map(float, bbox)
+        return ((xM-xm)/nx, (yM-ym)/ny, (zM-zm)/nz), info_dict
+    except ValueError:
+        pass
+
+    _vx = resolution(_TAGS["XResolution"], "XResolution") or 1.
+    _vy = resolution(_TAGS["YResolution"], "YResolution") or 1.
+    _vz = resolution(None, "ZResolution") or number("spacing") or 1.
+    return (_vx, _vy, _vz), info_dict
+
+
+def _image(data, vdim):
+    """Volume of a tif from an (x, y, z, samples) array"""
+    if vdim == 1:
+        data = data[..., 0]
+    if not data.dtype.isnative:
+        data = data.astype(data.dtype.newbyteorder("="))
+    return data
+
+
+def read_tif(filename, channel=0, z_range=None, mmap=True, nb_threads=None):
     """Read a tif image
 
+    The IFD chain is scanned once. Uncompressed pages are read through
+    a memory map of the file (without copy if they are evenly spaced),
+    compressed pages are decoded by a pool of threads into the final image.
+    Pages in a format this reader does not decode (e.g. JPEG or 12 bits
+    samples) are read by libtiff if it is installed.
+
+    :Parameters:
+    - `filename` (str) - name of the file to read
+    - `z_range` (int,int) - only read pages in [z_range[0],z_range[1])
+    - `mmap` (bool) - if False, datas are always copied in memory
+    - `nb_threads` (int) - number of threads decoding pages,
+      number of cpus if None
+    """
+    try:
+        tif = _TiffFile(filename)
+    except _UnsupportedTiff:
+        if libtiff is None:
+            raise
+        data, voxelsize, info_dict = _read_tif_libtiff(filename)
+        if z_range is not None:
+            data = data[:, :, slice(*z_range)]
+        return SpatialImage(data, voxelsize, 1 if data.ndim == 3 else data.shape[3], info_dict)
+    try:
+        data = tif.read(z_range, mmap, nb_threads)
+    finally:
+        tif.close()
+
+    nx, ny, nz, vdim = data.shape
+    voxelsize, info_dict = _tif_metadata(tif.pages[0], filename, (nx, ny, len(tif.pages)))
+    # -- Return a SpatialImage please! --
+    return SpatialImage(_image(data, vdim), voxelsize, vdim, info_dict)
+
+
+def open_tif(filename, chunk_depth=None, cache_size=LAZY_CACHE_SIZE, nb_threads=None):
+    """Open a tif image without reading its pages
+
+    Pages are read from the file when accessed.
+
     :Parameters:
     - `filename` (str) - name of the file to read
+    - `chunk_depth` (int) - number of pages read at once
+    - `cache_size` (int) - maximal size in bytes of the pages kept in memory
+    - `nb_threads` (int) - number of threads decoding pages,
+      number of cpus if None
+
+    :Returns Type: |LazySpatialImage|
     """
+    try:
+        tif = _TiffFile(filename)
+    except _UnsupportedTiff:
+        if libtiff is None:
+            raise
+        # libtiff reads the whole image
+        img = read_tif(filename)
+
+        def read_planes(z_start, z_stop):
+            return np.array(img[:, :, z_start:z_stop], order="F")
+
+        return LazySpatialImage(img.shape, img.dtype, read_planes, img.voxelsize, img.vdim,
+                                img.info, chunk_depth, cache_size)
+    (nx, ny, vdim), dtype = tif.pages[0].layout()
+    shape = (nx, ny, len(tif.pages)) + ((vdim,) if vdim > 1 else ())
+    voxelsize, info_dict = _tif_metadata(tif.pages[0], filename, shape[:3])
+
+    def read_planes(z_start, z_stop):
+        return _image(np.array(tif.read((z_start, z_stop), True, nb_threads), order="F"), vdim)
+
+    return LazySpatialImage(shape, dtype.newbyteorder("="), read_planes, voxelsize, vdim,
+                            info_dict, chunk_depth, cache_size, tif.close)
+
+
+def _read_tif_libtiff(filename):
+    """Read a tif with libtiff, for the pages _TiffFile does not decode
 
-    # TIF reader
+    :Returns: (x, y, z) array, voxelsize, info dict
+    """
     tif = libtiff.TIFF.open(filename)
 
     if tif.GetField('ImageDescription'):
@@ -66,8 +492,9 @@ def read_tif(filename,channel=0):
             _data[ii] = i
         _data = _data.transpose(2, 1, 0)
         info_str = tif.info()
+    tif.close()
 
-    nx, ny, nz = _data.shape
+    nx, ny, nz = _data.shape[:3]
 
     # -- prepare metadata dictionnary --
     info_dict = dict( filter( lambda x: len(x)==2,
@@ -78,81 +505,35 @@ def read_tif(filename,channel=0):
         info_dict[k] = v.strip()
 
     info_dict.update({'Filename':filename.split('/')[-1]})
-    print info_dict
 
     # -- getting the voxelsizes from the tiff image: sometimes
     # there is a BoundingBox attribute, sometimes there are
-    # XResolution, YResolution, ZResolution or spacing.
-    # the object returned by get_tiff_array has a "get_voxel_sizes()"
-    # method but it fails, so here we go. --
+    # XResolution, YResolution, ZResolution or spacing. --
     if "BoundingBox" in info_dict:
         bbox = info_dict["BoundingBox"]
         xm, xM, ym, yM, zm, zM = map(float,bbox.split())
-        _vx = (xM-xm)/nx
-        _vy = (yM-ym)/ny
-        _vz = (zM-zm)/nz
-    else:
-        # -- When we have [XYZ]Resolution fields, it describes the
-        # number of voxels per real unit. In SpatialImage we want the
-        # voxelsizes, which is the number of real units per voxels.
-        # So we must invert the result. --
-        if "XResolution" in info_dict:
-            # --resolution is stored in a [(values, precision)] list-of-one-tuple, or
-            # sometimes as a single number --
-            xres_str = eval(info_dict["XResolution"])
-            if isinstance(xres_str, list) and isinstance(xres_str[0], tuple):
-                xres_str = xres_str[0]
-                _vx = float(xres_str[0])/xres_str[1]
-            elif isinstance(xres_str, (int, float)):
-                _vx = float(xres_str)
-            else:
-                _vx = 1.
-            _vx = 1./_vx if _vx != 0 else 1.
-        else:
-            _vx = 1.0 # dumb fallback, maybe we will find something smarter later on
-        if "YResolution" in info_dict:
-            # --resolution is stored in a [(values, precision)] list-of-one-tuple, or
-            # sometimes as a single number --
-            yres_str = eval(info_dict["YResolution"])
-            if isinstance(yres_str, list) and isinstance(yres_str[0], tuple):
-                yres_str = yres_str[0]
-                _vy = float(yres_str[0])/yres_str[1]
-            elif isinstance(yres_str, (int, float)):
-                _vy = float(yres_str)
-            else:
-                _vy = 1.
-            _vy = 1./_vy if _vy != 0 else 1.
-        else:
-            _vy = 1.0 # dumb fallback, maybe we will find something smarter later on
-
-        if "ZResolution" in info_dict:
-            # --resolution is stored in a [(values, precision)] list-of-one-tuple, or
-            # sometimes as a single number --
-            zres_str = eval(info_dict["ZResolution"])
-            if isinstance(zres_str, list) and isinstance(zres_str[0], tuple):
-                zres_str = zres_str[0]
-                _vz = float(zres_str[0])/zres_str[1]
-            elif isinstance(zres_str, (int, float)):
-                _vz = float(zres_str)
-            else:
-                _vz = 1.
-            _vz = 1./_vz if _vz != 0 else 1.
-        else:
-            if "spacing" in info_dict:
-                _vz = eval(info_dict["spacing"])
-            else:
-                _vz = 1.0 # dumb fallback, maybe we will find something smarter later on
-
-    tif.close()
+        return _data, ((xM-xm)/nx, (yM-ym)/ny, (zM-zm)/nz), info_dict
+
+    def voxelsize(name):
+        # -- [XYZ]Resolution is the number of voxels per real unit,
+        # stored in a [(values, precision)] list-of-one-tuple, or
+        # sometimes as a single number. We want its inverse. --
+        if name not in info_dict:
+            return 1.
+        res = eval(info_dict[name])
+        if isinstance(res, list) and isinstance(res[0], tuple):
+            res = float(res[0][0])/res[0][1]
+        elif not isinstance(res, (int, float)):
+            return 1.
+        return 1./res if res != 0 else 1.
+
+    _vz = voxelsize("ZResolution")
+    if "ZResolution" not in info_dict and "spacing" in info_dict:
+        _vz = eval(info_dict["spacing"])
     # -- dtypes are not really stored in a compatible way (">u2" instead of uint16)
     # but we can convert those --
-    dt = np.dtype(_data.dtype.name)
-    # -- Return a SpatialImage please! --
-    im = SpatialImage(_data, dtype=dt)
-    im.resolution = _vx,_vy,_vz
-    im.info = info_dict
-
-    return im
+    _data = _data.astype(np.dtype(_data.dtype.name))
+    return _data, (voxelsize("XResolution"), voxelsize("YResolution"), _vz), info_dict
 
 
 def mantissa(value):
@@ -22,6 +22,8 @@ __revision__=" $Id: $ "
 import numpy as np
 from scipy import ndimage
 import copy as cp
+from collections import OrderedDict
+from itertools import groupby
 
 # -- deprecation messages --
 import warnings, exceptions
@@ -147,6 +149,187 @@ class SpatialImage(np.ndarray) :
             array_like.flags.f_contiguous
 
 
+# default size in bytes of the chunks of planes of a LazySpatialImage
+LAZY_CHUNK_SIZE = 2 ** 24
+# default maximal size in bytes of the chunks kept in memory
+LAZY_CACHE_SIZE = 2 ** 28
+
+class LazySpatialImage(object) :
+    """
+    Spatial image whose datas stay in a file
+
+    Datas are read on demand by chunks of consecutive z planes,
+    the last used chunks being kept in a cache of bounded size.
+    Slicing returns arrays read from the needed chunks only and
+    `np.asarray` reads the whole image.
+
+    Same metadata as a |SpatialImage| (voxelsize, vdim, info).
+    """
+    def __init__ (self, shape, dtype, read_planes, voxelsize = None,
+                  vdim = None, info = None, chunk_depth = None,
+                  cache_size = LAZY_CACHE_SIZE, close = None) :
+        """Constructor
+
+        :Parameters:
+         - `shape` (tuple of int) - shape of the image (x,y,z) or (x,y,z,v)
+         - `dtype` (np.dtype) - type of the datas
+         - `read_planes` (function) - read_planes(z_start,z_stop) returns
+                     the array of the planes in [z_start,z_stop)
+         - `voxelsize` (tuple of float) - spatial extension in each direction
+                                           of space
+         - `vdim` (int) - size of data if vector data are used
+         - `info` (dict of str|any) - metainfo
+         - `chunk_depth` (int) - number of z planes read at once,
+                     planes of about LAZY_CHUNK_SIZE bytes if None
+         - `cache_size` (int) - maximal size in bytes of the chunks kept in
+                     memory, at least one chunk is kept
+         - `close` (function) - called to release the file when the image
+                     is closed
+        """
+        self.shape = tuple(int(d) for d in shape)
+        self.dtype = np.dtype(dtype)
+        self.voxelsize = tuple(voxelsize) if voxelsize is not None else (1.,) * 3
+        self.vdim = vdim if vdim else 1
+        self.info = dict(info) if info is not None else {}
+
+        self._read_planes = read_planes
+        self._close = close
+        plane_size = self.nbytes // max(1,self.shape[2])
+        if chunk_depth is None :
+            chunk_depth = LAZY_CHUNK_SIZE // max(1,plane_size)
+        self.chunk_depth = int(max(1,chunk_depth) )
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_nbytes = 0
+
+    ndim = property(lambda self : len(self.shape) )
+    size = property(lambda self : int(np.prod(self.shape) ) )
+    nbytes = property(lambda self : self.size * self.dtype.itemsize)
+
+    @property
+    def real_shape (self) :
+        return np.multiply(self.shape[:3],self.voxelsize)
+
+    def __len__ (self) :
+        return self.shape[0]
+
+    def __repr__ (self) :
+        return "LazySpatialImage(shape=%s, dtype=%s)" % (self.shape,self.dtype)
+
+    def __enter__ (self) :
+        return self
+
+    def __exit__ (self, *args) :
+        self.close()
+
+    def close (self) :
+        """Release the file and the cached chunks
+        """
+        self._cache.clear()
+        self._cache_nbytes = 0
+        if self._close is not None :
+            self._close()
+            self._close = None
+
+    def _chunk (self, cid) :
+        """Planes of the chunk cid, from the cache if possible
+        """
+        try :
+            data = self._cache.pop(cid)
+        except KeyError :
+            zmin = cid * self.chunk_depth
+            data = self._read_planes(zmin,min(zmin + self.chunk_depth,self.shape[2]) )
+            self._cache_nbytes += data.nbytes
+            while len(self._cache) > 0 and self._cache_nbytes > self.cache_size :
+                self._cache_nbytes -= self._cache.popitem(last = False)[1].nbytes
+        self._cache[cid] = data
+        return data
+
+    def planes (self, z_start, z_stop) :
+        """Read the z planes in [z_start,z_stop)
+
+        :Returns Type: |SpatialImage|
+        """
+        return self[:,:,z_start:z_stop]
+
+    def iter_chunks (self) :
+        """Iterate on the image by chunks of z planes
+
+        :Returns: iterator of (z_start,|SpatialImage|)
+        """
+        for zmin in xrange(0,self.shape[2],self.chunk_depth) :
+            yield zmin,self.planes(zmin,zmin + self.chunk_depth)
+
+    def _key (self, key) :
+        """Normalize an index as a tuple of int or slice, one per axis
+        """
+        if not isinstance(key,tuple) :
+            key = (key,)
+        if Ellipsis in key :
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1:]
+        if len(key) > self.ndim :
+            raise IndexError("too many indices")
+        key += (slice(None),) * (self.ndim - len(key) )
+        for k in key :
+            if not isinstance(k,(slice,int,long,np.integer) ) :
+                raise IndexError("only integers and slices are valid indices")
+        return key
+
+    def __getitem__ (self, key) :
+        """Read a region of the image
+
+        :Returns: a |SpatialImage| if no axis is removed by the index,
+                  an array or a scalar else
+        """
+        key = self._key(key)
+        nz = self.shape[2]
+        if isinstance(key[2],slice) :
+            zs = range(nz)[key[2]]
+        else :
+            z = int(key[2])
+            if not -nz <= z < nz :
+                raise IndexError("index %d is out of bounds for axis 2 with size %d" % (z,nz) )
+            zs = [z % nz]
+
+        parts = []
+        for cid,group in groupby(zs,lambda z : z // self.chunk_depth) :
+            local = [z - cid * self.chunk_depth for z in group]
+            data = self._chunk(cid)
+            if local == range(local[0],local[-1] + 1) :
+                parts.append(data[:,:,local[0]:local[-1] + 1])
+            else :
+                parts.append(data[:,:,local])
+        if len(parts) == 0 :
+            planes = np.empty(self.shape[:2] + (0,) + self.shape[3:],self.dtype)
+        elif len(parts) == 1 :
+            planes = parts[0]
+        else :
+            planes = np.concatenate(parts,axis = 2)
+
+        sub = key[:2] + ( (slice(None),) if isinstance(key[2],slice) else (0,) ) + key[3:]
+        res = planes[sub]
+        if np.ndim(res) == self.ndim :
+            #copy to free the chunks
+            return SpatialImage(np.array(res,order = "F"),self.voxelsize,self.vdim,self.info)
+        return res if np.ndim(res) == 0 else np.array(res)
+
+    def __array__ (self, dtype = None) :
+        data = np.empty(self.shape,self.dtype,order = "F")
+        for zmin in xrange(0,self.shape[2],self.chunk_depth) :
+            data[:,:,zmin:zmin + self.chunk_depth] = self._chunk(zmin // self.chunk_depth)
+        if dtype is not None :
+            data = data.astype(dtype)
+        return data
+
+    def load (self) :
+        """Read the whole image in memory
+
+        :Returns Type: |SpatialImage|
+        """
+        return SpatialImage(np.asarray(self),self.voxelsize,self.vdim,self.info)
+
+
 def empty_image_like(spatial_image):
     array = np.zeros( spatial_image.shape, dtype=spatial_image.dtype )
     return SpatialImage(array, spatial_image.voxelsize, vdim=1)
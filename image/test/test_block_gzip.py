@@ -0,0 +1,60 @@
+import gzip
+import os
+import numpy
+from openalea.image.serial.block_gzip import BlockGzipFile
+
+
+def random_datas(nb):
+    return numpy.random.RandomState(0).randint(0, 16, nb).astype(numpy.uint8).tostring()
+
+
+def test_write_read():
+    """Tests that block gzip files are read back and readable by gzip."""
+    datas = random_datas(10000)
+    f = "test_block.gz"
+    for nb_threads in (1, 3):
+        out = BlockGzipFile(f, "wb", block_size=1000, nb_threads=nb_threads)
+        out.write(datas[:1500])
+        out.write(numpy.frombuffer(datas[1500:], numpy.uint8))
+        assert out.tell() == len(datas)
+        out.close()
+
+        assert gzip.open(f).read() == datas
+        inp = BlockGzipFile(f, nb_threads=nb_threads)
+        assert inp.read(10) == datas[:10]
+        assert inp.read(2000) == datas[10:2010]
+        assert inp.read() == datas[2010:]
+        assert inp.read(10) == ""
+        inp.close()
+    os.remove(f)
+
+    #empty file
+    BlockGzipFile(f, "wb").close()
+    assert gzip.open(f).read() == ""
+    assert BlockGzipFile(f).read() == ""
+    os.remove(f)
+
+
+def test_skip():
+    """Tests skipping datas, with or without the block index."""
+    datas = random_datas(10000)
+    f = "test_block.gz"
+    out = BlockGzipFile(f, "wb", block_size=1000)
+    out.write(datas)
+    out.close()
+    ref = gzip.open("test_gzip.gz", "wb")
+    ref.write(datas)
+    ref.close()
+    for name in (f, "test_gzip.gz"):
+        inp = BlockGzipFile(name)
+        assert inp.skip(500) == 500
+        assert inp.read(10) == datas[500:510]
+        assert inp.skip(3490) == 3490
+        assert inp.read(100) == datas[4000:4100]
+        assert inp.skip(2900) == 2900
+        assert inp.tell() == 7000
+        assert inp.read() == datas[7000:]
+        assert inp.skip(10) == 0
+        inp.close()
+    os.remove(f)
+    os.remove("test_gzip.gz")
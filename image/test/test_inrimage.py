@@ -43,3 +43,42 @@ def test_read_write_read():
 
 
 
+
+
+def test_read_roi():
+    """Tests reading a region of interest of zipped and uncompressed images,
+    memory mapped or not."""
+    img = SpatialImage(numpy.arange(13*11*7, dtype=numpy.uint16).reshape(13,11,7),
+                       voxelsize=(0.5,0.5,2.))
+    field = random_vector_field_like(SpatialImage(numpy.zeros((6,5,4))), 4.0, 20)
+    for im in (img, field):
+        for f in ("test_inri_roi.inr", "test_inri_roi.inr.gz"):
+            write_inrimage(f, im)
+            for mmap in (True, False):
+                read_im = read_inrimage(f, mmap=mmap)
+                assert read_im.flags.f_contiguous
+                numpy.testing.assert_array_equal(im, read_im)
+                for roi in [(slice(2,5), slice(None), slice(1,3)),
+                            (slice(None,None,2),),
+                            (slice(None), slice(None), slice(-2,None)),
+                            (slice(None,None,-1), slice(None), slice(None,None,-1)),
+                            (slice(4,1,-1), slice(None,None,-2), slice(3,0,-2))]:
+                    numpy.testing.assert_array_equal(im[roi], read_inrimage(f, roi=roi, mmap=mmap))
+                numpy.testing.assert_array_equal(im[:,:,1:3], read_inrimage(f, z_range=(1,3), mmap=mmap))
+            os.remove(f)
+
+
+def test_read_mmap():
+    """Tests that uncompressed images are memory mapped, copy on write."""
+    img = SpatialImage(numpy.arange(13*11*7, dtype=numpy.uint16).reshape(13,11,7))
+    f = "test_inri_mmap.inr"
+    write_inrimage(f, img)
+    read_im = read_inrimage(f, z_range=(2,4))
+    base = read_im
+    while base is not None and not isinstance(base, numpy.memmap):
+        base = base.base
+    assert base is not None
+    read_im[0,0,0] = 1
+    assert read_inrimage(f)[0,0,2] == img[0,0,2]
+    del read_im, base
+    os.remove(f)
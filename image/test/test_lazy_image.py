@@ -0,0 +1,65 @@
+import os
+import numpy
+from openalea.image.spatial_image import SpatialImage, LazySpatialImage
+from openalea.image.serial.inrimage import open_inrimage, write_inrimage
+
+
+def lazy_image(data, **kwds):
+    """Lazy image on an array, counting the reads of planes."""
+    reads = []
+    def read_planes(z_start, z_stop):
+        reads.append((z_start, z_stop))
+        return numpy.array(data[:, :, z_start:z_stop], order="F")
+    return LazySpatialImage(data.shape, data.dtype, read_planes, (0.5, 0.5, 2.), **kwds), reads
+
+
+def test_slicing():
+    data = numpy.arange(6*5*10).reshape(6, 5, 10)
+    img, reads = lazy_image(data, chunk_depth=3)
+    assert img.shape == data.shape and img.ndim == 3 and img.dtype == data.dtype
+    sub = img[1:4, :, 2:5]
+    assert isinstance(sub, SpatialImage)
+    assert sub.voxelsize == (0.5, 0.5, 2.)
+    numpy.testing.assert_array_equal(sub, data[1:4, :, 2:5])
+    assert reads == [(0, 3), (3, 6)]
+    for key in [(slice(None), slice(None), slice(None, None, 4)), (2, 3, 9), (Ellipsis, 7),
+                (slice(None), 1), (slice(-3, None), slice(None), slice(8, 1, -2)),
+                (slice(None), slice(None), slice(5, 5))]:
+        numpy.testing.assert_array_equal(img[key], data[key])
+    numpy.testing.assert_array_equal(numpy.asarray(img), data)
+    numpy.testing.assert_array_equal(img.load(), data)
+    assert [zmin for zmin, planes in img.iter_chunks()] == [0, 3, 6, 9]
+
+
+def test_cache():
+    data = numpy.zeros((10, 10, 8), numpy.uint8)
+    img, reads = lazy_image(data, chunk_depth=2, cache_size=2 * data[:, :, :2].nbytes)
+    img[:, :, 0]
+    img[:, :, 3]
+    img[:, :, 1]
+    assert reads == [(0, 2), (2, 4)]
+    #least recently used chunk is (2,4)
+    img[:, :, 5]
+    img[:, :, 0]
+    assert reads == [(0, 2), (2, 4), (4, 6)]
+    img[:, :, 2]
+    assert reads == [(0, 2), (2, 4), (4, 6), (2, 4)]
+    assert img._cache_nbytes <= img.cache_size
+
+
+def test_open_inrimage():
+    img = SpatialImage(numpy.arange(13*11*7, dtype=numpy.uint16).reshape(13, 11, 7),
+                       voxelsize=(0.5, 0.5, 2.))
+    field = SpatialImage(numpy.random.uniform(-1, 1, (6, 5, 4, 3)).astype(numpy.float32),
+                         voxelsize=(1., 1., 1.), vdim=3)
+    for im in (img, field):
+        for f in ("test_lazy.inr", "test_lazy.inr.gz"):
+            write_inrimage(f, im)
+            lazy = open_inrimage(f, chunk_depth=2)
+            assert lazy.shape == im.shape and lazy.vdim == im.vdim
+            assert lazy.voxelsize == im.voxelsize
+            numpy.testing.assert_array_equal(lazy[:, :, 3], im[:, :, 3])
+            numpy.testing.assert_array_equal(lazy[:, 2:4, 1:3], im[:, 2:4, 1:3])
+            numpy.testing.assert_array_equal(numpy.asarray(lazy), im)
+            lazy.close()
+            os.remove(f)
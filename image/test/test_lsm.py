@@ -0,0 +1,57 @@
+import os
+from struct import pack
+import numpy
+from openalea.image.serial.lsm import open_lsm, _fix_lsm_offsets
+from test_tif import write_pages, stack
+
+
+def cz_lsminfo(voxelsize):
+    """CZ LSM info structure with the voxel sizes (in meters) set."""
+    raw = pack("<10i3d", *([0] * 10 + [v * 1e-6 for v in voxelsize]))
+    return [ord(c) for c in raw + "\0" * (224 - len(raw))]
+
+
+def test_open_lsm():
+    data = stack((4, 5, 6, 2), numpy.uint8)  # z, y, x, channel
+    f = "test_lsm.lsm"
+    write_pages(f, data, thumbnail=True,
+                extra_tags=[(34412, 1, cz_lsminfo((0.25, 0.5, 2.)))])
+    img = open_lsm(f, chunk_depth=2)
+    assert img.shape == (6, 5, 4) and img.dtype == numpy.uint8
+    assert img.voxelsize == (0.25, 0.5, 2.)
+    assert img.info["PIXSIZE"] == "8"
+    numpy.testing.assert_array_equal(img[:, :, 1:3], data[1:3, ..., 0].transpose(2, 1, 0))
+    numpy.testing.assert_array_equal(open_lsm(f, channel=1)[:, :, :],
+                                     data[..., 1].transpose(2, 1, 0))
+    try:
+        open_lsm(f, channel=2)
+        assert False
+    except UserWarning:
+        pass
+    del img
+    os.remove(f)
+
+
+def test_open_not_lsm():
+    f = "test_lsm.tif"
+    write_pages(f, stack((2, 3, 4)))
+    try:
+        open_lsm(f)
+        assert False
+    except UserWarning:
+        pass
+    os.remove(f)
+
+
+def test_lsm_offsets_above_4gb():
+    class Page(object):
+        def __init__(self, offsets):
+            self.offsets = numpy.array(offsets, numpy.int64)
+
+    class Tif(object):
+        pages = [Page([2**32 - 20, 2**32 - 10]), Page([5, 15]), Page([2**32 - 1, 3])]
+
+    tif = Tif()
+    _fix_lsm_offsets(tif)
+    assert list(tif.pages[1].offsets) == [2**32 + 5, 2**32 + 15]
+    assert list(tif.pages[2].offsets) == [2**33 - 1, 2**33 + 3]
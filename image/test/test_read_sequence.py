@@ -19,7 +19,12 @@ Test image : reading
 __license__= "Cecill-C"
 __revision__ = " $Id:  $ "
 
-from openalea.image.all import read_sequence
+import os
+import shutil
+from tempfile import mkdtemp
+import numpy as np
+from openalea.image.pil import Image
+from openalea.image.all import read_sequence, iter_sequence
 
 def test_read_sequence():
     """
@@ -68,3 +73,37 @@ def test_read_sequence():
     # Test of read_sequence with "number_images", "start" and "increment" parameters
     res = read_sequence(directory, number_images=10, start=5, increment=2, verbose=verbose)
     assert res.shape == (460, 460, 10)
+
+
+def test_iter_sequence():
+    """
+    Test of iter_sequence function
+    """
+    directory = "../share/data/p60-tiff/"
+    res = read_sequence(directory, verbose=False)
+    frames = list(iter_sequence(directory, start=3, increment=5, nb_threads=2))
+    assert len(frames) == 12
+    for i, frame in enumerate(frames):
+        assert frame.dtype == res.dtype
+        assert (frame == res[:,:,3 + 5 * i]).all()
+
+
+def test_sequence_orientation():
+    """
+    Volumes and frames are indexed (x, y, z) on non square images
+    """
+    directory = mkdtemp()
+    try:
+        frames = [np.arange(12, dtype=np.uint8).reshape(3, 4) + 20 * k for k in range(2)]
+        for k, frame in enumerate(frames):
+            Image.fromarray(frame).save(os.path.join(directory, "frame%d.png" % k))
+        res = read_sequence(directory, verbose=False)
+        assert res.shape == (4, 3, 2)
+        # column 1, row 0 of the second image
+        assert res[1, 0, 1] == frames[1][0, 1]
+        for k, frame in enumerate(iter_sequence(directory)):
+            assert frame.shape == (4, 3)
+            assert frame[1, 0] == frames[k][0, 1]
+            assert (frame == res[:,:,k]).all()
+    finally:
+        shutil.rmtree(directory)
@@ -20,8 +20,9 @@ Test frame manipulator
 __license__= "Cecill-C"
 __revision__ = " $Id: __init__.py 2245 2010-02-08 17:11:34Z cokelaer $ "
 
-from numpy import array
-from openalea.image.all import save,load,SpatialImage,rainbow
+import os
+from numpy import array, save as np_save
+from openalea.image.all import save,load,open_npy,SpatialImage,rainbow
 
 
 def test_numpy_serialiser():
@@ -54,3 +55,15 @@ def test_numpy_serialiser():
     assert hasattr(rsp,"info")
 
 
+def test_open_npy():
+    data = array(range(24)).reshape( (2,3,4) )
+    sp = SpatialImage(data,(0.5,0.6,0.7) )
+    save("00_lazy",sp)
+    np_save("00_lazy_raw.npy",data)
+    for name in ("00_lazy.npy","00_lazy_raw.npy"):
+        lazy = open_npy(name,chunk_depth = 3)
+        assert lazy.shape == data.shape
+        assert (lazy[:,:,1:] == data[:,:,1:]).all()
+        assert (lazy[1,:,3] == data[1,:,3]).all()
+        lazy.close()
+        os.remove(name)
@@ -0,0 +1,218 @@
+import os
+import zlib
+from struct import pack
+import numpy
+from openalea.image.serial.tif import read_tif, open_tif
+
+
+def packbits(data):
+    """Trivial PackBits encoding, literal runs only."""
+    out = ""
+    for i in range(0, len(data), 128):
+        chunk = data[i:i+128]
+        out += chr(len(chunk) - 1) + chunk
+    return out
+
+
+def write_pages(filename, pages, byteorder="<", compression=1, predictor=1,
+                rows_per_strip=None, tile=None, description=None, resolution=(2, 1),
+                thumbnail=False, extra_tags=()):
+    """Write (length, width[, samples]) pages in a tif, datas of all the pages
+    first (contiguous if uncompressed), then the IFDs. If thumbnail, the first
+    IFD is a JPEG compressed thumbnail (NewSubfileType 1) with dummy datas.
+    extra_tags are (tag, type, values) entries added to the IFDs of the pages."""
+    bo = byteorder
+    f = open(filename, "wb")
+    f.write(("II" if bo == "<" else "MM") + pack(bo + "HI", 42, 0))
+    layouts = []
+    if thumbnail:
+        offsets = [f.tell()]
+        f.write("\xff\xd8\xff\xd9")
+        layouts.append((numpy.zeros((2, 2, 1), numpy.uint8), offsets, [4]))
+    for page in pages:
+        page = page.astype(page.dtype.newbyteorder(bo))
+        length, width = page.shape[:2]
+        samples = page.shape[2] if page.ndim == 3 else 1
+        page = page.reshape(length, width, samples)
+        if tile is None:
+            rows = rows_per_strip or length
+            blocks = [page[r:r+rows] for r in range(0, length, rows)]
+        else:
+            tl, tw = tile
+            blocks = []
+            for r in range(0, length, tl):
+                for c in range(0, width, tw):
+                    block = numpy.zeros((tl, tw, samples), page.dtype)
+                    part = page[r:r+tl, c:c+tw]
+                    block[:part.shape[0], :part.shape[1]] = part
+                    blocks.append(block)
+        offsets, counts = [], []
+        for block in blocks:
+            if predictor == 2:
+                block = block.copy()
+                block[:, 1:] = numpy.diff(block, axis=1)
+            raw = block.tostring()
+            if compression == 8:
+                raw = zlib.compress(raw)
+            elif compression == 32773:
+                raw = packbits(raw)
+            offsets.append(f.tell())
+            counts.append(len(raw))
+            f.write(raw)
+        layouts.append((page, offsets, counts))
+    if f.tell() % 2:
+        f.write("\0")
+
+    #position of the offset of the next IFD
+    next_field = 4
+    for i, (page, offsets, counts) in enumerate(layouts):
+        length, width, samples = page.shape
+        rows = rows_per_strip or length
+        entries = [(256, 4, [width]), (257, 4, [length]),
+                   (258, 3, [page.dtype.itemsize * 8] * samples),
+                   (259, 3, [compression]), (277, 3, [samples]),
+                   (282, 5, list(resolution)), (283, 5, list(resolution)),
+                   (317, 3, [predictor]),
+                   (339, 3, [{"u": 1, "i": 2, "f": 3}[page.dtype.kind]] * samples)]
+        if thumbnail and i == 0:
+            entries = [(254, 4, [1]), (256, 4, [2]), (257, 4, [2]), (258, 3, [8]), (259, 3, [7]),
+                       (273, 4, offsets), (277, 3, [1]), (278, 4, [2]), (279, 4, counts)]
+        elif tile is None:
+            entries += [(273, 4, offsets), (278, 4, [rows]), (279, 4, counts)]
+        else:
+            entries += [(322, 3, [tile[1]]), (323, 3, [tile[0]]), (324, 4, offsets), (325, 4, counts)]
+        if not (thumbnail and i == 0):
+            entries += list(extra_tags)
+            if description is not None:
+                entries.append((270, 2, description + "\0"))
+        entries.sort()
+        extra = ""
+        ifd_offset = f.tell()
+        extra_offset = ifd_offset + 2 + 12 * len(entries) + 4
+        records = ""
+        for tag, typ, values in entries:
+            if typ == 2:
+                raw = values
+                count = len(values)
+            else:
+                fmt = {1: "B", 3: "H", 4: "I", 5: "I"}[typ]
+                raw = pack(bo + fmt * len(values), *values)
+                count = len(values) // 2 if typ == 5 else len(values)
+            if len(raw) <= 4:
+                field = raw + "\0" * (4 - len(raw))
+            else:
+                field = pack(bo + "I", extra_offset + len(extra))
+                extra += raw + "\0" * (len(raw) % 2)
+            records += pack(bo + "HHI", tag, typ, count) + field
+        f.write(pack(bo + "H", len(entries)) + records + pack(bo + "I", 0) + extra)
+        end = f.tell()
+        f.seek(next_field)
+        f.write(pack(bo + "I", ifd_offset))
+        f.seek(end)
+        next_field = extra_offset - 4
+    f.close()
+
+
+def stack(shape, dtype=numpy.uint16):
+    return (numpy.arange(numpy.prod(shape)) % 1000).astype(dtype).reshape(shape)
+
+
+def test_read_uncompressed():
+    data = stack((5, 7, 9))  # z, y, x
+    f = "test_tif_raw.tif"
+    write_pages(f, data, description="spacing=2.5\nunit=micron")
+    img = read_tif(f)
+    assert img.shape == (9, 7, 5)
+    numpy.testing.assert_array_equal(img, data.transpose(2, 1, 0))
+    assert img.voxelsize == (0.5, 0.5, 2.5)
+    assert img.info["unit"] == "micron"
+    base = img
+    while base is not None and not isinstance(base, numpy.memmap):
+        base = base.base
+    assert base is not None
+    numpy.testing.assert_array_equal(read_tif(f, z_range=(1, 3)), data[1:3].transpose(2, 1, 0))
+    numpy.testing.assert_array_equal(read_tif(f, mmap=False), data.transpose(2, 1, 0))
+    #copy on write
+    img[0, 0, 0] = 999
+    assert read_tif(f)[0, 0, 0] == data[0, 0, 0]
+    os.remove(f)
+
+
+def test_read_compressed():
+    data = stack((6, 10, 11), numpy.int32)
+    f = "test_tif_zip.tif"
+    for options in [dict(compression=8, rows_per_strip=3),
+                    dict(compression=8, predictor=2, byteorder=">", rows_per_strip=4),
+                    dict(compression=32773),
+                    dict(compression=8, tile=(16, 16))]:
+        write_pages(f, data, **options)
+        for nb_threads in (1, 3):
+            img = read_tif(f, nb_threads=nb_threads)
+            numpy.testing.assert_array_equal(img, data.transpose(2, 1, 0))
+        numpy.testing.assert_array_equal(read_tif(f, z_range=(4, None)), data[4:].transpose(2, 1, 0))
+        os.remove(f)
+
+
+def test_read_rgb():
+    data = stack((3, 4, 5, 3), numpy.uint8)
+    f = "test_tif_rgb.tif"
+    write_pages(f, data)
+    img = read_tif(f)
+    assert img.shape == (5, 4, 3, 3) and img.vdim == 3
+    numpy.testing.assert_array_equal(img, data.transpose(2, 1, 0, 3))
+    os.remove(f)
+
+
+def test_read_thumbnail():
+    data = stack((4, 6, 5))
+    f = "test_tif_thumbnail.tif"
+    write_pages(f, data, thumbnail=True)
+    img = read_tif(f)
+    assert img.shape == (5, 6, 4)
+    numpy.testing.assert_array_equal(img, data.transpose(2, 1, 0))
+    os.remove(f)
+
+
+def test_libtiff_fallback():
+    from openalea.image.serial import tif
+    data = stack((3, 4, 5), numpy.uint8)
+    f = "test_tif_jpeg.tif"
+    # JPEG pages are not decoded by the pure python reader
+    write_pages(f, data, compression=7)
+    if tif.libtiff is None:
+        try:
+            read_tif(f)
+            assert False
+        except UserWarning:
+            pass
+    # pages it does not decode are read by libtiff
+    calls = []
+
+    def read_tif_libtiff(filename):
+        calls.append(filename)
+        return data.transpose(2, 1, 0), (0.5, 0.5, 2.), {"Filename": filename}
+    libtiff, tif.libtiff = tif.libtiff, tif.libtiff or object()
+    read_libtiff, tif._read_tif_libtiff = tif._read_tif_libtiff, read_tif_libtiff
+    try:
+        img = read_tif(f, z_range=(1, 3))
+        numpy.testing.assert_array_equal(img, data[1:3].transpose(2, 1, 0))
+        assert img.voxelsize == (0.5, 0.5, 2.)
+        lazy = open_tif(f)
+        assert lazy.shape == (5, 4, 3)
+        numpy.testing.assert_array_equal(lazy[:, :, 2], data[2].T)
+        assert calls == [f, f]
+    finally:
+        tif.libtiff, tif._read_tif_libtiff = libtiff, read_libtiff
+    os.remove(f)
+
+
+def test_open_tif():
+    data = stack((6, 10, 11))
+    f = "test_tif_lazy.tif"
+    write_pages(f, data, compression=8, rows_per_strip=4)
+    lazy = open_tif(f, chunk_depth=2)
+    assert lazy.shape == (11, 10, 6)
+    numpy.testing.assert_array_equal(lazy[:, 2:5, 3], data[3, 2:5, :].T)
+    numpy.testing.assert_array_equal(numpy.asarray(lazy), data.transpose(2, 1, 0))
+    lazy.close()
+    os.remove(f)